@@ -0,0 +1,3 @@
+"""
+Benchmarks offline executados sobre o banco local
+"""
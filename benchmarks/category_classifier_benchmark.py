@@ -0,0 +1,110 @@
+"""
+Benchmark offline do classificador de categorias sobre o banco existente
+
+Uso: python -m benchmarks.category_classifier_benchmark [--folds 5]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import List, Tuple
+
+from sqlalchemy import select
+
+from database.sqlite_db import get_db_session
+from database.models import Transaction
+from services.category_classifier import NaiveBayesCategoryClassifier
+from services.local_parser import LocalTransactionParser
+
+
+async def load_examples() -> List[Tuple[str, str, str]]:
+    """Transações processadas como (descrição, mensagem original, categoria)"""
+    async for db in get_db_session():
+        result = await db.execute(
+            select(Transaction.descricao, Transaction.original_message, Transaction.categoria)
+            .where(Transaction.status == "processed")
+        )
+        return list(result.tuples())
+    return []
+
+
+def cross_validate(examples: List[Tuple[str, str, str]], folds: int) -> dict:
+    """Validação cruzada em k partes: acurácia, cobertura e vazão de previsão"""
+    # mesmo texto usado pelo bot ao aprender
+    shuffled = [(f"{descricao} {original_message}", categoria) for descricao, original_message, categoria in examples]
+    random.Random(42).shuffle(shuffled)
+
+    correct = predicted = total = 0
+    predict_seconds = 0.0
+
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        train = [example for index, example in enumerate(shuffled) if index % folds != fold]
+
+        classifier = NaiveBayesCategoryClassifier(model_path="/dev/null")
+        for text, categoria in train:
+            classifier.learn(text, categoria)
+
+        started_at = time.perf_counter()
+        predictions = [classifier.predict(text) for text, _ in test]
+        predict_seconds += time.perf_counter() - started_at
+
+        for prediction, (_, categoria) in zip(predictions, test):
+            total += 1
+            if prediction:
+                predicted += 1
+                correct += prediction[0].value == categoria
+
+    return {
+        "examples": total,
+        "coverage": predicted / total if total else 0.0,
+        "accuracy": correct / predicted if predicted else 0.0,
+        "predictions_per_second": total / predict_seconds if predict_seconds else 0.0,
+        "microseconds_per_prediction": predict_seconds / total * 1_000_000 if total else 0.0
+    }
+
+
+def lexicon_baseline(examples: List[Tuple[str, str, str]]) -> dict:
+    """Acurácia do parser local só com léxico, sobre as mensagens originais"""
+    parser = LocalTransactionParser()
+    correct = resolved = 0
+    for _, original_message, categoria in examples:
+        result = parser.parse(original_message)
+        if result and result.categoria.value != "Outros":
+            resolved += 1
+            correct += result.categoria.value == categoria
+    return {
+        "coverage": resolved / len(examples) if examples else 0.0,
+        "accuracy": correct / resolved if resolved else 0.0
+    }
+
+
+async def main():
+    arguments = argparse.ArgumentParser(description=__doc__)
+    arguments.add_argument("--folds", type=int, default=5)
+    options = arguments.parse_args()
+
+    examples = await load_examples()
+    if len(examples) < options.folds:
+        print(f"Poucas transações para avaliar ({len(examples)})")
+        return
+
+    print(f"Transações: {len(examples)}")
+    print(f"Distribuição: {dict(Counter(categoria for _, _, categoria in examples))}")
+
+    result = cross_validate(examples, options.folds)
+    print(
+        f"Naive Bayes ({options.folds} folds): acurácia {result['accuracy']:.1%}, "
+        f"cobertura {result['coverage']:.1%}, "
+        f"{result['predictions_per_second']:,.0f} previsões/s "
+        f"({result['microseconds_per_prediction']:.1f} µs cada)"
+    )
+
+    baseline = lexicon_baseline(examples)
+    print(f"Léxico do parser local: acurácia {baseline['accuracy']:.1%}, cobertura {baseline['coverage']:.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
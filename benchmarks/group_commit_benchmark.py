@@ -0,0 +1,97 @@
+"""
+Benchmark da escrita agrupada de transações
+
+Compara, para rajadas de tamanhos crescentes, o caminho anterior (commit da
+inclusão, refresh e nova sessão para a atualização da planilha) com o
+TransactionWriter, sobre um banco em arquivo temporário.
+
+Uso: python -m benchmarks.group_commit_benchmark [--bursts 1,8,32,128] [--profile performance]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date, datetime
+from typing import List
+from unittest.mock import patch
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.models import Base, Transaction
+from database.sqlite_db import create_engines, resolve_pragmas
+from services.transaction_writer import TransactionWriter
+
+
+def values(message_id: int) -> dict:
+    return dict(
+        original_message="gasto sintetico", user_id=1, message_id=message_id, chat_id=1,
+        descricao="Sintético", valor=10, categoria="Outros", data_transacao=date(2025, 6, 1), status="processed"
+    )
+
+
+async def separate_commits(session_factory, message_id: int):
+    """Caminho anterior: duas sessões e dois commits por mensagem"""
+    async with session_factory() as db:
+        transaction = Transaction(**values(message_id))
+        db.add(transaction)
+        await db.commit()
+        await db.refresh(transaction)
+    async with session_factory() as db:
+        transaction = await db.get(Transaction, transaction.id)
+        transaction.sheets_row_number = message_id
+        transaction.sheets_updated_at = datetime.now()
+        await db.commit()
+
+
+async def grouped(writer: TransactionWriter, message_id: int):
+    saved = await writer.insert(**values(message_id))
+    await writer.update(saved.id, sheets_row_number=message_id, sheets_updated_at=datetime.now())
+
+
+async def run(bursts: List[int], profile: str) -> List[dict]:
+    results = []
+    for burst in bursts:
+        for variant in ("commits separados", "commit em grupo"):
+            with tempfile.TemporaryDirectory() as directory:
+                sync, async_ = create_engines(f"sqlite:///{os.path.join(directory, 'benchmark.db')}", resolve_pragmas(profile))
+                Base.metadata.create_all(sync)
+                session_factory = async_sessionmaker(async_, class_=AsyncSession, expire_on_commit=False)
+
+                async def get_session():
+                    async with session_factory() as session:
+                        yield session
+
+                writer = TransactionWriter()
+                with patch("services.transaction_writer.get_db_session", get_session):
+                    started_at = time.perf_counter()
+                    if variant == "commit em grupo":
+                        await asyncio.gather(*(grouped(writer, index) for index in range(burst)))
+                    else:
+                        await asyncio.gather(*(separate_commits(session_factory, index) for index in range(burst)))
+                    elapsed = time.perf_counter() - started_at
+                    await writer.stop()
+
+                await async_.dispose()
+                sync.dispose()
+
+            results.append({"rajada": burst, "variante": variant, "mensagens_por_s": burst / elapsed, "lotes": writer.batches})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão de escrita por tamanho de rajada")
+    parser.add_argument("--bursts", default="1,8,32,128")
+    parser.add_argument("--profile", default="performance")
+    args = parser.parse_args()
+
+    bursts = [int(value) for value in args.bursts.split(",")]
+    print(f"📊 Inclusão + atualização da planilha por mensagem, perfil '{args.profile}'\n")
+    for result in asyncio.run(run(bursts, args.profile)):
+        batches = f"{result['lotes']} lotes" if result["lotes"] else ""
+        print(f"rajada {result['rajada']:<5} {result['variante']:<18} {result['mensagens_por_s']:9.1f} mensagens/s  {batches}")
+
+
+if __name__ == "__main__":
+    main()
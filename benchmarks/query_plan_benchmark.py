@@ -0,0 +1,145 @@
+"""
+Benchmark dos planos de consulta dos relatórios por período
+
+Compara os filtros antigos com extract() e os intervalos semiabertos, com e sem o
+índice composto de transactions, sobre um banco sintético em arquivo temporário.
+
+Uso: python -m benchmarks.query_plan_benchmark [--rows 50000] [--repeat 20]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import and_, create_engine, extract, func, select
+
+from database.models import Base, Transaction
+from services.database_service import DatabaseService
+
+
+CATEGORIES = ["Alimentação", "Transporte", "Saúde", "Lazer", "Casa", "Finanças", "Outros"]
+
+INDEX_NAME = "ix_transactions_status_date"
+
+
+def populate(engine, rows: int):
+    """Inserir transações sintéticas espalhadas por cinco anos"""
+    generator = random.Random(42)
+    first_day = date(2021, 1, 1)
+    batch = []
+    for index in range(rows):
+        batch.append({
+            "original_message": "gasto sintetico",
+            "user_id": 1,
+            "message_id": index,
+            "chat_id": 1,
+            "descricao": "Sintético",
+            "valor": round(generator.uniform(1, 500), 2),
+            "categoria": generator.choice(CATEGORIES),
+            "data_transacao": first_day + timedelta(days=generator.randrange(5 * 365)),
+            "status": "processed" if generator.random() < 0.95 else "error"
+        })
+
+    with engine.begin() as connection:
+        connection.execute(Transaction.__table__.insert(), batch)
+
+
+def legacy_conditions(year: int, month: int = None) -> list:
+    """Filtros anteriores, com extract() sobre a coluna de data"""
+    conditions = [extract("year", Transaction.data_transacao) == year, Transaction.status == "processed"]
+    if month is not None:
+        conditions.insert(0, extract("month", Transaction.data_transacao) == month)
+    return conditions
+
+
+def range_conditions(year: int, month: int = None) -> list:
+    """Filtros atuais do DatabaseService"""
+    return DatabaseService._range_conditions(*DatabaseService._date_range(year, month))
+
+
+def report_queries(conditions) -> Dict[str, object]:
+    """Consultas equivalentes às do DatabaseService"""
+    by_category = [
+        Transaction.categoria,
+        func.sum(Transaction.valor),
+        func.count(Transaction.id)
+    ]
+    return {
+        "resumo mensal": select(*by_category).where(and_(*conditions(2024, 10))).group_by(Transaction.categoria),
+        "resumo anual": select(*by_category).where(and_(*conditions(2024))).group_by(Transaction.categoria),
+        "análise por categoria": (
+            select(Transaction.categoria, func.avg(Transaction.valor), func.max(Transaction.valor), func.min(Transaction.valor))
+            .where(and_(*conditions(2024)))
+            .group_by(Transaction.categoria)
+        ),
+        "estatísticas": select(func.min(Transaction.data_transacao), func.max(Transaction.data_transacao))
+        .where(Transaction.status == "processed")
+    }
+
+
+def query_plan(connection, statement) -> str:
+    """Plano do SQLite para a consulta"""
+    compiled = statement.compile(dialect=connection.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [value.isoformat() if isinstance(value, date) else value for value in params]
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params)).fetchall()
+    return " | ".join(row[-1] for row in rows)
+
+
+def measure(connection, statement, repeat: int) -> float:
+    """Tempo médio de execução em milissegundos"""
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        connection.execute(statement).fetchall()
+    return (time.perf_counter() - started_at) / repeat * 1000
+
+
+def run(rows: int, repeat: int) -> List[dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'benchmark.db')}")
+        Base.metadata.create_all(engine)
+        populate(engine, rows)
+
+        for indexed in (False, True):
+            index = next(index for index in Transaction.__table__.indexes if index.name == INDEX_NAME)
+            with engine.begin() as connection:
+                if indexed:
+                    index.create(connection, checkfirst=True)
+                else:
+                    index.drop(connection, checkfirst=True)
+                connection.exec_driver_sql("ANALYZE")
+
+            with engine.connect() as connection:
+                for variant, conditions in (("extract", legacy_conditions), ("intervalo", range_conditions)):
+                    for name, statement in report_queries(conditions).items():
+                        results.append({
+                            "consulta": name,
+                            "filtro": variant,
+                            "indice": indexed,
+                            "ms": measure(connection, statement, repeat),
+                            "plano": query_plan(connection, statement)
+                        })
+
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Planos e tempos das consultas de relatório")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"📊 {args.rows} transações sintéticas, média de {args.repeat} execuções\n")
+    for result in run(args.rows, args.repeat):
+        index_label = "com índice" if result["indice"] else "sem índice"
+        print(f"{result['consulta']:<22} {result['filtro']:<10} {index_label:<11} {result['ms']:8.2f} ms  {result['plano']}")
+
+
+if __name__ == "__main__":
+    main()
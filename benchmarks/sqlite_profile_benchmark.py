@@ -0,0 +1,116 @@
+"""
+Benchmark dos perfis de pragmas do SQLite
+
+Para cada perfil, grava transações pelo ORM em tarefas concorrentes (um commit por
+transação, como o bot) enquanto outras tarefas geram o resumo mensal, sobre um
+banco em arquivo temporário.
+
+Uso: python -m benchmarks.sqlite_profile_benchmark [--inserts 2000] [--writers 4] [--readers 4]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database.models import Base, Transaction
+from database.sqlite_db import PRAGMA_PROFILES, create_engines, resolve_pragmas
+from services.database_service import DatabaseService
+
+
+CATEGORIES = ["Alimentação", "Transporte", "Saúde", "Lazer", "Casa", "Finanças", "Outros"]
+
+
+def monthly_report():
+    """Consulta equivalente ao resumo mensal do DatabaseService"""
+    conditions = DatabaseService._range_conditions(*DatabaseService._date_range(2025, 6))
+    return (
+        select(Transaction.categoria, func.sum(Transaction.valor), func.count(Transaction.id))
+        .where(and_(*conditions))
+        .group_by(Transaction.categoria)
+    )
+
+
+async def writer(session_factory, first_id: int, count: int, generator: random.Random):
+    for offset in range(count):
+        async with session_factory() as session:
+            session.add(Transaction(
+                original_message="gasto sintetico",
+                user_id=1,
+                message_id=first_id + offset,
+                chat_id=1,
+                descricao="Sintético",
+                valor=round(generator.uniform(1, 500), 2),
+                categoria=generator.choice(CATEGORIES),
+                data_transacao=date(2025, 1, 1) + timedelta(days=generator.randrange(365)),
+                status="processed"
+            ))
+            await session.commit()
+
+
+async def reader(session_factory, stop: asyncio.Event) -> int:
+    reports = 0
+    while not stop.is_set():
+        async with session_factory() as session:
+            (await session.execute(monthly_report())).all()
+        reports += 1
+        await asyncio.sleep(0)
+    return reports
+
+
+async def run_profile(profile: str, inserts: int, writers: int, readers: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        sync, async_ = create_engines(f"sqlite:///{os.path.join(directory, 'benchmark.db')}", resolve_pragmas(profile))
+        Base.metadata.create_all(sync)
+        session_factory = async_sessionmaker(async_, class_=AsyncSession, expire_on_commit=False)
+
+        generator = random.Random(42)
+        per_writer = inserts // writers
+        stop = asyncio.Event()
+        reader_tasks = [asyncio.create_task(reader(session_factory, stop)) for _ in range(readers)]
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(
+            writer(session_factory, index * per_writer, per_writer, generator) for index in range(writers)
+        ))
+        elapsed = time.perf_counter() - started_at
+        stop.set()
+        reports = sum(await asyncio.gather(*reader_tasks))
+
+        await async_.dispose()
+        sync.dispose()
+
+    return {
+        "inserts_por_s": per_writer * writers / elapsed,
+        "relatorios_por_s": reports / elapsed
+    }
+
+
+async def run(inserts: int, writers: int, readers: int) -> List[dict]:
+    results = []
+    for profile in PRAGMA_PROFILES:
+        results.append({"perfil": profile, **await run_profile(profile, inserts, writers, readers)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão de inserções e relatórios por perfil de pragmas")
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"📊 {args.inserts} inserções em {args.writers} tarefas, {args.readers} tarefas de relatório\n")
+    for result in asyncio.run(run(args.inserts, args.writers, args.readers)):
+        print(f"{result['perfil']:<12} {result['inserts_por_s']:9.1f} inserções/s  {result['relatorios_por_s']:9.1f} relatórios/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Controle de admissão e descarte de carga para updates do webhook
+"""
+
+import asyncio
+from typing import Dict, Any, Optional
+
+from loguru import logger
+
+from services.metrics_service import metrics_service
+
+
+class AdmissionController:
+    """Limita updates em voo e o tempo máximo de espera por uma vaga"""
+
+    POLICIES = ("retry", "defer")
+
+    def __init__(self, max_inflight: int = 16, max_queue_wait: float = 5.0, policy: str = "retry", max_deferred: int = 100):
+        if max_inflight < 1:
+            raise ValueError("max_inflight deve ser um inteiro positivo")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Política de descarte inválida: {policy} (use {' ou '.join(self.POLICIES)})")
+
+        self.max_inflight = max_inflight
+        self.max_queue_wait = max_queue_wait
+        self.policy = policy
+        self.max_deferred = max_deferred
+
+        self._semaphore = asyncio.Semaphore(max_inflight)
+        self._inflight = 0
+        self._waiting = 0
+        self._deferred_waiting = 0
+
+        self.admitted = 0
+        self.shed = 0
+        self.deferred = 0
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Aguardar vaga por até timeout segundos (padrão: max_queue_wait)
+
+        Retorna False quando a vaga não foi obtida a tempo e o update deve ser descartado.
+        """
+        if timeout is None:
+            timeout = self.max_queue_wait
+
+        self._waiting += 1
+        try:
+            if timeout <= 0 and self._semaphore.locked():
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(timeout, 0))
+        except asyncio.TimeoutError:
+            self.shed += 1
+            metrics_service.inc("admission_shed_total", policy=self.policy)
+            logger.warning(f"⚠️ Limite de admissão atingido ({self._inflight}/{self.max_inflight} em voo)")
+            return False
+        finally:
+            self._waiting -= 1
+
+        self._inflight += 1
+        self.admitted += 1
+        return True
+
+    def can_defer(self) -> bool:
+        """Verificar se ainda cabe um update adiado aguardando vaga"""
+        return self._deferred_waiting < self.max_deferred
+
+    async def acquire_deferred(self):
+        """Aguardar vaga sem prazo, para updates adiados"""
+        self.deferred += 1
+        self._waiting += 1
+        self._deferred_waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+            self._deferred_waiting -= 1
+
+        self._inflight += 1
+        self.admitted += 1
+
+    def release(self):
+        """Liberar vaga"""
+        self._inflight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado do controle de admissão"""
+        return {
+            "policy": self.policy,
+            "max_inflight": self.max_inflight,
+            "max_queue_wait_seconds": self.max_queue_wait,
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "deferred_waiting": self._deferred_waiting,
+            "max_deferred": self.max_deferred,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "deferred": self.deferred
+        }
@@ -0,0 +1,55 @@
+"""
+Mensagem do Telegram atualizada aos poucos enquanto a resposta da IA chega
+"""
+
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+from telegram.error import TelegramError
+
+
+class ProgressiveMessage:
+    """Edita uma mensagem já enviada com o texto parcial, respeitando um intervalo mínimo
+
+    Edições intermediárias são descartadas se chegarem antes do intervalo; o Telegram
+    limita a frequência de edições por chat e o texto final sempre é aplicado.
+    """
+
+    def __init__(self, message, render: Callable[[str], str], min_interval_seconds: float = 1.0):
+        self.message = message
+        self.render = render
+        self.min_interval_seconds = min_interval_seconds
+
+        self._last_edit = 0.0
+        self._last_text: Optional[str] = None
+        self.edits = 0
+
+    async def update(self, partial_text: str):
+        """Mostrar texto parcial se o intervalo desde a última edição já passou"""
+        if time.monotonic() - self._last_edit < self.min_interval_seconds:
+            return
+        await self._edit(self.render(partial_text) + " ▌")
+
+    async def finish(self, final_text: str) -> bool:
+        """Aplicar o texto final; retorna False se a edição falhou"""
+        return await self._edit(self.render(final_text))
+
+    async def replace(self, text: str) -> bool:
+        """Substituir o conteúdo por um texto pronto, sem o formato dos insights"""
+        return await self._edit(text)
+
+    async def _edit(self, text: str) -> bool:
+        if text == self._last_text:
+            return True
+
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(text)
+        except TelegramError as e:
+            logger.debug(f"Edição progressiva ignorada: {e}")
+            return False
+
+        self._last_text = text
+        self.edits += 1
+        return True
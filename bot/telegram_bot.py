@@ -2,8 +2,9 @@
 Bot principal do Telegram para processamento de mensagens financeiras
 """
 
+import asyncio
 from datetime import datetime
-from typing import Dict, Any
+from typing import AsyncContextManager, Callable, Dict, Any, Optional, Tuple
 
 from sqlalchemy import select
 from telegram import Update
@@ -11,12 +12,20 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters, C
 from loguru import logger
 
 from config.settings import get_settings
+from bot.update_dispatcher import ChatOrderedDispatcher
+from bot.update_filter import UpdateFilter, ALLOWED_UPDATES
+from bot.progressive_message import ProgressiveMessage
 from services.openai_service import openai_service
+from services.category_classifier import category_classifier
+from services.insights_cache_service import insights_cache_service
 from services.sheets_service import sheets_service
 from services.database_service import database_service
+from services.idempotency_service import idempotency_service
+from services.metrics_service import metrics_service
+from services.transaction_writer import transaction_writer
 from database.sqlite_db import get_db_session
 from database.models import Transaction, UserConfig
-from models.schemas import MessageInput, ProcessedTransaction, TransactionStatus, InterpretedTransaction
+from models.schemas import MessageInput, ProcessedTransaction, TransactionStatus, InterpretedTransaction, ExpenseCategory
 
 
 class TelegramFinanceBot:
@@ -26,6 +35,8 @@ class TelegramFinanceBot:
         self.settings = get_settings()
         self.bot = None
         self.application = None
+        self.dispatcher = ChatOrderedDispatcher(self.settings.max_concurrent_updates)
+        self.update_filter = UpdateFilter(ALLOWED_UPDATES)
 
     async def setup(self):
         """Configurar bot"""
@@ -35,7 +46,17 @@ class TelegramFinanceBot:
 
             await self._setup_handlers()
 
-            await sheets_service.setup()
+            await idempotency_service.purge_expired()
+
+            await openai_service.warm_cache_filter()
+            openai_service.start_cache_maintenance()
+
+            await category_classifier.load_or_train()
+
+            if self.settings.sheets_startup_mode == "background":
+                sheets_service.start_background_setup()
+            else:
+                await sheets_service.setup()
 
             await self._setup_webhook()
 
@@ -66,21 +87,94 @@ class TelegramFinanceBot:
     async def _setup_webhook(self):
         """Configurar webhook"""
         try:
-            await self.bot.set_webhook(url=self.settings.telegram_webhook_url)
-            logger.info(f"✅ Webhook configurado: {self.settings.telegram_webhook_url}")
+            await self.bot.set_webhook(
+                url=self.settings.telegram_webhook_url,
+                allowed_updates=ALLOWED_UPDATES
+            )
+            logger.info(f"✅ Webhook configurado: {self.settings.telegram_webhook_url} ({', '.join(ALLOWED_UPDATES)})")
         except Exception as e:
             logger.error(f"❌ Erro ao configurar webhook: {e}")
             raise
 
-    async def process_update(self, update_data: Dict[str, Any]):
-        """Processar update do webhook"""
+    def submit_update(
+        self,
+        update_data: Dict[str, Any],
+        gate: Optional[Callable[[], AsyncContextManager[bool]]] = None
+    ) -> Optional[asyncio.Future]:
+        """Agendar update na fila do seu chat sem aguardar o processamento
+
+        O gate, se informado, é aberto quando chega a vez do update no chat e diz
+        se ele deve ser processado (ex.: vaga de admissão). Retorna a future do
+        processamento, ou None se a mesma entrega já está em andamento.
+        """
+        update_id = update_data.get("update_id")
+
+        if not idempotency_service.claim(update_id):
+            logger.info(f"🔁 Update {update_id} já está em processamento, ignorando reentrega")
+            return None
+
         try:
             update = Update.de_json(update_data, self.bot)
-            await self.application.process_update(update)
+            chat_id = update.effective_chat.id if update.effective_chat else None
+            future = self.dispatcher.submit(chat_id, lambda: self._process_update_gated(update, gate))
         except Exception as e:
+            idempotency_service.release(update_id)
             logger.error(f"❌ Erro ao processar update: {e}")
             raise
 
+        def _finished(done: asyncio.Future):
+            idempotency_service.release(update_id)
+            if not done.cancelled() and done.exception():
+                logger.error(f"❌ Erro ao processar update: {done.exception()}")
+
+        future.add_done_callback(_finished)
+        return future
+
+    async def process_update(self, update_data: Dict[str, Any]):
+        """Processar update do webhook e aguardar sua conclusão"""
+        future = self.submit_update(update_data)
+        if future is not None:
+            await future
+
+    async def _process_update_gated(self, update: Update, gate: Optional[Callable[[], AsyncContextManager[bool]]]):
+        """Processar update dentro do gate, se houver"""
+        if gate is None:
+            return await self._process_update_once(update)
+
+        async with gate() as admitted:
+            if admitted:
+                await self._process_update_once(update)
+
+    async def _process_update_once(self, update: Update):
+        """Processar update apenas se ainda não houver registro de processamento"""
+        if await idempotency_service.is_processed(update.update_id):
+            logger.info(f"🔁 Update {update.update_id} já processado, ignorando reentrega")
+            return
+
+        await self.application.process_update(update)
+
+        await idempotency_service.mark_processed(
+            update.update_id,
+            chat_id=update.effective_chat.id if update.effective_chat else None,
+            message_id=update.effective_message.message_id if update.effective_message else None
+        )
+
+    async def send_deferred_notice(self, update_data: Dict[str, Any]):
+        """Avisar o usuário que a mensagem será processada assim que houver capacidade"""
+        message = update_data.get("message") or {}
+        chat_id = (message.get("chat") or {}).get("id")
+        if chat_id is None:
+            return
+
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id,
+                text="⏳ Muitas mensagens no momento! Recebi a sua e vou processá-la em instantes.",
+                reply_to_message_id=message.get("message_id")
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao enviar aviso de processamento adiado: {e}")
+
     async def cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /start"""
         user_id = update.effective_user.id
@@ -332,6 +426,7 @@ Itens não categorizados
 
     async def cmd_insights(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /insights - gerar insights financeiros com IA"""
+        progress = None
         try:
             args = context.args
             period_type = "monthly"
@@ -344,45 +439,72 @@ Itens não categorizados
                 action="typing"
             )
             
-            transactions_data = await self._get_insights_data(period_type)
-            
-            if not transactions_data or len(transactions_data) == 0:
-                period_desc = "do ano" if period_type == "yearly" else "do mês atual"
-                await update.message.reply_text(
-                    f"📊 **Insights Financeiros**\n\n"
-                    f"Não há dados suficientes {period_desc} para gerar insights.\n\n"
-                    f"Envie alguns gastos primeiro e tente novamente!"
+            # dados inalterados desde o último pedido: reaproveita o insight salvo
+            fingerprint = await database_service.get_period_fingerprint(period_type)
+            insights_obj = None
+            if fingerprint:
+                insights_obj = await insights_cache_service.get(period_type, *fingerprint)
+
+            if insights_obj is None:
+                transactions_data = await self._get_insights_data(period_type)
+                
+                if not transactions_data or len(transactions_data) == 0:
+                    period_desc = "do ano" if period_type == "yearly" else "do mês atual"
+                    await update.message.reply_text(
+                        f"📊 **Insights Financeiros**\n\n"
+                        f"Não há dados suficientes {period_desc} para gerar insights.\n\n"
+                        f"Envie alguns gastos primeiro e tente novamente!"
+                    )
+                    return
+                
+                if self.settings.insights_streaming_enabled:
+                    placeholder = await update.message.reply_text("🧠 Gerando insights financeiros...")
+                    progress = ProgressiveMessage(
+                        placeholder,
+                        lambda text: self._format_insights_message(period_type, text),
+                        self.settings.insights_stream_edit_interval_seconds
+                    )
+
+                from models.schemas import InsightsPeriod
+                period_desc = "Ano 2025" if period_type == "yearly" else f"{datetime.now().strftime('%B')} 2025"
+                insights_period = InsightsPeriod.YEARLY if period_type == "yearly" else InsightsPeriod.MONTHLY
+                insights_obj = await openai_service.generate_financial_insights(
+                    transactions_data, insights_period, period_desc,
+                    on_progress=progress.update if progress else None
                 )
-                return
-            
-            from models.schemas import InsightsPeriod
-            period_desc = "Ano 2025" if period_type == "yearly" else f"{datetime.now().strftime('%B')} 2025"
-            insights_period = InsightsPeriod.YEARLY if period_type == "yearly" else InsightsPeriod.MONTHLY
-            insights_obj = await openai_service.generate_financial_insights(
-                transactions_data, insights_period, period_desc
-            )
-            
-            period_display = "Anual" if period_type == "yearly" else "Mensal"
-            
-            insights_text = insights_obj.insights_text
-            if len(insights_text) > 2500:
-                insights_text = insights_text[:2500] + "..."
-            
-            message = f"""🧠 **Insights Financeiros - {period_display}**
 
-{insights_text}
+                if fingerprint:
+                    await insights_cache_service.save(period_type, *fingerprint, insights_obj, openai_service.model)
 
-💡 *Análise gerada por IA com base nos seus dados financeiros*"""
-            
-            await update.message.reply_text(message)
+            # texto final já passou por _clean_and_limit_response
+            if progress and await progress.finish(insights_obj.insights_text):
+                return
+
+            await update.message.reply_text(self._format_insights_message(period_type, insights_obj.insights_text))
             
         except Exception as e:
             logger.error(f"❌ Erro no comando insights: {e}")
-            await update.message.reply_text(
+            error_message = (
                 "Ops! Ocorreu um erro ao gerar insights.\n"
                 "Tente novamente em alguns instantes.\n\n"
                 "Use: /insights (mês atual) ou /insights ano (ano completo)"
             )
+            if progress and await progress.replace(error_message):
+                return
+            await update.message.reply_text(error_message)
+
+    def _format_insights_message(self, period_type: str, insights_text: str) -> str:
+        """Montar mensagem de insights com cabeçalho e rodapé"""
+        period_display = "Anual" if period_type == "yearly" else "Mensal"
+        
+        if len(insights_text) > 2500:
+            insights_text = insights_text[:2500] + "..."
+        
+        return f"""🧠 **Insights Financeiros - {period_display}**
+
+{insights_text}
+
+💡 *Análise gerada por IA com base nos seus dados financeiros*"""
 
     async def cmd_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /stats - mostrar estatísticas do banco de dados"""
@@ -426,6 +548,15 @@ Itens não categorizados
     async def cmd_sync(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Comando /sync - sincronizar dados entre SQLite e Google Sheets"""
         try:
+            if sheets_service.setup_in_progress:
+                status = sheets_service.startup_status()
+                await update.message.reply_text(
+                    "⏳ **Planilha ainda em preparação**\n\n"
+                    f"Etapa atual: {status['step'] or status['state']}\n"
+                    "Tente novamente em alguns instantes."
+                )
+                return
+
             args = context.args
             clean_mode = len(args) > 0 and args[0].lower() == "clean"
             
@@ -621,24 +752,47 @@ Detalhes: {str(e)}
 
             logger.info(f"🔄 Processando mensagem: '{message_data.text[:50]}...'")
 
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action="typing"
-            )
+            with metrics_service.time_stage("total"):
+                with metrics_service.time_stage("dedup_lookup"):
+                    existing = await database_service.get_transaction_by_message(
+                        message_data.chat_id, message_data.message_id
+                    )
+                if existing:
+                    logger.info(f"🔁 Mensagem já registrada como transação ID {existing.id}, reenviando confirmação")
+                    await self._send_confirmation(update, self._to_interpreted(existing), existing.id)
+                    return
 
-            interpreted = await openai_service.interpret_financial_message(message_data.text)
+                with metrics_service.time_stage("typing"):
+                    await context.bot.send_chat_action(
+                        chat_id=update.effective_chat.id,
+                        action="typing"
+                    )
 
-            transaction = await self._save_transaction(message_data, interpreted)
+                with metrics_service.time_stage("interpret"):
+                    interpreted = await openai_service.interpret_financial_message(message_data.text)
 
-            row_number = await sheets_service.add_transaction(interpreted, transaction.id)
+                with metrics_service.time_stage("save_transaction"):
+                    transaction, duplicate = await self._save_transaction(message_data, interpreted)
+
+                if duplicate:
+                    # outra entrega da mesma mensagem já gravou, lançou na planilha e respondeu
+                    logger.info(f"🔁 Mensagem já registrada por outra entrega como transação ID {transaction.id}")
+                    return
 
-            await self._update_transaction_sheets_info(transaction.id, row_number)
+                with metrics_service.time_stage("sheets_add_transaction"):
+                    row_number = await sheets_service.add_transaction(interpreted, transaction.id)
 
-            await self._send_confirmation(update, interpreted, transaction.id)
+                if row_number:
+                    with metrics_service.time_stage("sheets_update_info"):
+                        await self._update_transaction_sheets_info(transaction.id, row_number)
+
+                with metrics_service.time_stage("confirmation"):
+                    await self._send_confirmation(update, interpreted, transaction.id)
 
             logger.info(f"✅ Transação processada com sucesso: ID {transaction.id}")
 
         except Exception as e:
+            metrics_service.inc("errors_total", component="handle_expense_message")
             logger.error(f"❌ Erro ao processar mensagem: {e}")
             await update.message.reply_text(
                 "Ops! Ocorreu um erro ao processar sua mensagem.\n"
@@ -647,48 +801,59 @@ Detalhes: {str(e)}
                 "Tente reformular a mensagem ou use /help"
             )
 
-    async def _save_transaction(self, message_data: MessageInput, interpreted: InterpretedTransaction) -> ProcessedTransaction:
-        """Salvar transação no database"""
+    async def _save_transaction(self, message_data: MessageInput, interpreted: InterpretedTransaction) -> Tuple[ProcessedTransaction, bool]:
+        """Salvar transação no database; o segundo valor indica que a mensagem já estava gravada"""
         try:
-            async for db in get_db_session():
-                transaction = Transaction(
-                    original_message=message_data.text,
-                    user_id=message_data.user_id,
-                    message_id=message_data.message_id,
-                    chat_id=message_data.chat_id,
-                    descricao=interpreted.descricao,
-                    valor=interpreted.valor,
-                    categoria=interpreted.categoria.value,
-                    data_transacao=interpreted.data,
-                    confianca=interpreted.confianca,
-                    status="processed"
-                )
-
-                db.add(transaction)
-                await db.commit()
-                await db.refresh(transaction)
+            saved = await transaction_writer.insert(
+                original_message=message_data.text,
+                user_id=message_data.user_id,
+                message_id=message_data.message_id,
+                chat_id=message_data.chat_id,
+                descricao=interpreted.descricao,
+                valor=interpreted.valor,
+                categoria=interpreted.categoria.value,
+                data_transacao=interpreted.data,
+                confianca=interpreted.confianca,
+                status="processed"
+            )
 
-                return ProcessedTransaction(
-                    id=transaction.id,
-                    original_message=message_data.text,
-                    interpreted_data=interpreted,
-                    status=TransactionStatus.PROCESSED,
-                    created_at=transaction.created_at
+            if saved.duplicate:
+                logger.info(f"🔁 Transação da mensagem já existe: ID {saved.id}")
+            else:
+                await category_classifier.learn_and_persist(
+                    f"{interpreted.descricao} {message_data.text}", interpreted.categoria.value
                 )
 
+            return ProcessedTransaction(
+                id=saved.id,
+                original_message=message_data.text,
+                interpreted_data=interpreted,
+                status=TransactionStatus.PROCESSED,
+                created_at=saved.created_at
+            ), saved.duplicate
+
         except Exception as e:
             logger.error(f"❌ Erro ao salvar transação: {e}")
             raise
 
+    def _to_interpreted(self, transaction: Transaction) -> InterpretedTransaction:
+        """Reconstruir interpretação a partir de uma transação salva"""
+        return InterpretedTransaction(
+            descricao=transaction.descricao,
+            valor=transaction.valor,
+            categoria=ExpenseCategory(transaction.categoria),
+            data=transaction.data_transacao,
+            confianca=float(transaction.confianca or 1.0)
+        )
+
     async def _update_transaction_sheets_info(self, transaction_id: int, row_number: int):
         """Atualizar informações do Google Sheets na transação"""
         try:
-            async for db in get_db_session():
-                transaction = await db.get(Transaction, transaction_id)
-                if transaction:
-                    transaction.sheets_row_number = row_number
-                    transaction.sheets_updated_at = datetime.now()
-                    await db.commit()
+            await transaction_writer.update(
+                transaction_id,
+                sheets_row_number=row_number,
+                sheets_updated_at=datetime.now()
+            )
 
         except Exception as e:
             logger.error(f"❌ Erro ao atualizar info do sheets: {e}")
@@ -746,6 +911,11 @@ Salvo na planilha Google! Use /resumo para ver totais.
 
     async def stop(self):
         """Parar bot"""
+        await sheets_service.stop_background_setup()
+        await category_classifier.save()
+        await openai_service.stop_cache_maintenance()
+        await transaction_writer.stop()
+
         if self.application:
             await self.application.stop()
             logger.info("Bot parado")
@@ -0,0 +1,123 @@
+"""
+Despachante de updates: ordem preservada por chat, paralelismo entre chats
+"""
+
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Any, Optional, Callable, Awaitable, Set, Tuple
+
+
+Handler = Callable[[], Awaitable[Any]]
+
+
+class ChatOrderedDispatcher:
+    """Processa updates de chats diferentes em paralelo mantendo a ordem dentro de cada chat
+
+    Cada chat com updates pendentes tem uma fila e uma tarefa que a drena; quem
+    agenda um update nunca espera pelos anteriores do mesmo chat.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 8):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates deve ser um inteiro positivo")
+
+        self.max_concurrent_updates = max_concurrent_updates
+        self._semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._chats: Dict[int, Deque[Tuple[Handler, asyncio.Future]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._active = 0
+        self._pending = 0
+
+    def submit(self, chat_id: Optional[int], handler: Handler) -> asyncio.Future:
+        """Agendar handler após os updates anteriores do mesmo chat, sem aguardar
+
+        A posição na fila do chat é reservada aqui, então a ordem de chegada é a
+        ordem de processamento. A future recebe o resultado do handler; cancelá-la
+        antes do início tira o update da fila sem liberar os seguintes antes da hora.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # quem não aguarda a future não deve gerar aviso de exceção não lida
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+        if chat_id is None:
+            self._spawn(self._execute(handler, future))
+            return future
+
+        self._pending += 1
+        pending = self._chats.get(chat_id)
+        if pending is None:
+            pending = self._chats[chat_id] = deque()
+            pending.append((handler, future))
+            self._spawn(self._drain(chat_id, pending))
+        else:
+            pending.append((handler, future))
+        return future
+
+    async def dispatch(self, chat_id: Optional[int], handler: Handler) -> Any:
+        """Executar handler após os updates anteriores do mesmo chat e aguardar o resultado"""
+        return await self.submit(chat_id, handler)
+
+    @property
+    def backlog(self) -> int:
+        """Updates agendados que ainda não terminaram"""
+        return self._pending + self._active
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, chat_id: int, pending: Deque[Tuple[Handler, asyncio.Future]]):
+        """Executar os updates do chat um a um, na ordem de chegada"""
+        try:
+            while pending:
+                handler, future = pending.popleft()
+                self._pending -= 1
+                if future.done():
+                    # cancelado enquanto esperava a vez
+                    continue
+                await self._execute(handler, future)
+        finally:
+            if self._chats.get(chat_id) is pending:
+                del self._chats[chat_id]
+
+    async def _execute(self, handler: Handler, future: asyncio.Future):
+        """Executar handler e entregar o resultado à future"""
+        try:
+            result = await self._run(handler)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self, handler: Handler) -> Any:
+        """Executar handler respeitando o limite global de concorrência"""
+        async with self._semaphore:
+            self._active += 1
+            try:
+                return await handler()
+            finally:
+                self._active -= 1
+
+    async def drain(self, timeout: float = 10.0):
+        """Aguardar updates agendados e cancelar os que passarem do prazo"""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado atual do despachante"""
+        return {
+            "max_concurrent_updates": self.max_concurrent_updates,
+            "active_updates": self._active,
+            "waiting_for_chat": self._pending,
+            "chats_in_flight": len(self._chats)
+        }
@@ -0,0 +1,67 @@
+"""
+Filtro de updates sobre o JSON bruto do webhook, antes de Update.de_json
+"""
+
+from typing import Dict, Any, List, Optional
+
+from loguru import logger
+
+
+ALLOWED_UPDATES: List[str] = ["message"]
+
+
+class UpdateFilter:
+    """Descarta de forma barata os updates que nenhum handler do bot consome"""
+
+    def __init__(self, allowed_updates: Optional[List[str]] = None):
+        self.allowed_updates = set(allowed_updates or ALLOWED_UPDATES)
+        self.accepted = 0
+        self.dropped: Dict[str, int] = {}
+
+    def accepts(self, update_data: Dict[str, Any]) -> bool:
+        """Verificar se o update deve seguir para o processamento"""
+        reason = self._rejection_reason(update_data)
+
+        if reason is None:
+            self.accepted += 1
+            return True
+
+        self.dropped[reason] = self.dropped.get(reason, 0) + 1
+        logger.debug(f"Update {update_data.get('update_id')} descartado: {reason}")
+        return False
+
+    def _rejection_reason(self, update_data: Dict[str, Any]) -> Optional[str]:
+        """Motivo do descarte, ou None se o update for consumido por algum handler"""
+        update_type = next((key for key in update_data if key != "update_id"), None)
+
+        if update_type is None:
+            return "empty"
+
+        if update_type not in self.allowed_updates:
+            return update_type
+
+        message = update_data[update_type]
+        if not isinstance(message, dict):
+            return "malformed"
+
+        chat = message.get("chat")
+        if not isinstance(chat, dict) or "id" not in chat:
+            return "no_chat"
+
+        sender = message.get("from")
+        if isinstance(sender, dict) and sender.get("is_bot"):
+            return "from_bot"
+
+        text = message.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return "non_text"
+
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de updates aceitos e descartados por motivo"""
+        return {
+            "allowed_updates": sorted(self.allowed_updates),
+            "accepted": self.accepted,
+            "dropped": dict(self.dropped)
+        }
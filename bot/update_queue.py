@@ -0,0 +1,119 @@
+"""
+Fila de ingestão assíncrona para updates recebidos via webhook
+"""
+
+import asyncio
+import time
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from loguru import logger
+
+
+class UpdateQueue:
+    """Fila limitada de updates drenada por um pool de workers"""
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any], float], Awaitable[None]],
+        max_size: int = 1000,
+        workers: int = 4,
+        drain_timeout: float = 10.0
+    ):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+        self._busy_workers = 0
+        self._busy_seconds = 0.0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Iniciar workers"""
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._started_at = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"✅ Fila de updates iniciada ({self.workers} workers, capacidade {self.max_size})")
+
+    def enqueue(self, update_data: Dict[str, Any]) -> bool:
+        """Enfileirar update sem bloquear; retorna False se a fila estiver cheia"""
+        if self._queue is None:
+            raise RuntimeError("Fila de updates não iniciada")
+
+        try:
+            self._queue.put_nowait((time.monotonic(), update_data))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"⚠️ Fila de updates cheia, update {update_data.get('update_id')} rejeitado")
+            return False
+
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, worker_id: int):
+        """Consumir updates da fila indefinidamente
+
+        O handler recebe o update e quantos segundos ele esperou na fila.
+        """
+        while True:
+            enqueued_at, update_data = await self._queue.get()
+            self._busy_workers += 1
+            started_at = time.monotonic()
+
+            try:
+                await self.handler(update_data, started_at - enqueued_at)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Worker {worker_id} falhou no update {update_data.get('update_id')}: {e}")
+            finally:
+                self._busy_workers -= 1
+                self._busy_seconds += time.monotonic() - started_at
+                self._queue.task_done()
+
+    async def stop(self):
+        """Drenar fila pendente e parar workers"""
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Fila de updates parada com {self._queue.qsize()} updates pendentes")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Fila de updates parada")
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila e utilização dos workers"""
+        depth = self._queue.qsize() if self._queue else 0
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        capacity_seconds = elapsed * self.workers
+
+        return {
+            "depth": depth,
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "busy_workers": self._busy_workers,
+            "utilization": round(self._busy_workers / self.workers, 3) if self.workers else 0.0,
+            "avg_utilization": round(self._busy_seconds / capacity_seconds, 3) if capacity_seconds else 0.0,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
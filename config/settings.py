@@ -2,7 +2,7 @@
 Configurações da aplicação
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from functools import lru_cache
 
 from pydantic_settings import BaseSettings
@@ -19,13 +19,71 @@ class Settings(BaseSettings):
     telegram_bot_token: str = Field(..., description="Token do bot do Telegram")
     telegram_webhook_url: Optional[str] = Field(default=None, description="URL do webhook")
 
+    webhook_mode: str = Field(default="sync", description="Ingestão do webhook: 'sync' ou 'queue'")
+    update_queue_max_size: int = Field(default=1000, description="Capacidade máxima da fila de updates")
+    max_concurrent_updates: int = Field(default=8, description="Máximo de updates processados em paralelo entre chats")
+    max_inflight_updates: int = Field(default=16, description="Máximo de updates em processamento simultâneo")
+    max_queue_wait_seconds: float = Field(default=5.0, description="Tempo máximo de espera por uma vaga de processamento")
+    load_shedding_policy: str = Field(default="retry", description="Ao atingir os limites: 'retry' (503) ou 'defer' (aviso e processamento posterior)")
+    shed_retry_after_seconds: int = Field(default=5, description="Valor do Retry-After nas respostas 503")
+    max_deferred_updates: int = Field(default=100, description="Máximo de updates adiados aguardando vaga; acima disso responde 503")
+    processed_update_ttl_hours: int = Field(default=48, description="Tempo de retenção dos update_ids já processados")
+
     openai_api_key: str = Field(..., description="Chave da API OpenAI")
     openai_model: str = Field(default="gpt-3.5-turbo")
+    openai_cascade_model: Optional[str] = Field(default=None, description="Modelo barato tentado antes de openai_model nas interpretações")
+    openai_cascade_min_confidence: float = Field(default=0.8, description="Confiança mínima do modelo barato para dispensar o modelo principal")
+    openai_model_prices: Dict[str, List[float]] = Field(
+        default={"gpt-3.5-turbo": [0.5, 1.5], "gpt-4o-mini": [0.15, 0.6], "gpt-4o": [2.5, 10.0]},
+        description="Preço em USD por milhão de tokens [entrada, saída] para estimar custo por modelo"
+    )
+    openai_max_concurrent_requests: int = Field(default=8, description="Máximo de chamadas simultâneas à OpenAI")
+    openai_requests_per_minute: int = Field(default=500, description="Limite de chamadas à OpenAI por minuto")
+    openai_call_deadline_seconds: float = Field(default=30.0, description="Prazo total de uma chamada à OpenAI, incluindo retentativas")
+    openai_max_retries: int = Field(default=3, description="Retentativas em falhas transitórias da OpenAI (429, 5xx, rede)")
+    openai_retry_base_seconds: float = Field(default=0.5, description="Espera base do backoff exponencial com jitter")
+    openai_retry_max_seconds: float = Field(default=20.0, description="Espera máxima entre retentativas")
+    openai_circuit_failure_threshold: int = Field(default=5, description="Falhas seguidas que abrem o circuito da OpenAI")
+    openai_circuit_reset_seconds: float = Field(default=30.0, description="Tempo com o circuito aberto antes de testar a OpenAI de novo")
+    ai_batching_enabled: bool = Field(default=False, description="Agrupar interpretações simultâneas em uma chamada à IA")
+    ai_batch_window_ms: int = Field(default=50, description="Janela de espera para formar um lote")
+    ai_batch_max_size: int = Field(default=8, description="Máximo de mensagens por lote")
+    local_parser_enabled: bool = Field(default=True, description="Interpretar mensagens simples localmente, sem IA")
+    local_parser_min_confidence: float = Field(default=0.85, description="Confiança mínima do parser local para dispensar a IA")
+    category_model_path: str = Field(default="category_model.json", description="Arquivo do classificador de categorias")
+    category_classifier_min_probability: float = Field(default=0.9, description="Probabilidade mínima para comparar a categoria da IA com o classificador")
+    insights_streaming_enabled: bool = Field(default=True, description="Mostrar os insights enquanto a IA gera o texto")
+    insights_stream_edit_interval_seconds: float = Field(default=1.0, description="Intervalo mínimo entre edições da mensagem de insights")
+    ai_cache_ttl_days: int = Field(default=90, description="Validade das interpretações em cache com data relativa")
+    ai_cache_unresolved_date_ttl_days: int = Field(default=7, description="Validade das interpretações cuja data não pôde ser descrita")
+    ai_cache_max_rows: int = Field(default=50_000, description="Máximo de entradas do cache de interpretações no banco")
+    ai_cache_maintenance_interval_minutes: int = Field(default=60, description="Intervalo da limpeza do cache de interpretações")
+    ai_cache_memory_size: int = Field(default=1000, description="Entradas do cache de interpretações em memória")
+    ai_cache_memory_ttl_seconds: int = Field(default=3600, description="TTL das entradas do cache em memória")
+    ai_cache_bloom_capacity: int = Field(default=100_000, description="Capacidade do filtro de Bloom de chaves do cache")
+    ai_cache_bloom_error_rate: float = Field(default=0.01, description="Taxa de falso positivo do filtro de Bloom")
 
     google_sheets_spreadsheet_id: str = Field(..., description="ID da planilha Google")
     google_credentials_file: str = Field(default="credentials/google_service_account.json")
+    sheets_startup_mode: str = Field(
+        default="blocking",
+        description="Setup da planilha no startup: 'blocking' ou 'background'"
+    )
+    sheets_setup_retry_seconds: float = Field(default=5.0, description="Espera inicial entre tentativas de setup da planilha")
+    sheets_setup_max_retry_seconds: float = Field(default=300.0, description="Espera máxima entre tentativas de setup da planilha")
+    sheets_pending_max_attempts: int = Field(default=5, description="Tentativas de envio de uma transação pendente antes de desistir até o próximo startup")
 
     database_url: str = Field(default="sqlite:///./finance_bot.db")
+    sqlite_pragma_profile: str = Field(
+        default="default",
+        description="Pragmas aplicados a cada conexão: 'default', 'safe' (WAL + synchronous=FULL) ou 'performance' (WAL + synchronous=NORMAL)"
+    )
+    sqlite_pragmas: Dict[str, str] = Field(default={}, description="Pragmas que substituem os do perfil, ex: {\"cache_size\": \"-32000\"}")
+    sqlite_pool_size: int = Field(default=5, description="Conexões mantidas abertas no pool do SQLite")
+    sqlite_max_overflow: int = Field(default=5, description="Conexões extras permitidas em picos")
+    sqlite_pool_timeout_seconds: float = Field(default=10.0, description="Espera máxima por uma conexão livre do pool")
+    db_write_batch_max_size: int = Field(default=32, description="Máximo de escritas de transações por commit; 1 desativa o agrupamento")
+    db_write_batch_max_delay_ms: int = Field(default=5, description="Espera máxima por outras escritas antes do commit")
 
     default_categories: List[str] = Field(
         default=["Alimentação", "Transporte", "Saúde", "Lazer", "Casa", "Finanças", "Outros"]
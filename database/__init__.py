@@ -2,14 +2,19 @@
 Database package - SQLite database models and connections
 """
 
-from .models import Transaction, AIPromptCache, UserConfig, Base
+from .models import Transaction, AIPromptCache, ProcessedUpdate, InsightsCache, MonthlyRollup, UserConfig, Base
 from .sqlite_db import get_db_session, init_database
+from .rollups import monthly_rollups
 
 __all__ = [
     'Transaction',
     'AIPromptCache', 
+    'ProcessedUpdate',
+    'InsightsCache',
+    'MonthlyRollup',
     'UserConfig',
     'Base',
     'get_db_session',
-    'init_database'
+    'init_database',
+    'monthly_rollups'
 ]
@@ -2,7 +2,7 @@
 Modelos SQLAlchemy para o banco de dados
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, Boolean, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.sql import func
 
@@ -35,6 +35,12 @@ class Transaction(Base):
     created_at = Column(DateTime, default=func.now(), comment="Data de criação")
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), comment="Última atualização")
 
+    __table_args__ = (
+        Index("uq_transactions_chat_message", "chat_id", "message_id", unique=True),
+        # cobre os relatórios por período: filtro por status e faixa de datas, soma por categoria
+        Index("ix_transactions_status_date", "status", "data_transacao", "categoria", "valor"),
+    )
+
     def __repr__(self):
         return f"<Transaction(id={self.id}, descricao='{self.descricao}', valor={self.valor})>"
 
@@ -48,14 +54,77 @@ class AIPromptCache(Base):
     input_text = Column(Text, nullable=False, comment="Texto original")
     output_json = Column(Text, nullable=False, comment="Resposta da IA em JSON")
     model_used = Column(String(50), nullable=False, comment="Modelo de IA usado")
+    hit_count = Column(Integer, nullable=False, default=0, server_default="0", comment="Leituras da entrada")
+    last_hit_at = Column(DateTime, nullable=True, comment="Última leitura da entrada")
 
     created_at = Column(DateTime, default=func.now())
-    expires_at = Column(DateTime, nullable=False, comment="Data de expiração do cache")
+    expires_at = Column(DateTime, nullable=False, index=True, comment="Data de expiração do cache")
 
     def __repr__(self):
         return f"<AIPromptCache(id={self.id}, hash={self.input_hash[:8]}...)>"
 
 
+class ProcessedUpdate(Base):
+    """Updates do Telegram já processados, para ignorar reentregas do webhook"""
+    __tablename__ = "processed_updates"
+
+    update_id = Column(Integer, primary_key=True, autoincrement=False, comment="ID do update Telegram")
+    chat_id = Column(Integer, nullable=True, comment="ID do chat")
+    message_id = Column(Integer, nullable=True, comment="ID da mensagem Telegram")
+
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True, comment="Data de expiração do registro")
+
+    def __repr__(self):
+        return f"<ProcessedUpdate(update_id={self.update_id}, chat_id={self.chat_id})>"
+
+
+class InsightsCache(Base):
+    """Insights gerados por período, válidos enquanto os dados do período não mudam"""
+    __tablename__ = "insights_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    period_type = Column(String(20), nullable=False, comment="monthly ou yearly")
+    period_key = Column(String(20), nullable=False, comment="Período analisado (YYYY-MM ou YYYY)")
+    fingerprint = Column(String(64), nullable=False, comment="Impressão digital dos dados usados")
+    insights_json = Column(Text, nullable=False, comment="FinancialInsights serializado")
+    model_used = Column(String(50), nullable=False, comment="Modelo de IA usado")
+
+    created_at = Column(DateTime, default=func.now())
+
+    __table_args__ = (
+        Index("uq_insights_cache_period", "period_type", "period_key", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<InsightsCache(period={self.period_type}:{self.period_key}, fingerprint={self.fingerprint[:8]}...)>"
+
+
+class MonthlyRollup(Base):
+    """Totais mensais por usuário e categoria das transações processadas"""
+    __tablename__ = "monthly_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False, comment="ID do usuário Telegram")
+    year = Column(Integer, nullable=False, comment="Ano da transação")
+    month = Column(Integer, nullable=False, comment="Mês da transação")
+    categoria = Column(String(50), nullable=False, comment="Categoria do gasto")
+
+    total = Column(Numeric(12, 2), nullable=False, default=0, comment="Soma dos valores")
+    count = Column(Integer, nullable=False, default=0, comment="Quantidade de transações")
+    min_valor = Column(Numeric(10, 2), nullable=True, comment="Menor valor")
+    max_valor = Column(Numeric(10, 2), nullable=True, comment="Maior valor")
+
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("uq_monthly_rollups_key", "user_id", "year", "month", "categoria", unique=True),
+    )
+
+    def __repr__(self):
+        return f"<MonthlyRollup({self.year}-{self.month:02d} {self.categoria}: total={self.total}, count={self.count})>"
+
+
 class UserConfig(Base):
     """Configurações do usuário"""
     __tablename__ = "user_config"
@@ -0,0 +1,258 @@
+"""
+Manutenção da tabela de totais mensais (monthly_rollups)
+
+Cada flush da sessão que inclui, altera ou remove transações atualiza os totais
+na mesma transação do banco. Inclusões somam incrementalmente; alterações e
+remoções recalculam apenas os grupos afetados, pois mínimo e máximo não podem
+ser desfeitos por subtração.
+
+Escritas em massa pelo Core (insert()/update() direto na tabela) não passam pelo
+ORM e exigem reconstrução com database.rollups_cli.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import and_, delete, event, extract, func, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database.models import MonthlyRollup, Transaction
+
+
+RollupKey = Tuple[int, int, int, str]
+
+ROLLUP_STATUS = "processed"
+
+
+@dataclass
+class _Increment:
+    """Soma, contagem, mínimo e máximo a aplicar em um grupo"""
+    total: Decimal = Decimal("0")
+    count: int = 0
+    min_valor: Optional[Decimal] = None
+    max_valor: Optional[Decimal] = None
+
+    def add(self, valor: Decimal):
+        self.total += valor
+        self.count += 1
+        self.min_valor = valor if self.min_valor is None else min(self.min_valor, valor)
+        self.max_valor = valor if self.max_valor is None else max(self.max_valor, valor)
+
+
+def _previous_value(state, name: str):
+    """Valor do atributo antes das alterações pendentes"""
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return history.added[0] if history.added else None
+
+
+def _contribution(user_id, data_transacao, categoria, status, valor) -> Optional[Tuple[RollupKey, Decimal]]:
+    """Grupo e valor com que uma transação entra nos totais; None se não conta"""
+    if (status or "pending") != ROLLUP_STATUS or data_transacao is None or valor is None:
+        return None
+    return (user_id, data_transacao.year, data_transacao.month, categoria), Decimal(str(valor))
+
+
+def _month_range(year: int, month: int) -> Tuple[date, date]:
+    return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+
+class MonthlyRollupMaintainer:
+    """Mantém monthly_rollups consistente com as transações gravadas pelo ORM"""
+
+    FIELDS = ("user_id", "data_transacao", "categoria", "status", "valor")
+
+    def __init__(self):
+        # ligado por init_database depois de garantir a tabela preenchida
+        self.enabled = False
+
+    def _current(self, transaction: Transaction):
+        return _contribution(*(getattr(transaction, name) for name in self.FIELDS))
+
+    def _previous(self, transaction: Transaction):
+        state = inspect(transaction)
+        return _contribution(*(_previous_value(state, name) for name in self.FIELDS))
+
+    def after_flush(self, session: Session, flush_context):
+        """Aplicar as mudanças do flush aos totais, na conexão da própria sessão"""
+        if not self.enabled:
+            return
+
+        increments: Dict[RollupKey, _Increment] = {}
+        stale: Set[RollupKey] = set()
+
+        for transaction in session.new:
+            if isinstance(transaction, Transaction):
+                contribution = self._current(transaction)
+                if contribution:
+                    key, valor = contribution
+                    increments.setdefault(key, _Increment()).add(valor)
+
+        for transaction in session.dirty:
+            if isinstance(transaction, Transaction) and session.is_modified(transaction):
+                previous, current = self._previous(transaction), self._current(transaction)
+                if previous != current:
+                    stale.update(contribution[0] for contribution in (previous, current) if contribution)
+
+        for transaction in session.deleted:
+            if isinstance(transaction, Transaction):
+                previous = self._previous(transaction)
+                if previous:
+                    stale.add(previous[0])
+
+        if not increments and not stale:
+            return
+
+        connection = session.connection()
+        for key, increment in increments.items():
+            if key not in stale:
+                self._apply_increment(connection, key, increment)
+        for key in stale:
+            self.recompute_group(connection, key)
+
+    @staticmethod
+    def _apply_increment(connection, key: RollupKey, increment: _Increment):
+        user_id, year, month, categoria = key
+        statement = sqlite_insert(MonthlyRollup).values(
+            user_id=user_id,
+            year=year,
+            month=month,
+            categoria=categoria,
+            total=increment.total,
+            count=increment.count,
+            min_valor=increment.min_valor,
+            max_valor=increment.max_valor
+        )
+        excluded = statement.excluded
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[MonthlyRollup.user_id, MonthlyRollup.year, MonthlyRollup.month, MonthlyRollup.categoria],
+            set_={
+                "total": MonthlyRollup.total + excluded.total,
+                "count": MonthlyRollup.count + excluded.count,
+                "min_valor": func.min(func.coalesce(MonthlyRollup.min_valor, excluded.min_valor), excluded.min_valor),
+                "max_valor": func.max(func.coalesce(MonthlyRollup.max_valor, excluded.max_valor), excluded.max_valor),
+                "updated_at": func.now()
+            }
+        ))
+
+    @staticmethod
+    def recompute_group(connection, key: RollupKey):
+        """Recalcular um grupo a partir das transações"""
+        user_id, year, month, categoria = key
+        start, end = _month_range(year, month)
+        total, count, min_valor, max_valor = connection.execute(
+            select(
+                func.sum(Transaction.valor),
+                func.count(Transaction.id),
+                func.min(Transaction.valor),
+                func.max(Transaction.valor)
+            ).where(
+                Transaction.status == ROLLUP_STATUS,
+                Transaction.data_transacao >= start,
+                Transaction.data_transacao < end,
+                Transaction.categoria == categoria,
+                Transaction.user_id == user_id
+            )
+        ).one()
+
+        key_conditions = and_(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.year == year,
+            MonthlyRollup.month == month,
+            MonthlyRollup.categoria == categoria
+        )
+        if not count:
+            connection.execute(delete(MonthlyRollup).where(key_conditions))
+            return
+
+        statement = sqlite_insert(MonthlyRollup).values(
+            user_id=user_id, year=year, month=month, categoria=categoria,
+            total=total, count=count, min_valor=min_valor, max_valor=max_valor
+        )
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[MonthlyRollup.user_id, MonthlyRollup.year, MonthlyRollup.month, MonthlyRollup.categoria],
+            set_={
+                "total": statement.excluded.total,
+                "count": statement.excluded.count,
+                "min_valor": statement.excluded.min_valor,
+                "max_valor": statement.excluded.max_valor,
+                "updated_at": func.now()
+            }
+        ))
+
+    @staticmethod
+    def _expected_rows():
+        """Consulta agregada das transações no formato da tabela de totais"""
+        year = extract("year", Transaction.data_transacao)
+        month = extract("month", Transaction.data_transacao)
+        return (
+            select(
+                Transaction.user_id,
+                year,
+                month,
+                Transaction.categoria,
+                func.sum(Transaction.valor),
+                func.count(Transaction.id),
+                func.min(Transaction.valor),
+                func.max(Transaction.valor)
+            )
+            .where(Transaction.status == ROLLUP_STATUS)
+            .group_by(Transaction.user_id, year, month, Transaction.categoria)
+        )
+
+    def rebuild(self, connection) -> int:
+        """Reconstruir todos os totais a partir das transações; retorna o número de grupos"""
+        connection.execute(delete(MonthlyRollup))
+        connection.execute(
+            MonthlyRollup.__table__.insert().from_select(
+                ["user_id", "year", "month", "categoria", "total", "count", "min_valor", "max_valor"],
+                self._expected_rows()
+            )
+        )
+        groups = connection.execute(select(func.count(MonthlyRollup.id))).scalar()
+        logger.info(f"🧮 Totais mensais reconstruídos: {groups} grupos")
+        return groups
+
+    def verify(self, connection) -> List[str]:
+        """Diferenças entre os totais gravados e os recalculados das transações"""
+        def normalize(row):
+            user_id, year, month, categoria, total, count, min_valor, max_valor = row
+            values = tuple(round(Decimal(str(value)), 2) if value is not None else None for value in (total, min_valor, max_valor))
+            return (int(user_id), int(year), int(month), categoria), (values[0], int(count), values[1], values[2])
+
+        expected = dict(normalize(row) for row in connection.execute(self._expected_rows()))
+        stored = dict(normalize(row) for row in connection.execute(
+            select(
+                MonthlyRollup.user_id, MonthlyRollup.year, MonthlyRollup.month, MonthlyRollup.categoria,
+                MonthlyRollup.total, MonthlyRollup.count, MonthlyRollup.min_valor, MonthlyRollup.max_valor
+            )
+        ))
+
+        differences = []
+        for key in sorted(set(expected) | set(stored)):
+            if expected.get(key) != stored.get(key):
+                differences.append(f"{key}: esperado {expected.get(key)}, gravado {stored.get(key)}")
+        return differences
+
+    def prepare(self, connection):
+        """Preencher a tabela quando estiver vazia e ativar a manutenção incremental"""
+        empty = connection.execute(select(func.count(MonthlyRollup.id))).scalar() == 0
+        has_transactions = connection.execute(
+            select(func.count(Transaction.id)).where(Transaction.status == ROLLUP_STATUS)
+        ).scalar() > 0
+        if empty and has_transactions:
+            self.rebuild(connection)
+        self.enabled = True
+
+
+monthly_rollups = MonthlyRollupMaintainer()
+
+event.listen(Session, "after_flush", monthly_rollups.after_flush)
+
@@ -0,0 +1,35 @@
+"""
+Verificação e reconstrução da tabela de totais mensais
+
+Uso: python -m database.rollups_cli verify|rebuild
+"""
+
+import argparse
+
+from database.models import Base
+from database.rollups import monthly_rollups
+from database.sqlite_db import sync_engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificar ou reconstruir os totais mensais")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    args = parser.parse_args()
+
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as connection:
+        if args.command == "rebuild":
+            monthly_rollups.rebuild(connection)
+
+        differences = monthly_rollups.verify(connection)
+
+    if differences:
+        print(f"❌ {len(differences)} grupo(s) divergente(s):")
+        for difference in differences:
+            print(f"  {difference}")
+        raise SystemExit(1)
+    print("✅ Totais mensais consistentes com as transações")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,100 @@
 Configuração do banco SQLite
 """
 
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, Optional, Tuple
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, event, inspect, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from loguru import logger
 
 from config.settings import get_settings
 from database.models import Base
+from database.rollups import monthly_rollups
 
 
 settings = get_settings()
 
-sync_engine = create_engine(
-    settings.database_url,
-    echo=settings.debug,
-    connect_args={"check_same_thread": False}
-)
+# Aplicados em cada nova conexão; journal_mode=WAL persiste no arquivo e permite
+# leituras concorrentes com o escritor
+PRAGMA_PROFILES: Dict[str, Dict[str, str]] = {
+    "default": {},
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": "5000"
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": "-64000",
+        "mmap_size": "268435456",
+        "temp_store": "MEMORY",
+        "busy_timeout": "5000"
+    }
+}
+
+
+def resolve_pragmas(profile: str, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Pragmas do perfil com as substituições configuradas"""
+    if profile not in PRAGMA_PROFILES:
+        logger.warning(f"⚠️ Perfil de pragmas '{profile}' desconhecido, usando 'default'")
+        profile = "default"
+    return {**PRAGMA_PROFILES[profile], **(overrides or {})}
+
+
+def apply_pragmas(engine: Engine, pragmas: Dict[str, str]):
+    """Registrar a aplicação dos pragmas em cada conexão aberta pelo engine"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def create_engines(database_url: str, pragmas: Dict[str, str], echo: bool = False) -> Tuple[Engine, AsyncEngine]:
+    """Engines síncrono e assíncrono com os mesmos pragmas e limites de pool"""
+    pool_options = {}
+    sync_pool, async_pool = {}, {}
+    if ":memory:" not in database_url:
+        pool_options = {
+            "pool_size": settings.sqlite_pool_size,
+            "max_overflow": settings.sqlite_max_overflow,
+            "pool_timeout": settings.sqlite_pool_timeout_seconds
+        }
+        # o aiosqlite usa NullPool por padrão em arquivos, que não aceita limites de pool
+        sync_pool = {"poolclass": QueuePool}
+        async_pool = {"poolclass": AsyncAdaptedQueuePool}
 
-async_engine = create_async_engine(
-    settings.database_url.replace("sqlite://", "sqlite+aiosqlite://"),
+    sync = create_engine(
+        database_url,
+        echo=echo,
+        connect_args={"check_same_thread": False},
+        **sync_pool,
+        **pool_options
+    )
+    async_ = create_async_engine(
+        database_url.replace("sqlite://", "sqlite+aiosqlite://"),
+        echo=echo,
+        **async_pool,
+        **pool_options
+    )
+
+    apply_pragmas(sync, pragmas)
+    apply_pragmas(async_.sync_engine, pragmas)
+    return sync, async_
+
+
+sync_engine, async_engine = create_engines(
+    settings.database_url,
+    resolve_pragmas(settings.sqlite_pragma_profile, settings.sqlite_pragmas),
     echo=settings.debug
 )
 
@@ -42,6 +116,41 @@ async def init_database():
     """Inicializar banco de dados"""
     async with async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(monthly_rollups.prepare)
+
+
+def _add_missing_columns(connection):
+    """Adicionar colunas novas dos modelos em tabelas que já existiam"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            elif not column.nullable:
+                logger.warning(f"⚠️ Coluna {table.name}.{column.name} é obrigatória e não tem default, não adicionada")
+                continue
+
+            connection.execute(text(ddl))
+            logger.info(f"🛠️ Coluna {table.name}.{column.name} adicionada")
+
+
+def _create_missing_indexes(connection):
+    """Criar índices declarados nos modelos em tabelas que já existiam"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(connection, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"⚠️ Não foi possível criar índice {index.name}: {e}")
 
 
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
@@ -4,29 +4,39 @@ Sistema de controle financeiro pessoal via Telegram com IA
 Author: João Pedro Lazarim
 """
 
+import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
+from typing import Optional
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import uvicorn
 
 from config.settings import get_settings
 from config.logging_config import setup_logging
 from bot.telegram_bot import TelegramFinanceBot
+from bot.update_queue import UpdateQueue
+from bot.admission import AdmissionController
 from database.sqlite_db import init_database
+from services.metrics_service import metrics_service
+from services.sheets_service import sheets_service
+from services.openai_service import openai_service
 
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
 bot_instance = None
+update_queue = None
+admission = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gerenciar lifecycle da aplicação"""
-    global bot_instance
+    global bot_instance, update_queue, admission
 
     try:
         logger.info("🔄 Iniciando Telegram Finance Bot...")
@@ -38,12 +48,32 @@ async def lifespan(app: FastAPI):
         await bot_instance.setup()
         logger.info("✅ Bot configurado com sucesso")
 
+        admission = AdmissionController(
+            max_inflight=settings.max_inflight_updates,
+            max_queue_wait=settings.max_queue_wait_seconds,
+            policy=settings.load_shedding_policy,
+            max_deferred=settings.max_deferred_updates
+        )
+
+        if settings.webhook_mode == "queue":
+            # um worker basta: ele só entrega o update ao chat, sem aguardar o processamento
+            update_queue = UpdateQueue(
+                process_queued_update,
+                max_size=settings.update_queue_max_size,
+                workers=1
+            )
+            await update_queue.start()
+
         yield
 
     except Exception as e:
         logger.error(f"❌ Erro durante startup: {e}")
         raise
     finally:
+        if update_queue:
+            await update_queue.stop()
+        if bot_instance:
+            await bot_instance.dispatcher.drain()
         if bot_instance:
             await bot_instance.stop()
         logger.info("👋🏻 Aplicação finalizada")
@@ -68,15 +98,60 @@ async def root():
     }
 
 
+def pending_updates() -> int:
+    """Updates recebidos pela fila e ainda não concluídos: na fila ou aguardando a vez do chat"""
+    return update_queue.stats()["depth"] + bot_instance.dispatcher.backlog
+
+
 @app.get("/health")
 async def health_check():
     """Health check detalhado"""
-    return {
+    health = {
         "status": "healthy",
         "bot_status": "active" if bot_instance else "inactive",
-        "database": "connected"
+        "database": "connected",
+        "webhook_mode": settings.webhook_mode
     }
 
+    if admission:
+        health["admission"] = admission.stats()
+
+    if bot_instance:
+        health["dispatcher"] = bot_instance.dispatcher.stats()
+        health["update_filter"] = bot_instance.update_filter.stats()
+        health["sheets"] = sheets_service.startup_status()
+        health["ai_cache"] = openai_service.cache_stats()
+        health["ai_upstream"] = openai_service.llm_guard.stats()
+        if openai_service.batcher:
+            health["ai_batching"] = openai_service.batcher.stats()
+
+    if update_queue:
+        queue_stats = update_queue.stats()
+        health["update_queue"] = {
+            "depth": pending_updates(),
+            "max_size": queue_stats["max_size"],
+            "enqueued": queue_stats["enqueued"],
+            "rejected": queue_stats["rejected"],
+            "failed": queue_stats["failed"]
+        }
+
+    return health
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato Prometheus"""
+    if update_queue:
+        metrics_service.set_gauge("update_queue_depth", pending_updates())
+
+    if admission:
+        metrics_service.set_gauge("admission_inflight", admission.stats()["inflight"])
+
+    if bot_instance:
+        metrics_service.set_gauge("dispatcher_active_updates", bot_instance.dispatcher.stats()["active_updates"])
+
+    return PlainTextResponse(metrics_service.render(), media_type="text/plain; version=0.0.4")
+
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
@@ -85,18 +160,98 @@ async def telegram_webhook(request: Request):
         if not bot_instance:
             raise HTTPException(status_code=500, detail="Bot not initialized")
 
-        update_data = await request.json()
+        try:
+            update_data = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+        if not isinstance(update_data, dict) or not isinstance(update_data.get("update_id"), int):
+            raise HTTPException(status_code=400, detail="Invalid Telegram update")
+
         logger.info(f"Received webhook update: {update_data.get('update_id')}")
 
-        await bot_instance.process_update(update_data)
+        if not bot_instance.update_filter.accepts(update_data):
+            return JSONResponse({"status": "ignored"})
+
+        if update_queue:
+            # a fila entrega aos chats sem esperar o processamento; o limite cobre os dois estágios
+            if pending_updates() >= settings.update_queue_max_size or not update_queue.enqueue(update_data):
+                raise HTTPException(
+                    status_code=503,
+                    detail="Update queue full",
+                    headers={"Retry-After": str(settings.shed_retry_after_seconds)}
+                )
+            return JSONResponse({"status": "queued"})
+
+        decision = asyncio.get_running_loop().create_future()
+        received_at = time.monotonic()
+        future = bot_instance.submit_update(
+            update_data, gate=lambda: admitted_slot(update_data, received_at, decision)
+        )
+        if future is None:
+            return JSONResponse({"status": "ok"})
+
+        await asyncio.wait({future, decision}, return_when=asyncio.FIRST_COMPLETED)
+        if decision.done() and decision.result() == "shed":
+            raise HTTPException(
+                status_code=503,
+                detail="Too many updates in flight",
+                headers={"Retry-After": str(settings.shed_retry_after_seconds)}
+            )
+        if decision.done() and decision.result() == "deferred":
+            return JSONResponse({"status": "deferred"})
 
+        await future
         return JSONResponse({"status": "ok"})
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no webhook: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@asynccontextmanager
+async def admitted_slot(update_data: dict, received_at: float, decision: Optional[asyncio.Future] = None):
+    """Vaga de processamento, pedida quando chega a vez do update no seu chat
+
+    O prazo de espera conta desde o recebimento. Sem vaga a tempo, o update é
+    descartado com 503 (política "retry" ou limite de adiados atingido) ou adiado
+    com aviso ao usuário, mantendo seu lugar na ordem do chat. Sem `decision`
+    (updates da fila, já respondidos ao Telegram) ele é sempre adiado. Produz
+    False quando o update não deve ser processado.
+    """
+    def decide(outcome: str):
+        if decision is not None and not decision.done():
+            decision.set_result(outcome)
+
+    if await admission.acquire(timeout=settings.max_queue_wait_seconds - (time.monotonic() - received_at)):
+        decide("admitted")
+    elif decision is not None and (admission.policy == "retry" or not admission.can_defer()):
+        decide("shed")
+        yield False
+        return
+    else:
+        decide("deferred")
+        await bot_instance.send_deferred_notice(update_data)
+        await admission.acquire_deferred()
+
+    try:
+        yield True
+    finally:
+        admission.release()
+
+
+async def process_queued_update(update_data: dict, queued_for: float):
+    """Entregar update retirado da fila ao seu chat, sem aguardar o processamento
+
+    Na fila o webhook já respondeu ao Telegram, então um update que estourou o
+    tempo de espera é sempre adiado (com aviso ao usuário) em vez de reentregue.
+    """
+    received_at = time.monotonic() - queued_for
+    bot_instance.submit_update(update_data, gate=lambda: admitted_slot(update_data, received_at))
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
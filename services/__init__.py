@@ -5,6 +5,14 @@ Services package - Business logic and external integrations
 from .openai_service import openai_service, OpenAIService
 from .sheets_service import sheets_service, GoogleSheetsService
 from .database_service import database_service, DatabaseService
+from .idempotency_service import idempotency_service, IdempotencyService
+from .metrics_service import metrics_service, MetricsService
+from .local_parser import local_parser, LocalTransactionParser
+from .category_classifier import category_classifier, NaiveBayesCategoryClassifier
+from .interpretation_batcher import InterpretationBatcher
+from .insights_cache_service import insights_cache_service, InsightsCacheService
+from .llm_guard import LLMGuard, LLMUnavailableError
+from .transaction_writer import transaction_writer, TransactionWriter
 
 __all__ = [
     'openai_service',
@@ -12,5 +20,20 @@ __all__ = [
     'sheets_service',
     'GoogleSheetsService',
     'database_service',
-    'DatabaseService'
+    'DatabaseService',
+    'idempotency_service',
+    'IdempotencyService',
+    'metrics_service',
+    'MetricsService',
+    'local_parser',
+    'LocalTransactionParser',
+    'category_classifier',
+    'NaiveBayesCategoryClassifier',
+    'InterpretationBatcher',
+    'insights_cache_service',
+    'InsightsCacheService',
+    'LLMGuard',
+    'LLMUnavailableError',
+    'transaction_writer',
+    'TransactionWriter'
 ]
@@ -0,0 +1,166 @@
+"""
+Classificador de categorias Naive Bayes treinado no histórico de transações
+"""
+
+import asyncio
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import select
+
+from config.settings import get_settings
+from database.sqlite_db import get_db_session
+from database.models import Transaction
+from models.schemas import ExpenseCategory
+from utils.normalization import canonicalize_message
+
+
+MODEL_VERSION = 1
+
+
+def extract_features(text: str) -> List[str]:
+    """Unigramas e bigramas da mensagem canônica, sem números"""
+    tokens = [token for token in canonicalize_message(text).split() if len(token) > 1 and not token[0].isdigit()]
+    bigrams = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return tokens + bigrams
+
+
+class NaiveBayesCategoryClassifier:
+    """Naive Bayes multinomial com atualização incremental"""
+
+    def __init__(self, model_path: Optional[str] = None, save_every: int = 20):
+        self.settings = get_settings()
+        self.model_path = model_path or self.settings.category_model_path
+        self.save_every = save_every
+
+        self.doc_counts: Dict[str, int] = {}
+        self.feature_counts: Dict[str, Dict[str, int]] = {}
+        self.feature_totals: Dict[str, int] = {}
+        self.vocabulary: set = set()
+        self._unsaved_updates = 0
+
+    @property
+    def total_documents(self) -> int:
+        return sum(self.doc_counts.values())
+
+    def learn(self, text: str, categoria: str):
+        """Atualizar contagens com um exemplo rotulado"""
+        features = extract_features(text)
+        if not features:
+            return
+
+        self.doc_counts[categoria] = self.doc_counts.get(categoria, 0) + 1
+        counts = self.feature_counts.setdefault(categoria, {})
+        for feature in features:
+            counts[feature] = counts.get(feature, 0) + 1
+            self.vocabulary.add(feature)
+        self.feature_totals[categoria] = self.feature_totals.get(categoria, 0) + len(features)
+        self._unsaved_updates += 1
+
+    def predict(self, text: str) -> Optional[Tuple[ExpenseCategory, float]]:
+        """Categoria mais provável e sua probabilidade; None sem evidência conhecida"""
+        features = [feature for feature in extract_features(text) if feature in self.vocabulary]
+        if not features or not self.doc_counts:
+            return None
+
+        total_documents = self.total_documents
+        vocabulary_size = len(self.vocabulary)
+        scores = {}
+        for categoria, doc_count in self.doc_counts.items():
+            counts = self.feature_counts.get(categoria, {})
+            denominator = self.feature_totals.get(categoria, 0) + vocabulary_size
+            score = math.log(doc_count / total_documents)
+            for feature in features:
+                score += math.log((counts.get(feature, 0) + 1) / denominator)
+            scores[categoria] = score
+
+        best = max(scores, key=scores.get)
+        # softmax estável sobre os log-scores
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+
+        try:
+            return ExpenseCategory(best), 1 / normalizer
+        except ValueError:
+            return None
+
+    async def learn_and_persist(self, text: str, categoria: str):
+        """Aprender um exemplo e salvar o modelo a cada N atualizações"""
+        self.learn(text, categoria)
+        if self._unsaved_updates >= self.save_every:
+            await self.save()
+
+    async def train_from_database(self):
+        """Treinar do zero com todas as transações processadas"""
+        self.reset()
+
+        async for db in get_db_session():
+            result = await db.execute(
+                select(Transaction.descricao, Transaction.original_message, Transaction.categoria)
+                .where(Transaction.status == "processed")
+            )
+            for descricao, original_message, categoria in result:
+                self.learn(f"{descricao} {original_message}", categoria)
+
+        logger.info(f"✅ Classificador de categorias treinado com {self.total_documents} transações")
+
+    async def load_or_train(self):
+        """Carregar modelo salvo; se não existir ou for inválido, treinar pelo banco"""
+        try:
+            if await asyncio.to_thread(self._load):
+                logger.info(f"✅ Classificador de categorias carregado ({self.total_documents} exemplos)")
+                return
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Modelo de categorias inválido, retreinando: {e}")
+
+        await self.train_from_database()
+        await self.save()
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.model_path):
+            return False
+
+        with open(self.model_path, encoding="utf-8") as model_file:
+            data = json.load(model_file)
+
+        if data.get("version") != MODEL_VERSION:
+            return False
+
+        self.reset()
+        self.doc_counts = data["doc_counts"]
+        self.feature_counts = data["feature_counts"]
+        self.feature_totals = {categoria: sum(counts.values()) for categoria, counts in self.feature_counts.items()}
+        self.vocabulary = {feature for counts in self.feature_counts.values() for feature in counts}
+        return True
+
+    async def save(self):
+        """Persistir contagens em disco"""
+        data = {
+            "version": MODEL_VERSION,
+            "doc_counts": dict(self.doc_counts),
+            "feature_counts": {categoria: dict(counts) for categoria, counts in self.feature_counts.items()}
+        }
+        try:
+            await asyncio.to_thread(self._write, data)
+            self._unsaved_updates = 0
+        except OSError as e:
+            logger.warning(f"❌ Erro ao salvar modelo de categorias: {e}")
+
+    def _write(self, data: dict):
+        temporary_path = f"{self.model_path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as model_file:
+            json.dump(data, model_file, ensure_ascii=False)
+        os.replace(temporary_path, self.model_path)
+
+    def reset(self):
+        """Descartar todo o aprendizado"""
+        self.doc_counts = {}
+        self.feature_counts = {}
+        self.feature_totals = {}
+        self.vocabulary = set()
+        self._unsaved_updates = 0
+
+
+category_classifier = NaiveBayesCategoryClassifier()
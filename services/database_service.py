@@ -3,13 +3,34 @@ Serviço de consultas ao banco de dados SQLite
 Fonte principal para todos os relatórios e análises
 """
 
-from datetime import datetime
-from typing import Dict, Any, List
+import hashlib
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy import select, func, extract, and_
 from loguru import logger
 
 from database.sqlite_db import get_db_session
-from database.models import Transaction
+from database.models import Transaction, MonthlyRollup
+from database.rollups import monthly_rollups
+
+
+MONTH_NAMES = [
+    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
+]
+
+
+@dataclass
+class _AggregateSource:
+    """Expressões usadas pelos relatórios agregados, independentes da tabela de origem"""
+    categoria: Any
+    month: Any
+    total: Any
+    count: Any
+    maior: Any
+    menor: Any
+    conditions: list
 
 
 class DatabaseService:
@@ -24,20 +45,15 @@ class DatabaseService:
                 year = year or now.year
 
             async for db in get_db_session():
+                source = self._aggregate_source(year, month)
                 result = await db.execute(
                     select(
-                        Transaction.categoria,
-                        func.sum(Transaction.valor).label('total'),
-                        func.count(Transaction.id).label('count')
-                    )
-                    .where(
-                        and_(
-                            extract('month', Transaction.data_transacao) == month,
-                            extract('year', Transaction.data_transacao) == year,
-                            Transaction.status == 'processed'
-                        )
+                        source.categoria,
+                        source.total.label('total'),
+                        source.count.label('count')
                     )
-                    .group_by(Transaction.categoria)
+                    .where(and_(*source.conditions))
+                    .group_by(source.categoria)
                 )
                 
                 categorias = {}
@@ -55,14 +71,8 @@ class DatabaseService:
                     if categoria != "Finanças":
                         total_geral += valor
 
-                meses_pt = [
-                    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
-                    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
-                ]
-                mes_nome = meses_pt[month - 1]
-
                 return {
-                    "mes": mes_nome,
+                    "mes": MONTH_NAMES[month - 1],
                     "total": total_geral,
                     "transacoes": total_transacoes,
                     "categorias": categorias
@@ -73,31 +83,31 @@ class DatabaseService:
             return {"mes": "Erro", "total": 0, "transacoes": 0, "categorias": {}}
 
     async def get_yearly_summary(self, year: int = None) -> Dict[str, Any]:
-        """Obter resumo anual do banco SQLite"""
+        """Obter resumo anual do banco SQLite em uma única consulta agrupada por mês e categoria"""
         try:
             if year is None:
                 year = datetime.now().year
 
+            source = self._aggregate_source(year)
+            month_column = source.month.label('month')
+
             async for db in get_db_session():
                 result = await db.execute(
                     select(
-                        Transaction.categoria,
-                        func.sum(Transaction.valor).label('total'),
-                        func.count(Transaction.id).label('count')
+                        month_column,
+                        source.categoria,
+                        source.total.label('total'),
+                        source.count.label('count')
                     )
-                    .where(
-                        and_(
-                            extract('year', Transaction.data_transacao) == year,
-                            Transaction.status == 'processed'
-                        )
-                    )
-                    .group_by(Transaction.categoria)
+                    .where(and_(*source.conditions))
+                    .group_by(month_column, source.categoria)
+                    .order_by(month_column, source.categoria)
                 )
                 
-                categorias_totais = {}
-                total_gastos = 0
-                total_financas = 0
+                # somas anuais por categoria em Decimal, como se viessem de um GROUP BY categoria
+                somas_categorias = {}
                 total_transacoes = 0
+                meses = {}
                 
                 for row in result:
                     categoria = row.categoria
@@ -105,18 +115,28 @@ class DatabaseService:
                     count = row.count
                     
                     total_transacoes += count
-                    
+                    somas_categorias[categoria] = somas_categorias.get(categoria, 0) + row.total
+
+                    resumo_mensal = meses.setdefault(row.month, {
+                        "mes": MONTH_NAMES[row.month - 1],
+                        "total": 0,
+                        "transacoes": 0,
+                        "categorias": {}
+                    })
+                    resumo_mensal["categorias"][categoria] = valor
+                    resumo_mensal["transacoes"] += count
+                    if categoria != "Finanças":
+                        resumo_mensal["total"] += valor
+
+                categorias_totais = {}
+                total_gastos = 0
+                total_financas = 0
+                for categoria, soma in sorted(somas_categorias.items()):
                     if categoria == "Finanças":
-                        total_financas += valor
+                        total_financas += float(soma)
                     else:
-                        total_gastos += valor
-                        categorias_totais[categoria] = valor
-
-                dados_mensais = []
-                for month in range(1, 13):
-                    resumo_mensal = await self.get_monthly_summary(month, year)
-                    if resumo_mensal["transacoes"] > 0:
-                        dados_mensais.append(resumo_mensal)
+                        total_gastos += float(soma)
+                        categorias_totais[categoria] = float(soma)
 
                 return {
                     "periodo": "anual",
@@ -125,58 +145,121 @@ class DatabaseService:
                     "total_financas": total_financas,
                     "total_transacoes": total_transacoes,
                     "categorias_totais": categorias_totais,
-                    "dados_mensais": dados_mensais
+                    "dados_mensais": list(meses.values())
                 }
 
         except Exception as e:
             logger.error(f"❌ Erro ao obter resumo anual: {e}")
             return {"error": str(e)}
 
-    async def get_transactions_for_period(self, period_type: str, period_value: str = None) -> List[Dict[str, Any]]:
-        """Obter transações para um período específico (para insights)"""
+    def _resolve_period(self, period_type: str, period_value: str = None) -> Optional[Tuple[int, Optional[int]]]:
+        """Ano e mês (None para anual) de um período de insights"""
+        now = datetime.now()
+        if period_type == "monthly":
+            if period_value:
+                months = {name: number for number, name in enumerate(MONTH_NAMES, start=1)}
+                return now.year, months.get(period_value, now.month)
+            return now.year, now.month
+
+        if period_type == "yearly":
+            return now.year, None
+
+        return None
+
+    def _period_conditions(self, period_type: str, period_value: str = None) -> Optional[list]:
+        """Filtros SQL das transações processadas de um período"""
+        period = self._resolve_period(period_type, period_value)
+        if period is None:
+            return None
+
+        return self._range_conditions(*self._date_range(*period))
+
+    def _aggregate_source(self, year: int, month: int = None) -> _AggregateSource:
+        """Colunas agregadas e filtros do período: totais mensais quando mantidos, senão transações"""
+        if monthly_rollups.enabled:
+            conditions = [MonthlyRollup.year == year]
+            if month is not None:
+                conditions.append(MonthlyRollup.month == month)
+            return _AggregateSource(
+                categoria=MonthlyRollup.categoria,
+                month=MonthlyRollup.month,
+                total=func.sum(MonthlyRollup.total),
+                count=func.sum(MonthlyRollup.count),
+                maior=func.max(MonthlyRollup.max_valor),
+                menor=func.min(MonthlyRollup.min_valor),
+                conditions=conditions
+            )
+
+        return _AggregateSource(
+            categoria=Transaction.categoria,
+            month=extract('month', Transaction.data_transacao),
+            total=func.sum(Transaction.valor),
+            count=func.count(Transaction.id),
+            maior=func.max(Transaction.valor),
+            menor=func.min(Transaction.valor),
+            conditions=self._range_conditions(*self._date_range(year, month))
+        )
+
+    @staticmethod
+    def _date_range(year: int, month: int = None) -> Tuple[date, date]:
+        """Intervalo semiaberto [início, fim) de um mês ou, sem mês, do ano inteiro"""
+        if month is None:
+            return date(year, 1, 1), date(year + 1, 1, 1)
+        if month == 12:
+            return date(year, 12, 1), date(year + 1, 1, 1)
+        return date(year, month, 1), date(year, month + 1, 1)
+
+    @staticmethod
+    def _range_conditions(start: date, end: date) -> list:
+        """Filtros das transações processadas no intervalo, usando o índice (status, data_transacao)"""
+        return [
+            Transaction.status == 'processed',
+            Transaction.data_transacao >= start,
+            Transaction.data_transacao < end
+        ]
+
+    async def get_period_fingerprint(self, period_type: str, period_value: str = None) -> Optional[Tuple[str, str]]:
+        """Chave do período e impressão digital dos seus dados (contagem, soma, última alteração)"""
+        period = self._resolve_period(period_type, period_value)
+        if period is None:
+            return None
+
+        year, month = period
+        period_key = f"{year}-{month:02d}" if month else str(year)
+
         try:
             async for db in get_db_session():
-                if period_type == "monthly":
-                    if period_value:
-                        meses_pt = {
-                            "Janeiro": 1, "Fevereiro": 2, "Março": 3, "Abril": 4,
-                            "Maio": 5, "Junho": 6, "Julho": 7, "Agosto": 8,
-                            "Setembro": 9, "Outubro": 10, "Novembro": 11, "Dezembro": 12
-                        }
-                        month = meses_pt.get(period_value, datetime.now().month)
-                        year = datetime.now().year
-                    else:
-                        now = datetime.now()
-                        month = now.month
-                        year = now.year
-
-                    result = await db.execute(
-                        select(Transaction)
-                        .where(
-                            and_(
-                                extract('month', Transaction.data_transacao) == month,
-                                extract('year', Transaction.data_transacao) == year,
-                                Transaction.status == 'processed'
-                            )
-                        )
-                        .order_by(Transaction.data_transacao.desc())
+                result = await db.execute(
+                    select(
+                        func.count(Transaction.id),
+                        func.sum(Transaction.valor),
+                        func.max(Transaction.updated_at),
+                        func.max(Transaction.id)
                     )
+                    .where(and_(*self._period_conditions(period_type, period_value)))
+                )
+                count, total, last_update, last_id = result.one()
 
-                elif period_type == "yearly":
-                    year = datetime.now().year
-                    result = await db.execute(
-                        select(Transaction)
-                        .where(
-                            and_(
-                                extract('year', Transaction.data_transacao) == year,
-                                Transaction.status == 'processed'
-                            )
-                        )
-                        .order_by(Transaction.data_transacao.desc())
-                    )
+                raw = f"{period_key}|{count}|{total or 0}|{last_update}|{last_id}"
+                return period_key, hashlib.sha256(raw.encode()).hexdigest()
 
-                else:
-                    return []
+        except Exception as e:
+            logger.error(f"❌ Erro ao calcular impressão digital do período: {e}")
+            return None
+
+    async def get_transactions_for_period(self, period_type: str, period_value: str = None) -> List[Dict[str, Any]]:
+        """Obter transações para um período específico (para insights)"""
+        try:
+            conditions = self._period_conditions(period_type, period_value)
+            if conditions is None:
+                return []
+
+            async for db in get_db_session():
+                result = await db.execute(
+                    select(Transaction)
+                    .where(and_(*conditions))
+                    .order_by(Transaction.data_transacao.desc())
+                )
 
                 transactions = []
                 for transaction in result.scalars():
@@ -202,23 +285,18 @@ class DatabaseService:
                 year = datetime.now().year
 
             async for db in get_db_session():
+                source = self._aggregate_source(year)
                 result = await db.execute(
                     select(
-                        Transaction.categoria,
-                        func.sum(Transaction.valor).label('total'),
-                        func.count(Transaction.id).label('transacoes'),
-                        func.avg(Transaction.valor).label('media'),
-                        func.max(Transaction.valor).label('maior'),
-                        func.min(Transaction.valor).label('menor')
+                        source.categoria,
+                        source.total.label('total'),
+                        source.count.label('transacoes'),
+                        source.maior.label('maior'),
+                        source.menor.label('menor')
                     )
-                    .where(
-                        and_(
-                            extract('year', Transaction.data_transacao) == year,
-                            Transaction.status == 'processed'
-                        )
-                    )
-                    .group_by(Transaction.categoria)
-                    .order_by(func.sum(Transaction.valor).desc())
+                    .where(and_(*source.conditions))
+                    .group_by(source.categoria)
+                    .order_by(source.total.desc())
                 )
 
                 analise = {}
@@ -226,7 +304,7 @@ class DatabaseService:
                     analise[row.categoria] = {
                         "total": float(row.total),
                         "transacoes": row.transacoes,
-                        "media": float(row.media),
+                        "media": float(row.total) / row.transacoes,
                         "maior_gasto": float(row.maior),
                         "menor_gasto": float(row.menor)
                     }
@@ -237,14 +315,35 @@ class DatabaseService:
             logger.error(f"❌ Erro na análise por categoria: {e}")
             return {}
 
+    async def get_transaction_by_message(self, chat_id: int, message_id: int) -> Optional[Transaction]:
+        """Buscar transação já registrada para uma mensagem do Telegram"""
+        try:
+            async for db in get_db_session():
+                result = await db.execute(
+                    select(Transaction).where(
+                        and_(
+                            Transaction.chat_id == chat_id,
+                            Transaction.message_id == message_id
+                        )
+                    )
+                )
+                return result.scalar_one_or_none()
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar transação da mensagem: {e}")
+            return None
+
     async def get_database_stats(self) -> Dict[str, Any]:
         """Estatísticas gerais do banco de dados"""
         try:
             async for db in get_db_session():
-                total_result = await db.execute(
-                    select(func.count(Transaction.id))
-                    .where(Transaction.status == 'processed')
-                )
+                if monthly_rollups.enabled:
+                    total_result = await db.execute(select(func.coalesce(func.sum(MonthlyRollup.count), 0)))
+                else:
+                    total_result = await db.execute(
+                        select(func.count(Transaction.id))
+                        .where(Transaction.status == 'processed')
+                    )
                 total_transacoes = total_result.scalar()
 
                 date_result = await db.execute(
@@ -256,15 +355,20 @@ class DatabaseService:
                 )
                 dates = date_result.first()
 
-                valor_result = await db.execute(
-                    select(func.sum(Transaction.valor))
-                    .where(
-                        and_(
-                            Transaction.status == 'processed',
-                            Transaction.categoria != 'Finanças'
+                if monthly_rollups.enabled:
+                    valor_result = await db.execute(
+                        select(func.sum(MonthlyRollup.total)).where(MonthlyRollup.categoria != 'Finanças')
+                    )
+                else:
+                    valor_result = await db.execute(
+                        select(func.sum(Transaction.valor))
+                        .where(
+                            and_(
+                                Transaction.status == 'processed',
+                                Transaction.categoria != 'Finanças'
+                            )
                         )
                     )
-                )
                 total_gasto = valor_result.scalar() or 0
 
                 return {
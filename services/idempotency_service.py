@@ -0,0 +1,103 @@
+"""
+Serviço de idempotência para updates reentregues pelo Telegram
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from loguru import logger
+
+from config.settings import get_settings
+from database.sqlite_db import get_db_session
+from database.models import ProcessedUpdate
+
+
+class IdempotencyService:
+    """Registro expirável de update_ids já processados"""
+
+    PURGE_EVERY = 500
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.ttl = timedelta(hours=self.settings.processed_update_ttl_hours)
+        self._in_flight: Set[int] = set()
+        self._marks_since_purge = 0
+
+    def claim(self, update_id: int) -> bool:
+        """Reservar update em processamento; False se já houver uma entrega em andamento"""
+        if update_id in self._in_flight:
+            return False
+        self._in_flight.add(update_id)
+        return True
+
+    def release(self, update_id: int):
+        """Liberar reserva do update"""
+        self._in_flight.discard(update_id)
+
+    async def is_processed(self, update_id: int) -> bool:
+        """Verificar se o update já foi processado anteriormente"""
+        try:
+            async for db in get_db_session():
+                result = await db.execute(
+                    select(ProcessedUpdate.update_id).where(
+                        ProcessedUpdate.update_id == update_id,
+                        ProcessedUpdate.expires_at > datetime.now()
+                    )
+                )
+                return result.scalar_one_or_none() is not None
+
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao verificar update processado: {e}")
+
+        return False
+
+    async def mark_processed(self, update_id: int, chat_id: Optional[int] = None, message_id: Optional[int] = None):
+        """Registrar update como processado"""
+        try:
+            async for db in get_db_session():
+                expires_at = datetime.now() + self.ttl
+                await db.execute(
+                    sqlite_insert(ProcessedUpdate)
+                    .values(
+                        update_id=update_id,
+                        chat_id=chat_id,
+                        message_id=message_id,
+                        expires_at=expires_at
+                    )
+                    .on_conflict_do_update(
+                        index_elements=[ProcessedUpdate.update_id],
+                        set_={"expires_at": expires_at}
+                    )
+                )
+                await db.commit()
+
+            self._marks_since_purge += 1
+            if self._marks_since_purge >= self.PURGE_EVERY:
+                await self.purge_expired()
+
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao registrar update processado: {e}")
+
+    async def purge_expired(self) -> int:
+        """Remover registros expirados"""
+        self._marks_since_purge = 0
+        try:
+            async for db in get_db_session():
+                result = await db.execute(
+                    delete(ProcessedUpdate).where(ProcessedUpdate.expires_at <= datetime.now())
+                )
+                await db.commit()
+
+                if result.rowcount:
+                    logger.info(f"🧹 {result.rowcount} updates processados expirados removidos")
+                return result.rowcount
+
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao remover updates expirados: {e}")
+
+        return 0
+
+
+idempotency_service = IdempotencyService()
@@ -0,0 +1,73 @@
+"""
+Cache de insights financeiros por período e impressão digital dos dados
+"""
+
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from loguru import logger
+
+from database.sqlite_db import get_db_session
+from database.models import InsightsCache
+from models.schemas import FinancialInsights
+from services.metrics_service import metrics_service
+
+
+class InsightsCacheService:
+    """Guarda o último insight de cada período enquanto os dados não mudam"""
+
+    async def get(self, period_type: str, period_key: str, fingerprint: str) -> Optional[FinancialInsights]:
+        """Buscar insight gerado para exatamente os mesmos dados"""
+        try:
+            async for db in get_db_session():
+                result = await db.execute(
+                    select(InsightsCache.insights_json).where(
+                        InsightsCache.period_type == period_type,
+                        InsightsCache.period_key == period_key,
+                        InsightsCache.fingerprint == fingerprint
+                    )
+                )
+                cached = result.scalar_one_or_none()
+
+                if cached:
+                    metrics_service.inc("insights_cache_requests_total", result="hit")
+                    return FinancialInsights.model_validate_json(cached)
+
+        except Exception as e:
+            logger.warning(f"❌ Erro ao buscar insights em cache: {e}")
+
+        metrics_service.inc("insights_cache_requests_total", result="miss")
+        return None
+
+    async def save(self, period_type: str, period_key: str, fingerprint: str, insights: FinancialInsights, model: str):
+        """Gravar insight do período, substituindo o anterior"""
+        try:
+            insights_json = insights.model_dump_json()
+
+            async for db in get_db_session():
+                await db.execute(
+                    sqlite_insert(InsightsCache)
+                    .values(
+                        period_type=period_type,
+                        period_key=period_key,
+                        fingerprint=fingerprint,
+                        insights_json=insights_json,
+                        model_used=model
+                    )
+                    .on_conflict_do_update(
+                        index_elements=[InsightsCache.period_type, InsightsCache.period_key],
+                        set_={
+                            "fingerprint": fingerprint,
+                            "insights_json": insights_json,
+                            "model_used": model
+                        }
+                    )
+                )
+                await db.commit()
+
+        except Exception as e:
+            logger.warning(f"❌ Erro ao salvar insights em cache: {e}")
+
+
+insights_cache_service = InsightsCacheService()
@@ -0,0 +1,100 @@
+"""
+Agrupamento de interpretações simultâneas em uma única chamada à IA
+"""
+
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+
+class BatchItemError(Exception):
+    """Item do lote sem resposta válida; o chamador deve tentar sozinho"""
+
+
+class InterpretationBatcher:
+    """Junta mensagens recebidas dentro de uma janela curta em lotes de até N itens
+
+    O executor recebe a lista de mensagens e devolve, na mesma ordem, a resposta
+    JSON de cada uma ou None para itens que falharam.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[List[str]], Awaitable[List[Optional[str]]]],
+        window_seconds: float = 0.05,
+        max_batch_size: int = 8
+    ):
+        self.execute = execute
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.batched_messages = 0
+        self.failed_items = 0
+
+    async def submit(self, message: str) -> str:
+        """Adicionar mensagem ao próximo lote e aguardar sua resposta"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Enviar o lote acumulado"""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Executar lote e distribuir respostas aos chamadores"""
+        self.batches += 1
+        self.batched_messages += len(batch)
+
+        try:
+            results = await self.execute([message for message, _ in batch])
+        except Exception as e:
+            # Falha da chamada inteira: todos recebem o erro original
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for index, (message, future) in enumerate(batch):
+            if future.done():
+                continue
+
+            result = results[index] if index < len(results) else None
+            if result is None:
+                self.failed_items += 1
+                logger.warning(f"⚠️ Item {index + 1} do lote sem resposta válida: '{message[:40]}'")
+                future.set_exception(BatchItemError(message))
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Lotes enviados e tamanho médio"""
+        return {
+            "batches": self.batches,
+            "batched_messages": self.batched_messages,
+            "avg_batch_size": round(self.batched_messages / self.batches, 2) if self.batches else 0.0,
+            "failed_items": self.failed_items
+        }
@@ -0,0 +1,240 @@
+"""
+Proteções das chamadas à OpenAI: concorrência, taxa, retentativas, prazo e circuit breaker
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import openai
+from loguru import logger
+
+from services.metrics_service import metrics_service
+
+
+T = TypeVar("T")
+
+# Erros que indicam instabilidade do serviço e justificam nova tentativa
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    asyncio.TimeoutError
+)
+
+
+class LLMUnavailableError(Exception):
+    """IA indisponível: circuito aberto, retentativas esgotadas ou prazo excedido"""
+
+
+class _LocalWaitTimeout(Exception):
+    """Prazo esgotado aguardando vaga ou token local, antes de enviar a requisição"""
+
+
+class TokenBucket:
+    """Limite de requisições por minuto com rajada de até `capacity` chamadas"""
+
+    def __init__(self, requests_per_minute: int, capacity: int):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Aguardar um token; chamadores são atendidos em ordem de chegada"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return round(self._tokens, 2)
+
+
+class CircuitBreaker:
+    """Abre após N falhas seguidas e libera uma chamada de teste depois do tempo de espera"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Verificar se uma chamada pode seguir para a API"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            logger.info("🔌 Circuito da IA semiaberto, testando o serviço")
+
+        # semiaberto: uma única chamada de teste por vez
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ Circuito da IA fechado")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"⚠️ Circuito da IA aberto após {self.consecutive_failures} falhas")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Liberar a chamada de teste sem conclusão sobre a saúde do serviço"""
+        self._probe_in_flight = False
+
+
+class LLMGuard:
+    """Executa chamadas à API com limites de concorrência e taxa, retentativas e prazo total"""
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        requests_per_minute: int = 500,
+        deadline_seconds: float = 30.0,
+        max_retries: int = 3,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 20.0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+        self.breaker = breaker or CircuitBreaker()
+        self.bucket = TokenBucket(requests_per_minute, capacity=max_concurrent)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.inflight = 0
+
+    async def call(self, operation: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Executar a chamada, repetindo falhas transitórias dentro do prazo"""
+        if not self.breaker.allow():
+            metrics_service.inc("llm_guard_total", operation=operation, event="rejected")
+            raise LLMUnavailableError("circuito aberto, IA temporariamente indisponível")
+
+        deadline = time.monotonic() + self.deadline_seconds
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                result = await self._attempt(request, deadline)
+
+            except _LocalWaitTimeout:
+                # congestionamento local não diz nada sobre a saúde da API
+                metrics_service.inc("llm_guard_total", operation=operation, event="local_timeout")
+                self.breaker.release()
+                raise LLMUnavailableError("prazo esgotado aguardando vaga para chamar a IA")
+
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(e, attempt)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    event = "deadline" if isinstance(e, asyncio.TimeoutError) else "exhausted"
+                    metrics_service.inc("llm_guard_total", operation=operation, event=event)
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(f"IA indisponível após {attempt} tentativa(s): {e!r}") from e
+
+                metrics_service.inc("llm_guard_total", operation=operation, event="retry")
+                logger.warning(f"🔁 Falha transitória da IA ({type(e).__name__}), nova tentativa em {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            except BaseException:
+                # erro da requisição em si (ex.: 400), não da saúde do serviço
+                self.breaker.release()
+                raise
+
+            self.breaker.record_success()
+            return result
+
+    async def _attempt(self, request: Callable[[], Awaitable[T]], deadline: float) -> T:
+        """Obter vaga e token e executar a requisição; só a requisição conta como falha da API"""
+        try:
+            await asyncio.wait_for(self._acquire_slot(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            raise _LocalWaitTimeout() from None
+
+        self.inflight += 1
+        try:
+            return await asyncio.wait_for(request(), deadline - time.monotonic())
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+    async def _acquire_slot(self):
+        await self._semaphore.acquire()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def _retry_delay(self, error: BaseException, attempt: int) -> float:
+        """Espera antes da próxima tentativa: Retry-After do servidor ou backoff exponencial com jitter"""
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_base_seconds)
+
+        ceiling = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _retry_after(error: BaseException) -> Optional[float]:
+        """Segundos indicados pelos cabeçalhos retry-after-ms ou retry-after"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            return None
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado do circuito e uso dos limites"""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "inflight": self.inflight,
+            "rate_tokens_available": self.bucket.available
+        }
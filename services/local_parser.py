@@ -0,0 +1,227 @@
+"""
+Parser local de mensagens financeiras simples, sem chamada à IA
+"""
+
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Set
+
+from config.settings import get_settings
+from models.schemas import InterpretedTransaction, ExpenseCategory
+from services.category_classifier import category_classifier, NaiveBayesCategoryClassifier
+from utils.normalization import normalize_number, strip_accents
+
+
+CATEGORY_KEYWORDS: Dict[ExpenseCategory, Set[str]] = {
+    # mesmas palavras de investimento usadas no prompt da IA
+    ExpenseCategory.FINANCAS: {
+        "guardei", "investi", "caixinha", "poupanca", "investimento", "aplicacao", "apliquei",
+        "reserva", "tesouro", "cdb", "acoes"
+    },
+    ExpenseCategory.ALIMENTACAO: {
+        "padaria", "mercado", "supermercado", "restaurante", "lanche", "lanchonete", "almoco", "jantar",
+        "cafe", "comida", "ifood", "pizza", "pizzaria", "hamburguer", "mcdonalds", "acai", "feira",
+        "acougue", "sorvete", "marmita", "hortifruti", "sushi", "pastel", "delivery"
+    },
+    ExpenseCategory.TRANSPORTE: {
+        "uber", "taxi", "onibus", "metro", "gasolina", "combustivel", "estacionamento", "pedagio",
+        "passagem", "etanol", "trem", "bilhete", "cabify", "brt"
+    },
+    ExpenseCategory.SAUDE: {
+        "farmacia", "remedio", "remedios", "medico", "consulta", "dentista", "exame", "exames",
+        "hospital", "drogaria", "academia", "psicologo", "terapia", "vacina"
+    },
+    ExpenseCategory.LAZER: {
+        "cinema", "show", "netflix", "spotify", "bar", "balada", "viagem", "jogo", "teatro",
+        "ingresso", "ingressos", "festa", "cerveja", "streaming", "parque"
+    },
+    ExpenseCategory.CASA: {
+        "aluguel", "luz", "agua", "energia", "internet", "condominio", "gas", "limpeza", "moveis",
+        "iptu", "faxina", "diarista", "reforma"
+    }
+}
+
+STOPWORDS = {
+    "gastei", "paguei", "comprei", "guardei", "investi", "apliquei", "foi", "deu", "custou", "um", "uma", "uns", "umas",
+    "no", "na", "nos", "nas", "de", "do", "da", "dos", "das", "em", "com", "pra", "para", "o", "a", "os", "as",
+    "e", "meu", "minha", "reais", "real", "rs", "conto", "contos", "pila", "pilas"
+}
+
+CURRENCY_MARKERS = {"reais", "real", "rs", "conto", "contos", "pila", "pilas"}
+
+SPENDING_VERBS = {"gastei", "paguei", "comprei", "guardei", "investi", "apliquei", "custou", "deu"}
+
+RELATIVE_DAYS = {"hoje": 0, "ontem": -1, "anteontem": -2}
+
+MONTHS = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12
+}
+
+# Termos de data que o parser não resolve: a mensagem fica para a IA
+UNSUPPORTED_DATE_WORDS = {
+    "amanha", "dias", "segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo",
+    "retrasado", "retrasada", "natal", "pascoa", "carnaval", "reveillon", "ano"
+}
+
+# Negação, estorno e entrada de dinheiro: não são gastos simples, a mensagem fica para a IA
+BAIL_OUT_WORDS = {
+    "nao", "nunca", "nem", "jamais", "cancelei", "cancelado", "cancelada",
+    "devolvi", "devolveu", "devolveram", "devolucao", "estorno", "estornou", "estornaram",
+    "reembolso", "reembolsou", "reembolsaram", "ressarcimento", "cashback",
+    "recebi", "recebeu", "ganhei", "ganhou", "entrou", "entraram", "salario", "pagaram",
+    "vendi", "rendeu", "rendimento", "lucro"
+}
+
+AMOUNT_PATTERN = re.compile(r"^(?:r\$)?(\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?)$")
+
+
+@dataclass
+class _ParseState:
+    """Estado acumulado durante a leitura dos tokens"""
+    amounts: List[Decimal] = field(default_factory=list)
+    transaction_date: Optional[date] = None
+    date_terms: int = 0
+    description: List[str] = field(default_factory=list)
+    categories: Set[ExpenseCategory] = field(default_factory=set)
+    has_currency: bool = False
+    has_verb: bool = False
+    category_resolved: bool = False
+    category_disputed: bool = False
+
+
+class LocalTransactionParser:
+    """Interpretação determinística por regras e léxico para mensagens comuns
+
+    Quando há um classificador treinado, ele resolve categorias que o léxico não
+    encontra e contesta as que ele encontra com pouca evidência.
+    """
+
+    def __init__(self, classifier: Optional[NaiveBayesCategoryClassifier] = None):
+        self.settings = get_settings()
+        self.classifier = classifier
+
+    def parse(self, message: str, today: Optional[date] = None) -> Optional[InterpretedTransaction]:
+        """Interpretar mensagem; retorna None quando a mensagem foge das regras"""
+        today = today or date.today()
+        tokens = [token.strip(".,") for token in re.findall(r"r\$\s*[\d.,]+|[^\s!?;:()\"]+", message.lower())]
+        state = _ParseState()
+
+        index = 0
+        while index < len(tokens):
+            following = strip_accents(tokens[index + 1]) if index + 1 < len(tokens) else ""
+            consumed = self._read_token(tokens[index], following, today, state)
+            if not consumed:
+                return None
+            index += consumed
+
+        if len(state.amounts) != 1 or state.date_terms > 1 or not state.description:
+            return None
+
+        categoria = self._resolve_category(state)
+
+        return InterpretedTransaction(
+            descricao=" ".join(state.description).title(),
+            valor=state.amounts[0],
+            categoria=categoria,
+            data=state.transaction_date or today,
+            confianca=self._confidence(state)
+        )
+
+    def _read_token(self, raw: str, following: str, today: date, state: _ParseState) -> int:
+        """Classificar um token e retornar quantos tokens foram consumidos
+
+        Retorna 0 quando a mensagem não pode ser tratada localmente.
+        """
+        plain = strip_accents(raw)
+        if not plain:
+            return 1
+
+        amount = AMOUNT_PATTERN.match(plain.replace(" ", ""))
+        if amount:
+            state.amounts.append(Decimal(normalize_number(amount.group(1))))
+            state.has_currency = state.has_currency or plain.startswith("r$")
+            return 1
+
+        if plain in RELATIVE_DAYS:
+            return self._set_date(state, today + timedelta(days=RELATIVE_DAYS[plain]), 1)
+
+        if plain in MONTHS:
+            # mês nomeado sem dia: primeiro dia do mês, como no prompt
+            return self._set_date(state, date(today.year, MONTHS[plain], 1), 1)
+
+        if plain == "dia":
+            if not following.isdigit():
+                return 0
+            try:
+                return self._set_date(state, today.replace(day=int(following)), 2)
+            except ValueError:
+                return 0
+
+        if plain == "semana" and following in ("passada", "retrasada"):
+            return self._set_date(state, today - timedelta(days=7 if following == "passada" else 14), 2)
+
+        if plain == "mes" and following == "passado":
+            return self._set_date(state, today - timedelta(days=30), 2)
+
+        if plain in BAIL_OUT_WORDS:
+            return 0
+
+        if plain in UNSUPPORTED_DATE_WORDS or plain in ("semana", "mes") or "/" in plain or plain.isdigit():
+            return 0
+
+        if plain in CURRENCY_MARKERS:
+            state.has_currency = True
+        if plain in SPENDING_VERBS:
+            state.has_verb = True
+
+        for category, keywords in CATEGORY_KEYWORDS.items():
+            if plain in keywords:
+                state.categories.add(category)
+
+        if plain not in STOPWORDS:
+            state.description.append(raw)
+        return 1
+
+    def _resolve_category(self, state: _ParseState) -> ExpenseCategory:
+        """Combinar categoria do léxico com a previsão do classificador"""
+        lexicon = next(iter(state.categories)) if len(state.categories) == 1 else None
+        prediction = self.classifier.predict(" ".join(state.description)) if self.classifier else None
+
+        # probabilidade mínima do classificador para decidir ou contestar a categoria
+        if prediction and prediction[1] >= self.settings.category_classifier_min_probability:
+            predicted = prediction[0]
+            if lexicon is None:
+                state.category_resolved = True
+                return predicted
+            if predicted != lexicon:
+                state.category_disputed = True
+
+        if lexicon is not None:
+            state.category_resolved = True
+            return lexicon
+        return ExpenseCategory.OUTROS
+
+    @staticmethod
+    def _set_date(state: _ParseState, transaction_date: date, consumed: int) -> int:
+        """Registrar a data encontrada"""
+        state.transaction_date = transaction_date
+        state.date_terms += 1
+        return consumed
+
+    @staticmethod
+    def _confidence(state: _ParseState) -> float:
+        """Pontuação de confiança da interpretação local"""
+        score = 0.5
+        if state.has_currency or state.has_verb:
+            score += 0.2
+        if state.category_resolved and not state.category_disputed:
+            score += 0.2
+        if len(state.description) <= 3:
+            score += 0.1
+        return round(min(score, 0.95), 2)
+
+
+local_parser = LocalTransactionParser(classifier=category_classifier)
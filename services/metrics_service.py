@@ -0,0 +1,145 @@
+"""
+Serviço de métricas em memória exportadas no formato Prometheus
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Iterator
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    "message_stage_seconds": ("histogram", "Latência de cada etapa do processamento de mensagens"),
+    "ai_cache_requests_total": ("counter", "Consultas ao cache de interpretações por resultado"),
+    "ai_cache_lookups_total": ("counter", "Consultas por camada do cache de interpretações (memória e banco)"),
+    "local_parser_total": ("counter", "Resultados do parser local antes da chamada à IA"),
+    "category_crosscheck_total": ("counter", "Concordância entre a categoria da IA e o classificador local"),
+    "ai_singleflight_total": ("counter", "Requisições à IA iniciadas ou compartilhadas com uma idêntica em andamento"),
+    "ai_cache_evictions_total": ("counter", "Entradas removidas do cache de interpretações por motivo"),
+    "insights_cache_requests_total": ("counter", "Consultas ao cache de insights por resultado"),
+    "ai_json_repair_total": ("counter", "Respostas da IA válidas, reparadas localmente, corrigidas pela IA ou perdidas"),
+    "llm_requests_total": ("counter", "Chamadas à API da OpenAI por operação e modelo"),
+    "llm_guard_total": ("counter", "Retentativas, prazos excedidos e rejeições do circuito nas chamadas à OpenAI"),
+    "llm_cascade_total": ("counter", "Respostas do modelo barato aceitas ou escaladas por motivo"),
+    "llm_tier_latency_seconds": ("histogram", "Latência das interpretações por camada da cascata de modelos"),
+    "llm_cost_usd_total": ("counter", "Custo estimado em USD das chamadas à OpenAI por modelo"),
+    "llm_batched_messages_total": ("counter", "Mensagens interpretadas em chamadas agrupadas"),
+    "llm_tokens_total": ("counter", "Tokens consumidos na API da OpenAI"),
+    "sheets_api_calls_total": ("counter", "Chamadas à API do Google Sheets por operação"),
+    "errors_total": ("counter", "Erros por componente"),
+    "update_queue_depth": ("gauge", "Updates aguardando na fila de ingestão ou a vez do seu chat"),
+    "admission_inflight": ("gauge", "Updates em processamento admitidos"),
+    "admission_shed_total": ("counter", "Updates descartados pelo controle de admissão"),
+    "dispatcher_active_updates": ("gauge", "Updates em execução no despachante"),
+    "db_write_batches_total": ("counter", "Lotes gravados pela fila de escrita de transações"),
+    "db_write_intents_total": ("counter", "Inclusões e atualizações recebidas pela fila de escrita"),
+    "db_write_batch_seconds": ("histogram", "Duração de cada lote gravado no banco"),
+    "db_write_batch_fallback_total": ("counter", "Lotes refeitos com um savepoint por intenção após falha"),
+    "db_writes_total": ("counter", "Escritas de transações por tipo e resultado"),
+}
+
+
+class MetricsService:
+    """Registro leve de contadores, gauges e histogramas"""
+
+    PREFIX = "finance_bot_"
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, List[float]]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Incrementar contador"""
+        series = self._counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Definir valor de um gauge"""
+        self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Registrar observação em um histograma"""
+        series = self._histograms.setdefault(name, {})
+        key = self._key(labels)
+        state = series.get(key)
+        if state is None:
+            # contagem por bucket (+Inf no final), soma e total
+            state = series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Medir duração de um bloco em segundos"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def time_stage(self, stage: str):
+        """Medir uma etapa do pipeline de mensagens"""
+        return self.timer("message_stage_seconds", stage=stage)
+
+    def get_counter(self, name: str, **labels) -> float:
+        """Valor atual de um contador"""
+        return self._counters.get(name, {}).get(self._key(labels), 0)
+
+    def reset(self):
+        """Zerar todas as séries"""
+        self._counters.clear()
+        self._gauges.clear()
+        self._histograms.clear()
+
+    def render(self) -> str:
+        """Exportar métricas no formato texto do Prometheus"""
+        lines = []
+
+        for name in sorted(set(self._counters) | set(self._gauges) | set(self._histograms)):
+            kind, description = METRICS.get(name, ("untyped", name))
+            full_name = self.PREFIX + name
+            lines.append(f"# HELP {full_name} {description}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            for key, value in self._counters.get(name, {}).items():
+                lines.append(f"{full_name}{self._format_labels(key)} {value}")
+
+            for key, value in self._gauges.get(name, {}).items():
+                lines.append(f"{full_name}{self._format_labels(key)} {value}")
+
+            for key, state in self._histograms.get(name, {}).items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), state):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full_name}_bucket{self._format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{self._format_labels(key)} {state[-2]}")
+                lines.append(f"{full_name}_count{self._format_labels(key)} {state[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_labels(key: LabelKey) -> str:
+        if not key:
+            return ""
+        pairs = []
+        for name, value in key:
+            value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+
+metrics_service = MetricsService()
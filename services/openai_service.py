@@ -2,11 +2,13 @@
 Serviço de integração com OpenAI para processamento de mensagens
 """
 
+import asyncio
 import json
 import hashlib
 from datetime import datetime, timedelta, date
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 from decimal import Decimal
+from types import SimpleNamespace
 
 from loguru import logger
 
@@ -14,31 +16,173 @@ from config.settings import get_settings
 from models.schemas import InterpretedTransaction, ExpenseCategory, FinancialInsights, InsightsPeriod
 from database.sqlite_db import get_db_session
 from database.models import AIPromptCache
-from sqlalchemy import select
+from services.metrics_service import metrics_service
+from services.local_parser import local_parser
+from services.category_classifier import category_classifier
+from services.interpretation_batcher import InterpretationBatcher, BatchItemError
+from services.llm_guard import LLMGuard, CircuitBreaker, LLMUnavailableError
+from utils.cache import LRUCache, BloomFilter
+from utils.normalization import canonicalize_message, extract_amount_template
+from utils.json_repair import load_lenient_json, parse_amount, repair_interpretation
+from utils.relative_dates import describe_relative_date, resolve_relative_date
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from openai import AsyncOpenAI
 
 
+T = TypeVar("T")
+
+
 class OpenAIService:
     """Serviço para processamento de IA"""
 
     def __init__(self):
         self.settings = get_settings()
         self.model = self.settings.openai_model
-        self.client = AsyncOpenAI(api_key=self.settings.openai_api_key)
+        # retentativas ficam a cargo do LLMGuard, que também respeita o prazo total
+        self.client = AsyncOpenAI(api_key=self.settings.openai_api_key, max_retries=0)
+        self.llm_guard = LLMGuard(
+            max_concurrent=self.settings.openai_max_concurrent_requests,
+            requests_per_minute=self.settings.openai_requests_per_minute,
+            deadline_seconds=self.settings.openai_call_deadline_seconds,
+            max_retries=self.settings.openai_max_retries,
+            retry_base_seconds=self.settings.openai_retry_base_seconds,
+            retry_max_seconds=self.settings.openai_retry_max_seconds,
+            breaker=CircuitBreaker(
+                failure_threshold=self.settings.openai_circuit_failure_threshold,
+                reset_timeout_seconds=self.settings.openai_circuit_reset_seconds
+            )
+        )
+
+        self.memory_cache = LRUCache(
+            max_size=self.settings.ai_cache_memory_size,
+            ttl_seconds=self.settings.ai_cache_memory_ttl_seconds
+        )
+        self.known_keys = self._new_key_filter()
+        self._known_keys_ready = False
+        # filtro em reconstrução; recebe também as chaves gravadas durante a varredura
+        self._rebuilding_keys: Optional[BloomFilter] = None
+
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._pending_hits: Dict[str, Tuple[int, datetime]] = {}
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+        # modelo barato tentado antes de self.model; desligado quando ausente ou igual
+        cascade_model = self.settings.openai_cascade_model
+        self.cascade_model = cascade_model if cascade_model and cascade_model != self.model else None
+
+        self.batcher = None
+        if self.settings.ai_batching_enabled:
+            self.batcher = InterpretationBatcher(
+                self._interpret_batch,
+                window_seconds=self.settings.ai_batch_window_ms / 1000,
+                max_batch_size=self.settings.ai_batch_max_size
+            )
 
     async def interpret_financial_message(self, message: str) -> InterpretedTransaction:
         """Interpretar mensagem financeira usando IA"""
         try:
             cached_result = await self._get_cached_result(message)
             if cached_result:
+                metrics_service.inc("ai_cache_requests_total", result="hit")
                 logger.info(f"Usando resultado do cache para mensagem")
                 return self._parse_ai_response(cached_result)
 
-            prompt = self._create_financial_prompt(message)
+            metrics_service.inc("ai_cache_requests_total", result="miss")
 
-            logger.info(f"🧠 Processando mensagem com {self.model}")
-            response = await self.client.chat.completions.create(
-                model=self.model,
+            local_result = self._try_local_parser(message)
+            if local_result:
+                return local_result
+
+            try:
+                ai_response = await self._single_flight(
+                    f"interpret:{self._cache_key(canonicalize_message(message))}",
+                    "interpret",
+                    lambda: self._interpret_and_cache(message)
+                )
+            except LLMUnavailableError as e:
+                degraded = self._degraded_local_parse(message)
+                if degraded is None:
+                    raise
+                logger.warning(f"⚠️ IA indisponível, usando interpretação local: {e}")
+                return degraded
+
+            interpreted = self._parse_ai_response(ai_response)
+            self._cross_check_category(message, interpreted)
+            return interpreted
+
+        except Exception as e:
+            metrics_service.inc("errors_total", component="openai_interpret")
+            logger.error(f"Erro ao processar mensagem: {e}")
+            raise Exception(f"Erro na interpretação: {str(e)}")
+
+    async def _single_flight(self, key: str, operation: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """Compartilhar uma única execução entre chamadas idênticas simultâneas
+
+        A execução roda em uma task própria: se quem a iniciou for cancelado, os
+        demais continuam aguardando o mesmo resultado.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics_service.inc("ai_singleflight_total", operation=operation, result="shared")
+            logger.info(f"🔗 Aguardando requisição idêntica em andamento ({operation})")
+            return await asyncio.shield(task)
+
+        metrics_service.inc("ai_singleflight_total", operation=operation, result="leader")
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda finished: self._finish_flight(key, finished))
+        return await asyncio.shield(task)
+
+    def _finish_flight(self, key: str, task: asyncio.Task):
+        """Liberar a chave; consumir a exceção caso ninguém mais aguarde a task"""
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    async def _interpret_and_cache(self, message: str) -> str:
+        """Obter resposta da IA e gravá-la no cache"""
+        ai_response, model = await self._interpret_with_llm(message)
+        ai_response = await self._ensure_valid_response(message, ai_response)
+        await self._save_to_cache(message, ai_response, model)
+        return ai_response
+
+    async def _interpret_with_llm(self, message: str) -> Tuple[str, str]:
+        """Obter resposta da IA e o modelo que respondeu, via lote quando o agrupamento está ativo"""
+        if self.batcher:
+            try:
+                return await self.batcher.submit(message)
+            except BatchItemError:
+                logger.info("🔁 Reprocessando mensagem fora do lote")
+
+        return await self._request_interpretation(message)
+
+    async def _request_interpretation(self, message: str) -> Tuple[str, str]:
+        """Chamar a IA para uma única mensagem, começando pelo modelo barato quando configurado
+
+        Retorna a resposta e o modelo que a produziu.
+        """
+        if self.cascade_model:
+            ai_response = await self._interpret_with_model(
+                "cheap", self.cascade_model, self._create_minimal_prompt(message)
+            )
+            reason = self._escalation_reason(ai_response)
+            if reason is None:
+                metrics_service.inc("llm_cascade_total", result="accepted", reason="none")
+                return ai_response, self.cascade_model
+
+            metrics_service.inc("llm_cascade_total", result="escalated", reason=reason)
+            logger.info(f"⬆️ Escalando interpretação para {self.model} ({reason})")
+
+        return await self._interpret_with_model("strong", self.model, self._create_financial_prompt(message)), self.model
+
+    async def _interpret_with_model(self, tier: str, model: str, prompt: str) -> str:
+        """Chamar um modelo da cascata com o prompt de interpretação"""
+        logger.info(f"🧠 Processando mensagem com {model}")
+        with metrics_service.timer("llm_tier_latency_seconds", tier=tier, model=model):
+            response = await self._create_completion(
+                "interpret",
+                model=model,
                 messages=[
                     {
                         "role": "system",
@@ -52,28 +196,198 @@ class OpenAIService:
                 temperature=0.1,
                 max_tokens=200
             )
+        self._record_usage(response, "interpret", model)
 
-            ai_response = response.choices[0].message.content.strip()
-            logger.info(f"Resposta da IA recebida: {len(ai_response)} caracteres")
+        ai_response = response.choices[0].message.content.strip()
+        logger.info(f"Resposta da IA recebida: {len(ai_response)} caracteres")
+        return ai_response
 
-            await self._save_to_cache(message, ai_response)
+    def _escalation_reason(self, ai_response: str) -> Optional[str]:
+        """Motivo para repetir a interpretação no modelo forte, ou None se a resposta serve"""
+        categories = [cat.value for cat in ExpenseCategory]
+        data = repair_interpretation(ai_response, categories, date.today())
+        if data is not None and data.get("categoria") not in categories:
+            # _parse_ai_response trocaria a categoria desconhecida por "Outros"
+            return "invalid_category"
 
-            return self._parse_ai_response(ai_response)
+        raw = load_lenient_json(ai_response)
+        if raw is not None and parse_amount(raw.get("confianca")) is None:
+            # o reparo preencheria a confiança com o valor padrão
+            return "missing_confidence"
 
-        except Exception as e:
-            logger.error(f"Erro ao processar mensagem: {e}")
-            raise Exception(f"Erro na interpretação: {str(e)}")
+        try:
+            interpreted = self._parse_ai_response(ai_response)
+        except Exception:
+            return "invalid"
+
+        if interpreted.confianca < self.settings.openai_cascade_min_confidence:
+            return "low_confidence"
+        return None
+
+    async def _interpret_batch(self, messages: List[str]) -> List[Optional[Tuple[str, str]]]:
+        """Interpretar várias mensagens em uma chamada; resposta e modelo por item, None para itens inválidos"""
+        if len(messages) == 1:
+            return [await self._request_interpretation(messages[0])]
+
+        logger.info(f"🧠 Processando lote de {len(messages)} mensagens com {self.model}")
+        response = await self._create_completion(
+            "interpret_batch",
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Você é um assistente especializado em interpretar mensagens sobre gastos pessoais em português brasileiro. Sempre retorne JSON válido."
+                },
+                {
+                    "role": "user",
+                    "content": self._create_batch_prompt(messages)
+                }
+            ],
+            temperature=0.1,
+            max_tokens=200 * len(messages)
+        )
+        self._record_usage(response, "interpret_batch")
+        metrics_service.inc("llm_batched_messages_total", len(messages))
+
+        return [
+            (item, self.model) if item is not None else None
+            for item in self._split_batch_response(response.choices[0].message.content, len(messages))
+        ]
+
+    def _split_batch_response(self, ai_response: str, expected: int) -> List[Optional[str]]:
+        """Separar o array JSON do lote em respostas individuais validadas"""
+        results: List[Optional[str]] = [None] * expected
+        try:
+            items = self._load_ai_json(ai_response)
+        except (json.JSONDecodeError, AttributeError):
+            logger.error(f"Resposta do lote não é JSON válido: {ai_response[:200]}")
+            return results
+
+        if not isinstance(items, list):
+            return results
+
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+
+            index = item.pop("indice", position + 1)
+            if not isinstance(index, int) or not 1 <= index <= expected:
+                continue
+
+            item_json = json.dumps(item, ensure_ascii=False)
+            try:
+                self._parse_ai_response(item_json)
+            except Exception:
+                continue
+            results[index - 1] = item_json
+
+        return results
+
+    def _try_local_parser(self, message: str) -> Optional[InterpretedTransaction]:
+        """Interpretar localmente quando a confiança do parser basta para dispensar a IA"""
+        if not self.settings.local_parser_enabled:
+            return None
+
+        interpreted = local_parser.parse(message)
+        if interpreted is None:
+            metrics_service.inc("local_parser_total", result="no_match")
+            return None
+
+        if interpreted.confianca < self.settings.local_parser_min_confidence:
+            metrics_service.inc("local_parser_total", result="low_confidence")
+            return None
+
+        metrics_service.inc("local_parser_total", result="accepted")
+        logger.info(f"⚡ Mensagem interpretada localmente (confiança {interpreted.confianca:.0%})")
+        return interpreted
+
+    def _degraded_local_parse(self, message: str) -> Optional[InterpretedTransaction]:
+        """Interpretação local aceita com qualquer confiança enquanto a IA está indisponível"""
+        if not self.settings.local_parser_enabled:
+            return None
+
+        interpreted = local_parser.parse(message)
+        metrics_service.inc("local_parser_total", result="fallback" if interpreted else "fallback_no_match")
+        return interpreted
+
+    async def _create_completion(self, operation: str, **kwargs):
+        """Chamar a API de chat através dos limites e do circuit breaker"""
+        return await self.llm_guard.call(operation, lambda: self.client.chat.completions.create(**kwargs))
+
+    def _cross_check_category(self, message: str, interpreted: InterpretedTransaction):
+        """Comparar a categoria da IA com a previsão do classificador local"""
+        prediction = category_classifier.predict(f"{interpreted.descricao} {message}")
+        if not prediction or prediction[1] < self.settings.category_classifier_min_probability:
+            return
+
+        predicted, probability = prediction
+        if predicted == interpreted.categoria:
+            metrics_service.inc("category_crosscheck_total", result="agree")
+            return
+
+        metrics_service.inc("category_crosscheck_total", result="disagree")
+        logger.warning(
+            f"🔀 IA classificou '{interpreted.descricao}' como {interpreted.categoria.value}, "
+            f"classificador local sugere {predicted.value} ({probability:.0%})"
+        )
+
+    def _record_usage(self, response, operation: str, model: Optional[str] = None):
+        """Registrar chamada, tokens consumidos e custo estimado nas métricas"""
+        model = model or self.model
+        metrics_service.inc("llm_requests_total", operation=operation, model=model)
+
+        # preços em USD por milhão de tokens: [entrada, saída]
+        prices = self.settings.openai_model_prices.get(model)
+        usage = getattr(response, "usage", None)
+        for index, kind in enumerate(("prompt_tokens", "completion_tokens")):
+            tokens = getattr(usage, kind, None)
+            if isinstance(tokens, int):
+                metrics_service.inc("llm_tokens_total", tokens, kind=kind, model=model)
+                if prices:
+                    metrics_service.inc("llm_cost_usd_total", tokens * prices[index] / 1_000_000, model=model)
 
     def _create_financial_prompt(self, message: str) -> str:
         """Criar prompt otimizado para interpretação financeira"""
-        today = date.today().strftime("%Y-%m-%d")
-        categories = [cat.value for cat in ExpenseCategory]
-
         prompt = f"""
 Interprete esta mensagem sobre gasto pessoal ou investimento em português brasileiro:
 "{message}"
 
-Extraia as informações e retorne APENAS um JSON válido com os campos:
+{self._financial_prompt_rules()}
+Retorne APENAS o JSON, sem texto adicional:
+"""
+        return prompt
+
+    def _create_minimal_prompt(self, message: str) -> str:
+        """Prompt curto para o modelo barato da cascata"""
+        today = date.today().strftime("%Y-%m-%d")
+        categories = ", ".join(cat.value for cat in ExpenseCategory)
+
+        return f"""Mensagem de gasto ou investimento: "{message}"
+Retorne APENAS JSON com "descricao" (string), "valor" (número), "categoria" (uma de: {categories}), "data" (YYYY-MM-DD; hoje é {today}; mês sem dia = dia 1) e "confianca" (0.0 a 1.0).
+Guardar, investir, caixinha, poupança e reserva são "Finanças". Use confiança baixa se houver dúvida.
+"""
+
+    def _create_batch_prompt(self, messages: List[str]) -> str:
+        """Criar prompt único para interpretar várias mensagens"""
+        numbered = "\n".join(f'{index}. "{message}"' for index, message in enumerate(messages, start=1))
+
+        prompt = f"""
+Interprete cada uma destas {len(messages)} mensagens sobre gasto pessoal ou investimento em português brasileiro:
+{numbered}
+
+Para CADA mensagem, siga as regras abaixo.
+
+{self._financial_prompt_rules()}
+Retorne APENAS um array JSON com um objeto por mensagem, na mesma ordem, cada um com o campo adicional "indice" (número da mensagem), sem texto adicional:
+"""
+        return prompt
+
+    def _financial_prompt_rules(self) -> str:
+        """Campos, regras de categoria e data e exemplos do prompt de interpretação"""
+        today = date.today().strftime("%Y-%m-%d")
+        categories = [cat.value for cat in ExpenseCategory]
+
+        return f"""Extraia as informações e retorne APENAS um JSON válido com os campos:
 
 - "descricao": nome do estabelecimento/item comprado/investimento (string)
 - "valor": valor numérico em reais (número decimal, ex: 15.50)
@@ -112,21 +426,14 @@ Output: {{"descricao": "Blusa", "valor": 100.00, "categoria": "Outros", "data":
 
 Input: "padaria 10 reais dia 1" 
 Output: {{"descricao": "Padaria", "valor": 10.00, "categoria": "Alimentação", "data": "2025-{(datetime.now().month)}-01", "confianca": 0.8}}
-
-Retorne APENAS o JSON, sem texto adicional:
 """
-        return prompt
 
     def _parse_ai_response(self, ai_response: str) -> InterpretedTransaction:
-        """Parsear resposta da IA em objeto estruturado"""
+        """Parsear resposta da IA em objeto estruturado, reparando defeitos comuns"""
         try:
-            ai_response = ai_response.strip()
-            if ai_response.startswith("```json"):
-                ai_response = ai_response[7:]
-            if ai_response.endswith("```"):
-                ai_response = ai_response[:-3]
-
-            data = json.loads(ai_response)
+            data = repair_interpretation(ai_response, [cat.value for cat in ExpenseCategory], date.today())
+            if data is None:
+                raise ValueError("resposta sem JSON com descricao e valor")
 
             categoria = data.get("categoria")
             if categoria not in [cat.value for cat in ExpenseCategory]:
@@ -138,82 +445,451 @@ Retorne APENAS o JSON, sem texto adicional:
                 valor=Decimal(str(data["valor"])),
                 categoria=ExpenseCategory(categoria),
                 data=datetime.strptime(data["data"], "%Y-%m-%d").date(),
-                confianca=float(data.get("confianca", 0.8))
+                confianca=float(data["confianca"])
             )
 
-        except (json.JSONDecodeError, KeyError, ValueError) as e:
+        except (json.JSONDecodeError, KeyError, ValueError, ArithmeticError) as e:
             logger.error(f"Erro ao parsear resposta da IA: {ai_response} - {str(e)}")
             raise Exception(f"Resposta inválida da IA.")
 
-    async def _get_cached_result(self, message: str) -> Optional[str]:
-        """Buscar resultado no cache"""
+    def _repair_response(self, ai_response: str) -> Optional[str]:
+        """Resposta original se já for JSON válido, versão reparada localmente, ou None"""
+        data = repair_interpretation(ai_response, [cat.value for cat in ExpenseCategory], date.today())
+        if data is None:
+            return None
+
+        try:
+            if self._load_ai_json(ai_response) == data:
+                metrics_service.inc("ai_json_repair_total", result="valid")
+                return ai_response
+        except (json.JSONDecodeError, AttributeError):
+            pass
+
+        metrics_service.inc("ai_json_repair_total", result="local")
+        logger.info("🩹 Resposta da IA reparada localmente")
+        return json.dumps(data, ensure_ascii=False)
+
+    async def _ensure_valid_response(self, message: str, ai_response: str) -> str:
+        """Garantir resposta utilizável: reparo local e, se não bastar, um pedido de correção à IA"""
+        repaired = self._repair_response(ai_response)
+        if repaired is not None:
+            return repaired
+
+        logger.warning(f"⚠️ Resposta da IA irrecuperável localmente, pedindo correção: {ai_response[:200]}")
+        corrected = await self._request_repair(message, ai_response)
+
+        repaired = self._repair_response(corrected)
+        if repaired is None:
+            metrics_service.inc("ai_json_repair_total", result="failed")
+            raise Exception("Resposta inválida da IA.")
+
+        metrics_service.inc("ai_json_repair_total", result="remote")
+        return repaired
+
+    async def _request_repair(self, message: str, ai_response: str) -> str:
+        """Pedir à IA que corrija apenas o formato de uma resposta inválida"""
+        today = date.today().strftime("%Y-%m-%d")
+        categories = ", ".join(cat.value for cat in ExpenseCategory)
+        prompt = f"""A resposta abaixo para a mensagem "{message}" não é um JSON utilizável.
+
+Resposta recebida:
+{ai_response[:1000]}
+
+Corrija e retorne APENAS um objeto JSON com "descricao" (string), "valor" (número), "categoria" (uma de: {categories}), "data" (YYYY-MM-DD; hoje é {today}) e "confianca" (0.0 a 1.0).
+"""
+        response = await self._create_completion(
+            "repair",
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=200
+        )
+        self._record_usage(response, "repair")
+        return (response.choices[0].message.content or "").strip()
+
+    def _new_key_filter(self) -> BloomFilter:
+        return BloomFilter(
+            capacity=self.settings.ai_cache_bloom_capacity,
+            error_rate=self.settings.ai_cache_bloom_error_rate
+        )
+
+    async def warm_cache_filter(self):
+        """Carregar chaves válidas do cache no filtro de Bloom
+
+        O filtro novo é montado à parte e só substitui o atual ao fim da varredura,
+        para que consultas concorrentes nunca vejam um filtro incompleto.
+        """
+        rebuilding = self._rebuilding_keys = self._new_key_filter()
         try:
-            message_hash = hashlib.sha256(message.encode()).hexdigest()
+            async for db in get_db_session():
+                result = await db.execute(
+                    select(AIPromptCache.input_hash).where(AIPromptCache.expires_at > datetime.now())
+                )
+                for input_hash in result.scalars():
+                    rebuilding.add(input_hash)
+
+            self.known_keys = rebuilding
+            self._known_keys_ready = True
+            logger.info(f"✅ Filtro do cache de IA carregado com {self.known_keys.count} chaves")
+
+        except Exception as e:
+            self._known_keys_ready = False
+            logger.warning(f"❌ Erro ao carregar filtro do cache: {e}")
+
+        finally:
+            if self._rebuilding_keys is rebuilding:
+                self._rebuilding_keys = None
+
+    def cache_stats(self) -> dict:
+        """Estado do cache de interpretações em memória"""
+        stats = self.memory_cache.stats()
+        stats["known_keys"] = self.known_keys.count if self._known_keys_ready else None
+        return stats
+
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        """Hash usado como chave do cache"""
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    async def _get_cached_result(self, message: str) -> Optional[str]:
+        """Buscar resultado no cache pela mensagem canônica e, em seguida, pelo template de valor"""
+        canonical = canonicalize_message(message)
+
+        cached_output = await self._lookup_cache(self._cache_key(canonical))
+        if cached_output is not None:
+            return self._rehydrate_date(cached_output)
+
+        template = extract_amount_template(canonical)
+        if template:
+            template_text, amount = template
+            cached_template = await self._lookup_cache(self._cache_key(f"template:{template_text}"))
+            if cached_template is not None:
+                filled = self._fill_amount(cached_template, amount)
+                if filled:
+                    metrics_service.inc("ai_cache_lookups_total", tier="template", result="hit")
+                    return self._rehydrate_date(filled)
+
+        return None
 
+    async def _lookup_cache(self, cache_key: str) -> Optional[str]:
+        """Consultar uma chave no cache (memória, depois banco)"""
+        cached_output = self.memory_cache.get(cache_key)
+        if cached_output is not None:
+            metrics_service.inc("ai_cache_lookups_total", tier="memory", result="hit")
+            self._record_hit(cache_key)
+            return cached_output
+
+        metrics_service.inc("ai_cache_lookups_total", tier="memory", result="miss")
+
+        # Chave nunca gravada: nem precisa consultar o banco
+        if self._known_keys_ready and cache_key not in self.known_keys:
+            metrics_service.inc("ai_cache_lookups_total", tier="database", result="skipped")
+            return None
+
+        try:
             async for db in get_db_session():
                 result = await db.execute(
                     select(AIPromptCache).where(
-                        AIPromptCache.input_hash == message_hash,
+                        AIPromptCache.input_hash == cache_key,
                         AIPromptCache.expires_at > datetime.now()
                     )
                 )
                 cached = result.scalar_one_or_none()
 
                 if cached:
+                    metrics_service.inc("ai_cache_lookups_total", tier="database", result="hit")
+                    self.memory_cache.set(cache_key, cached.output_json, cached.expires_at)
+                    self._record_hit(cache_key)
                     return cached.output_json
 
+                metrics_service.inc("ai_cache_lookups_total", tier="database", result="miss")
+
         except Exception as e:
             logger.warning(f"❌ Erro ao buscar cache: {e}")
 
         return None
 
-    async def _save_to_cache(self, message: str, ai_response: str):
-        """Salvar resultado no cache"""
+    def _record_hit(self, cache_key: str):
+        """Acumular leitura da entrada para gravar no banco na próxima manutenção"""
+        count, _ = self._pending_hits.get(cache_key, (0, None))
+        self._pending_hits[cache_key] = (count + 1, datetime.now())
+
+    async def _flush_cache_hits(self):
+        """Gravar contagem e horário das leituras acumuladas"""
+        pending, self._pending_hits = self._pending_hits, {}
+        if not pending:
+            return
+
+        async for db in get_db_session():
+            cache_table = AIPromptCache.__table__
+            await db.execute(
+                update(cache_table)
+                .where(cache_table.c.input_hash == bindparam("cache_key"))
+                .values(
+                    hit_count=cache_table.c.hit_count + bindparam("hits"),
+                    last_hit_at=bindparam("last_hit")
+                ),
+                [{"cache_key": key, "hits": hits, "last_hit": last_hit} for key, (hits, last_hit) in pending.items()]
+            )
+            await db.commit()
+
+    async def run_cache_maintenance(self) -> Dict[str, int]:
+        """Remover entradas expiradas e, acima do limite, as menos usadas recentemente"""
+        await self._flush_cache_hits()
+        removed = {"expired": 0, "size": 0}
+
+        async for db in get_db_session():
+            result = await db.execute(
+                delete(AIPromptCache).where(AIPromptCache.expires_at <= datetime.now())
+            )
+            removed["expired"] = result.rowcount or 0
+
+            total = await db.scalar(select(func.count(AIPromptCache.id)))
+            excess = total - self.settings.ai_cache_max_rows
+            if excess > 0:
+                least_recent = (
+                    select(AIPromptCache.id)
+                    .order_by(
+                        func.coalesce(AIPromptCache.last_hit_at, AIPromptCache.created_at).asc(),
+                        AIPromptCache.hit_count.asc()
+                    )
+                    .limit(excess)
+                )
+                result = await db.execute(delete(AIPromptCache).where(AIPromptCache.id.in_(least_recent)))
+                removed["size"] = result.rowcount or 0
+
+            await db.commit()
+
+        for reason, count in removed.items():
+            if count:
+                metrics_service.inc("ai_cache_evictions_total", count, reason=reason)
+
+        if any(removed.values()):
+            logger.info(f"🧹 Cache de IA: {removed['expired']} expiradas e {removed['size']} excedentes removidas")
+            # chaves removidas deixam de ser conhecidas
+            await self.warm_cache_filter()
+
+        return removed
+
+    def start_cache_maintenance(self):
+        """Iniciar manutenção periódica do cache"""
+        if self._maintenance_task and not self._maintenance_task.done():
+            return
+        self._maintenance_task = asyncio.create_task(self._cache_maintenance_loop(), name="ai-cache-maintenance")
+
+    async def stop_cache_maintenance(self):
+        """Parar manutenção periódica, gravando leituras pendentes"""
+        if self._maintenance_task and not self._maintenance_task.done():
+            self._maintenance_task.cancel()
+            await asyncio.gather(self._maintenance_task, return_exceptions=True)
+
+        try:
+            await self._flush_cache_hits()
+        except Exception as e:
+            logger.warning(f"❌ Erro ao gravar leituras do cache: {e}")
+
+    async def _cache_maintenance_loop(self):
+        """Executar manutenção do cache em intervalos fixos"""
+        while True:
+            try:
+                await self.run_cache_maintenance()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"❌ Erro na manutenção do cache: {e}")
+            await asyncio.sleep(self.settings.ai_cache_maintenance_interval_minutes * 60)
+
+    async def _save_to_cache(self, message: str, ai_response: str, model: Optional[str] = None):
+        """Salvar resultado no cache, incluindo o template de valor quando aplicável
+
+        Entradas com data relativa descrita valem por muito mais tempo, pois a data
+        é recalculada a cada leitura.
+        """
+        canonical = canonicalize_message(message)
+        output, relative = self._annotate_relative_date(message, ai_response)
+        ttl_days = self.settings.ai_cache_ttl_days if relative else self.settings.ai_cache_unresolved_date_ttl_days
+
+        await self._store_cache(self._cache_key(canonical), message, output, ttl_days, model)
+
+        template = extract_amount_template(canonical)
+        if template and relative:
+            template_text, amount = template
+            # só vira template se a IA usou exatamente o valor da mensagem
+            if self._fill_amount(output, amount, expected=amount):
+                await self._store_cache(self._cache_key(f"template:{template_text}"), template_text, output, ttl_days, model)
+
+    async def _store_cache(self, cache_key: str, input_text: str, ai_response: str, ttl_days: int, model: Optional[str] = None):
+        """Gravar entrada no cache em memória e no banco; model é quem respondeu (padrão: modelo principal)"""
+        model = model or self.model
         try:
-            message_hash = hashlib.sha256(message.encode()).hexdigest()
-            expires_at = datetime.now() + timedelta(days=7)
+            expires_at = datetime.now() + timedelta(days=ttl_days)
+
+            self.memory_cache.set(cache_key, ai_response, expires_at)
+            self.known_keys.add(cache_key)
+            if self._rebuilding_keys is not None:
+                self._rebuilding_keys.add(cache_key)
 
             async for db in get_db_session():
-                cache_entry = AIPromptCache(
-                    input_hash=message_hash,
-                    input_text=message,
-                    output_json=ai_response,
-                    model_used=self.model,
-                    expires_at=expires_at
+                # entrada expirada com a mesma chave é substituída, mantendo o histórico de leituras
+                await db.execute(
+                    sqlite_insert(AIPromptCache)
+                    .values(
+                        input_hash=cache_key,
+                        input_text=input_text,
+                        output_json=ai_response,
+                        model_used=model,
+                        expires_at=expires_at
+                    )
+                    .on_conflict_do_update(
+                        index_elements=[AIPromptCache.input_hash],
+                        set_={
+                            "input_text": input_text,
+                            "output_json": ai_response,
+                            "model_used": model,
+                            "created_at": datetime.now(),
+                            "expires_at": expires_at
+                        }
+                    )
                 )
-
-                db.add(cache_entry)
                 await db.commit()
 
         except Exception as e:
             logger.warning(f"❌ Erro ao salvar cache: {e}")
 
+    @staticmethod
+    def _load_ai_json(ai_response: str) -> dict:
+        """Carregar JSON da resposta da IA, ignorando bloco de código markdown"""
+        return json.loads(ai_response.strip().removeprefix("```json").removesuffix("```"))
 
-    async def generate_financial_insights(self, transactions_data: list, period_type: InsightsPeriod, period_description: str) -> FinancialInsights:
-        """Gerar insights financeiros usando IA"""
+    def _annotate_relative_date(self, message: str, ai_response: str) -> Tuple[str, bool]:
+        """Anexar 'data_relativa' à resposta; retorna a saída e se a data foi descrita"""
         try:
-            formatted_data = self._format_transactions_for_ai(transactions_data)
-            
-            prompt = self._create_insights_prompt(formatted_data, period_type, period_description)
-            
-            logger.info(f"🧠 Gerando insights financeiros para {period_description}")
-            response = await self.client.chat.completions.create(
+            data = self._load_ai_json(ai_response)
+            interpreted = datetime.strptime(data["data"], "%Y-%m-%d").date()
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+            return ai_response, False
+
+        relative = describe_relative_date(message, interpreted, date.today())
+        if relative is None:
+            logger.info(f"📅 Data '{data['data']}' sem descrição relativa, cache com validade curta")
+            return ai_response, False
+
+        data["data_relativa"] = relative
+        return json.dumps(data, ensure_ascii=False), True
+
+    def _rehydrate_date(self, cached_output: str) -> str:
+        """Recalcular a data de uma entrada do cache para o dia atual"""
+        try:
+            data = self._load_ai_json(cached_output)
+            relative = data.get("data_relativa")
+            if not relative:
+                return cached_output
+
+            original = datetime.strptime(data["data"], "%Y-%m-%d").date()
+            data["data"] = resolve_relative_date(relative, date.today(), original).strftime("%Y-%m-%d")
+            return json.dumps(data, ensure_ascii=False)
+
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"❌ Erro ao recalcular data do cache: {e}")
+            return cached_output
+
+    @classmethod
+    def _fill_amount(cls, ai_response: str, amount: Decimal, expected: Optional[Decimal] = None) -> Optional[str]:
+        """Aplicar valor a uma resposta usada como template; None se a resposta não servir"""
+        try:
+            data = cls._load_ai_json(ai_response)
+            if expected is not None and Decimal(str(data["valor"])) != expected:
+                return None
+            data["valor"] = float(amount)
+            return json.dumps(data, ensure_ascii=False)
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, ArithmeticError, AttributeError):
+            return None
+
+    @staticmethod
+    def _insights_messages(prompt: str) -> List[dict]:
+        """Mensagens da conversa de geração de insights"""
+        return [
+            {
+                "role": "system",
+                "content": "Você é um consultor financeiro especializado em análise de gastos pessoais. Forneça insights práticos e acionáveis em português brasileiro. IMPORTANTE: Não use formatação markdown (# ## * -). Use apenas texto simples com emojis para destacar seções. Limite sua resposta a 2500 caracteres."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+    async def _request_insights(self, prompt: str, period_description: str) -> str:
+        """Chamar a IA para gerar o texto de insights"""
+        logger.info(f"🧠 Gerando insights financeiros para {period_description}")
+        response = await self._create_completion(
+            "insights",
+            model=self.model,
+            messages=self._insights_messages(prompt),
+            temperature=0.3,
+            max_tokens=600
+        )
+        self._record_usage(response, "insights")
+
+        return response.choices[0].message.content.strip()
+
+    async def _stream_insights(
+        self,
+        prompt: str,
+        period_description: str,
+        on_progress: Callable[[str], Awaitable[None]]
+    ) -> str:
+        """Gerar insights em streaming, repassando o texto acumulado a cada trecho
+
+        O consumo inteiro do stream passa pelo guard: prazo, vaga de concorrência e
+        falhas no meio da resposta contam como a chamada.
+        """
+        logger.info(f"🧠 Gerando insights financeiros em streaming para {period_description}")
+
+        async def consume():
+            stream = await self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Você é um consultor financeiro especializado em análise de gastos pessoais. Forneça insights práticos e acionáveis em português brasileiro. IMPORTANTE: Não use formatação markdown (# ## * -). Use apenas texto simples com emojis para destacar seções. Limite sua resposta a 2500 caracteres."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
+                messages=self._insights_messages(prompt),
                 temperature=0.3,
-                max_tokens=600
+                max_tokens=600,
+                stream=True,
+                stream_options={"include_usage": True}
             )
 
-            ai_response = response.choices[0].message.content.strip()
+            parts = []
+            usage = None
+            async for chunk in stream:
+                # o último trecho traz apenas o consumo de tokens
+                usage = getattr(chunk, "usage", None) or usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parts.append(chunk.choices[0].delta.content)
+                await on_progress("".join(parts))
+            return "".join(parts), usage
+
+        text, usage = await self.llm_guard.call("insights", consume)
+        self._record_usage(SimpleNamespace(usage=usage), "insights")
+        return text.strip()
+
+    async def generate_financial_insights(
+        self,
+        transactions_data: list,
+        period_type: InsightsPeriod,
+        period_description: str,
+        on_progress: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> FinancialInsights:
+        """Gerar insights financeiros usando IA; com on_progress a resposta chega em streaming"""
+        try:
+            formatted_data = self._format_transactions_for_ai(transactions_data)
+            
+            prompt = self._create_insights_prompt(formatted_data, period_type, period_description)
+
+            if on_progress:
+                request = lambda: self._stream_insights(prompt, period_description, on_progress)
+            else:
+                request = lambda: self._request_insights(prompt, period_description)
+            
+            ai_response = await self._single_flight(f"insights:{self._cache_key(prompt)}", "insights", request)
             
             ai_response = self._clean_and_limit_response(ai_response, 2500)
             
@@ -249,6 +925,7 @@ Retorne APENAS o JSON, sem texto adicional:
             )
 
         except Exception as e:
+            metrics_service.inc("errors_total", component="openai_insights")
             logger.error(f"Erro ao gerar insights: {e}")
             raise Exception(f"Erro na geração de insights: {str(e)}")
 
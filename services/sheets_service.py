@@ -2,12 +2,18 @@
 Serviço de integração com Google Sheets
 """
 
+import asyncio
+import re
+from datetime import datetime
+from typing import Dict, Any, Optional, Set
+
 import gspread
 from google.oauth2.service_account import Credentials
 from loguru import logger
 
 from config.settings import get_settings
 from models.schemas import InterpretedTransaction
+from services.metrics_service import metrics_service
 
 
 class GoogleSheetsService:
@@ -19,30 +25,123 @@ class GoogleSheetsService:
         self.spreadsheet = None
         self.spreadsheet_id = self.settings.google_sheets_spreadsheet_id
 
+        self._setup_task: Optional[asyncio.Task] = None
+        self._pending_transaction_ids: Set[int] = set()
+        self._pending_attempts: Dict[int, int] = {}
+        self._startup_status: Dict[str, Any] = {
+            "mode": self.settings.sheets_startup_mode,
+            "state": "idle",
+            "step": None,
+            "attempts": 0,
+            "last_error": None,
+            "started_at": None,
+            "finished_at": None
+        }
+
+    def _track_api_call(self, operation: str):
+        """Contabilizar chamada à API do Google Sheets"""
+        metrics_service.inc("sheets_api_calls_total", operation=operation)
+
+    async def _api(self, operation: str, call, *args, **kwargs):
+        """Executar chamada bloqueante do gspread em uma thread, sem travar o event loop"""
+        self._track_api_call(operation)
+        return await asyncio.to_thread(call, *args, **kwargs)
+
     async def setup(self):
         """Configurar cliente Google Sheets"""
+        try:
+            await self.connect()
+
+            await self.ensure_sheet_structure()
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao configurar Google Sheets: {e}")
+            raise
+
+    async def connect(self):
+        """Autenticar e abrir a planilha"""
         try:
             scopes = [
                 'https://www.googleapis.com/auth/spreadsheets',
                 'https://www.googleapis.com/auth/drive'
             ]
 
-            credentials = Credentials.from_service_account_file(
+            credentials = await asyncio.to_thread(
+                Credentials.from_service_account_file,
                 self.settings.google_credentials_file,
                 scopes=scopes
             )
 
-            self.client = gspread.authorize(credentials)
-            self.spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+            self.client = await asyncio.to_thread(gspread.authorize, credentials)
+            self.spreadsheet = await self._api("open_by_key", self.client.open_by_key, self.spreadsheet_id)
 
             logger.info("✅ Google Sheets configurado com sucesso")
 
-            await self.ensure_sheet_structure()
-
         except Exception as e:
-            logger.error(f"❌ Erro ao configurar Google Sheets: {e}")
+            logger.error(f"❌ Erro ao conectar ao Google Sheets: {e}")
             raise
 
+    def start_background_setup(self):
+        """Iniciar configuração da planilha em segundo plano, sem bloquear o startup"""
+        if self._setup_task and not self._setup_task.done():
+            return
+
+        self._startup_status["started_at"] = datetime.now().isoformat()
+        self._setup_task = asyncio.create_task(self._supervised_setup(), name="sheets-setup")
+
+    async def _supervised_setup(self):
+        """Executar setup com novas tentativas e backoff exponencial até concluir"""
+        delay = self.settings.sheets_setup_retry_seconds
+
+        while True:
+            self._startup_status["attempts"] += 1
+            try:
+                self._set_progress("connecting", "Conectando à planilha")
+                await self.connect()
+
+                await self.ensure_sheet_structure()
+
+                self._set_progress("flushing", "Enviando transações recebidas durante o startup")
+                await self._load_pending_transactions()
+                await self._flush_pending_transactions()
+
+                self._set_progress("ready", None)
+                self._startup_status["last_error"] = None
+                self._startup_status["finished_at"] = datetime.now().isoformat()
+                logger.info("✅ Configuração da planilha em segundo plano concluída")
+                return
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._startup_status["last_error"] = str(e)
+                self._set_progress("retrying", f"Nova tentativa em {delay:.0f}s")
+                logger.error(f"❌ Setup da planilha falhou (tentativa {self._startup_status['attempts']}): {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.settings.sheets_setup_max_retry_seconds)
+
+    async def stop_background_setup(self):
+        """Cancelar setup em segundo plano, se ainda estiver rodando"""
+        if self._setup_task and not self._setup_task.done():
+            self._setup_task.cancel()
+            await asyncio.gather(self._setup_task, return_exceptions=True)
+
+    @property
+    def setup_in_progress(self) -> bool:
+        """Setup em segundo plano ainda não terminou"""
+        return self._setup_task is not None and not self._setup_task.done()
+
+    def _set_progress(self, state: str, step: Optional[str]):
+        """Atualizar progresso visível no /health"""
+        self._startup_status["state"] = state
+        self._startup_status["step"] = step
+
+    def startup_status(self) -> Dict[str, Any]:
+        """Estado da configuração da planilha"""
+        status = dict(self._startup_status)
+        status["pending_transactions"] = len(self._pending_transaction_ids)
+        return status
+
     async def ensure_sheet_structure(self, always_sync: bool = False):
         """Garantir que a estrutura de abas existe e sincronizar dados iniciais"""
         try:
@@ -51,7 +150,8 @@ class GoogleSheetsService:
                 "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
             ]
 
-            existing_sheets = [ws.title for ws in self.spreadsheet.worksheets()]
+            self._set_progress("checking_structure", "Verificando abas da planilha")
+            existing_sheets = [ws.title for ws in await self._api("worksheets", self.spreadsheet.worksheets)]
             new_sheets_created = False
             missing_sheets = []
 
@@ -71,6 +171,7 @@ class GoogleSheetsService:
             else:
                 logger.info("✅ Estrutura de abas verificada - todas existem")
 
+            self._set_progress("checking_sync", "Verificando necessidade de sincronização")
             sync_needed = new_sheets_created or always_sync or await self._check_if_sync_needed()
             
             if sync_needed:
@@ -92,12 +193,12 @@ class GoogleSheetsService:
     async def _create_monthly_sheet(self, mes: str):
         """Criar aba mensal com cabeçalhos"""
         try:
-            worksheet = self.spreadsheet.add_worksheet(title=mes, rows=1000, cols=10)
+            worksheet = await self._api("add_worksheet", self.spreadsheet.add_worksheet, title=mes, rows=1000, cols=10)
 
             headers = ["ID", "Data", "Descrição", "Categoria", "Valor", "Observações"]
-            worksheet.append_row(headers)
+            await self._api("append_row", worksheet.append_row, headers)
 
-            worksheet.format('A1:F1', {
+            await self._api("format", worksheet.format, 'A1:F1', {
                 'backgroundColor': {'red': 0.2, 'green': 0.6, 'blue': 1.0},
                 'textFormat': {'bold': True, 'foregroundColor': {'red': 1.0, 'green': 1.0, 'blue': 1.0}}
             })
@@ -110,10 +211,10 @@ class GoogleSheetsService:
     async def _create_summary_sheet(self):
         """Criar aba de resumo"""
         try:
-            worksheet = self.spreadsheet.add_worksheet(title="Resumo", rows=100, cols=11)
+            worksheet = await self._api("add_worksheet", self.spreadsheet.add_worksheet, title="Resumo", rows=100, cols=11)
 
             headers = ["Mês", "Total Gastos", "Alimentação", "Transporte", "Saúde", "Lazer", "Casa", "Outros", "Transações", "Finanças"]
-            worksheet.append_row(headers)
+            await self._api("append_row", worksheet.append_row, headers)
 
             meses_resumo = [
                 "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
@@ -122,9 +223,9 @@ class GoogleSheetsService:
 
             for mes in meses_resumo:
                 row = [mes, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-                worksheet.append_row(row)
+                await self._api("append_row", worksheet.append_row, row)
 
-            worksheet.format('A1:J1', {
+            await self._api("format", worksheet.format, 'A1:J1', {
                 'backgroundColor': {'red': 0.8, 'green': 0.2, 'blue': 0.2},
                 'textFormat': {'bold': True, 'foregroundColor': {'red': 1.0, 'green': 1.0, 'blue': 1.0}}
             })
@@ -134,8 +235,17 @@ class GoogleSheetsService:
         except Exception as e:
             logger.error(f"❌ Erro ao criar aba resumo: {e}")
 
-    async def add_transaction(self, transaction: InterpretedTransaction, transaction_id: int = None) -> int:
-        """Adicionar transação na planilha"""
+    async def add_transaction(self, transaction: InterpretedTransaction, transaction_id: int = None) -> Optional[int]:
+        """Adicionar transação na planilha
+
+        Enquanto o setup em segundo plano não termina, a transação fica pendente e
+        é enviada em lote ao final do setup; nesse caso retorna None.
+        """
+        if self.setup_in_progress and transaction_id:
+            self._pending_transaction_ids.add(transaction_id)
+            logger.info(f"⏳ Planilha em preparação, transação ID {transaction_id} será enviada ao final do setup")
+            return None
+
         try:
             mes_nomes = [
                 "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
@@ -143,7 +253,7 @@ class GoogleSheetsService:
             ]
             mes_nome = mes_nomes[transaction.data.month - 1]
 
-            worksheet = self.spreadsheet.worksheet(mes_nome)
+            worksheet = await self._api("worksheet", self.spreadsheet.worksheet, mes_nome)
 
             if transaction_id:
                 logger.info(f"🔍 Verificando se transação ID {transaction_id} já existe na aba {mes_nome}")
@@ -165,9 +275,9 @@ class GoogleSheetsService:
 
             logger.info(f"📝 Adicionando transação à aba {mes_nome}: {row_data}")
 
-            worksheet.append_row(row_data)
+            await self._api("append_row", worksheet.append_row, row_data)
 
-            row_number = len(worksheet.get_all_values())
+            row_number = len(await self._api("get_all_values", worksheet.get_all_values))
 
             await self._update_summary()
 
@@ -175,13 +285,146 @@ class GoogleSheetsService:
             return row_number
 
         except Exception as e:
+            metrics_service.inc("errors_total", component="sheets_add_transaction")
             logger.error(f"❌ Erro ao adicionar transação: {e}")
             raise
 
+    async def _load_pending_transactions(self):
+        """Recuperar do banco as transações que nunca chegaram à planilha (ex.: antes de um restart)"""
+        from database.sqlite_db import get_db_session
+        from database.models import Transaction
+        from sqlalchemy import select
+
+        async for db in get_db_session():
+            result = await db.execute(
+                select(Transaction.id).where(
+                    Transaction.status == "processed",
+                    Transaction.sheets_row_number.is_(None)
+                )
+            )
+            recovered = set(result.scalars().all()) - self._pending_transaction_ids
+
+        if recovered:
+            self._pending_transaction_ids |= recovered
+            logger.info(f"♻️ {len(recovered)} transações sem linha na planilha recuperadas do banco")
+
+    async def _flush_pending_transactions(self):
+        """Enviar em lote as transações pendentes, com backoff e limite de tentativas por transação"""
+        delay = self.settings.sheets_setup_retry_seconds
+
+        # Repetir até esvaziar: novas transações podem chegar enquanto o lote é enviado
+        while self._pending_transaction_ids:
+            pending_ids = set(self._pending_transaction_ids)
+            try:
+                await self._append_pending_batch(pending_ids)
+            except Exception as e:
+                metrics_service.inc("errors_total", component="sheets_pending_batch")
+                self._give_up_exhausted(pending_ids)
+                if not self._pending_transaction_ids:
+                    break
+                logger.warning(f"⚠️ Falha ao enviar {len(pending_ids)} transações pendentes, nova tentativa em {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.settings.sheets_setup_max_retry_seconds)
+                continue
+
+            self._pending_transaction_ids -= pending_ids
+            for transaction_id in pending_ids:
+                self._pending_attempts.pop(transaction_id, None)
+            delay = self.settings.sheets_setup_retry_seconds
+            logger.info(f"✅ {len(pending_ids)} transações pendentes enviadas para a planilha")
+
+    def _give_up_exhausted(self, failed_ids: Set[int]):
+        """Contar a tentativa falha e descartar as transações que atingiram o limite"""
+        exhausted = set()
+        for transaction_id in failed_ids:
+            self._pending_attempts[transaction_id] = self._pending_attempts.get(transaction_id, 0) + 1
+            if self._pending_attempts[transaction_id] >= self.settings.sheets_pending_max_attempts:
+                exhausted.add(transaction_id)
+
+        if exhausted:
+            self._pending_transaction_ids -= exhausted
+            for transaction_id in exhausted:
+                del self._pending_attempts[transaction_id]
+            logger.error(
+                f"❌ Desistindo de {len(exhausted)} transações pendentes após "
+                f"{self.settings.sheets_pending_max_attempts} tentativas (IDs {sorted(exhausted)}); "
+                "serão recuperadas do banco no próximo startup"
+            )
+
+    async def _append_pending_batch(self, pending_ids: Set[int]):
+        """Anexar um lote de transações pendentes agrupadas por mês"""
+        from database.sqlite_db import get_db_session
+        from database.models import Transaction
+        from services.transaction_writer import transaction_writer
+        from sqlalchemy import select
+
+        meses = [
+            "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+            "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
+        ]
+
+        async for db in get_db_session():
+            result = await db.execute(
+                select(Transaction)
+                .where(Transaction.id.in_(pending_ids))
+                .order_by(Transaction.id.asc())
+            )
+            transactions = result.scalars().all()
+
+        monthly_rows = {}
+        for transaction in transactions:
+            month_name = meses[transaction.data_transacao.month - 1]
+            monthly_rows.setdefault(month_name, []).append(transaction)
+
+        for month_name, month_transactions in monthly_rows.items():
+            worksheet = await self._api("worksheet", self.spreadsheet.worksheet, month_name)
+
+            values = await self._api("get_all_values", worksheet.get_all_values)
+            # linhas já presentes (ex.: envio anterior cuja linha não foi gravada no banco)
+            row_numbers = {row[0]: index for index, row in enumerate(values, start=1) if index > 1 and row}
+            to_append = [t for t in month_transactions if str(t.id) not in row_numbers]
+
+            if to_append:
+                rows = [
+                    [
+                        t.id,
+                        t.data_transacao.strftime("%d/%m/%Y"),
+                        t.descricao,
+                        t.categoria,
+                        float(t.valor),
+                        f"Confiança: {t.confianca:.1%}"
+                    ]
+                    for t in to_append
+                ]
+                response = await self._api("append_rows", worksheet.append_rows, rows)
+
+                first_row = self._first_updated_row(response)
+                if first_row:
+                    row_numbers.update({str(t.id): first_row + offset for offset, t in enumerate(to_append)})
+
+            # linha registrada pela fila de escrita, junto das demais escritas de transações
+            now = datetime.now()
+            await asyncio.gather(*(
+                transaction_writer.update(t.id, sheets_row_number=row_numbers[str(t.id)], sheets_updated_at=now)
+                for t in month_transactions if str(t.id) in row_numbers
+            ))
+
+        await self._update_summary()
+
+    @staticmethod
+    def _first_updated_row(response) -> Optional[int]:
+        """Extrair a primeira linha escrita da resposta de append_rows"""
+        try:
+            updated_range = response["updates"]["updatedRange"]
+            match = re.search(r"![A-Z]+(\d+)", updated_range)
+            return int(match.group(1)) if match else None
+        except (TypeError, KeyError):
+            return None
+
     async def _find_transaction_by_id(self, worksheet, transaction_id: int) -> int:
         """Encontrar transação por ID na planilha"""
         try:
-            all_values = worksheet.get_all_values()
+            all_values = await self._api("get_all_values", worksheet.get_all_values)
             
             if len(all_values) <= 1:
                 return None
@@ -199,7 +442,7 @@ class GoogleSheetsService:
     async def _update_summary(self):
         """Atualizar aba de resumo com totais"""
         try:
-            resumo_ws = self.spreadsheet.worksheet("Resumo")
+            resumo_ws = await self._api("worksheet", self.spreadsheet.worksheet, "Resumo")
 
             meses = [
                 "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
@@ -210,8 +453,8 @@ class GoogleSheetsService:
 
             for i, mes in enumerate(meses, start=2):
                 try:
-                    mes_ws = self.spreadsheet.worksheet(mes)
-                    all_values = mes_ws.get_all_values()
+                    mes_ws = await self._api("worksheet", self.spreadsheet.worksheet, mes)
+                    all_values = await self._api("get_all_values", mes_ws.get_all_values)
 
                     if len(all_values) <= 1:
                         continue
@@ -251,7 +494,7 @@ class GoogleSheetsService:
                         f"R$ {categoria_totais['Finanças']:.2f}"
                     ]
 
-                    resumo_ws.update(f'A{i}:J{i}', [row_update])
+                    await self._api("update", resumo_ws.update, f'A{i}:J{i}', [row_update])
 
                 except Exception as e:
                     logger.warning(f"Erro ao processar mês {mes}: {e}")
@@ -273,6 +516,7 @@ class GoogleSheetsService:
             
             logger.info("🔄 Iniciando sincronização inicial do banco para planilha...")
             
+            self._set_progress("cleaning", "Removendo dados inconsistentes da planilha")
             await self._clean_inconsistent_data()
             
             async for db in get_db_session():
@@ -320,6 +564,7 @@ class GoogleSheetsService:
                     if transactions_data:
                         current_month += 1
                         logger.info(f"📅 Sincronizando {month_name} ({current_month}/{months_with_data}): {len(transactions_data)} transações")
+                        self._set_progress("syncing", f"Sincronizando {month_name} ({current_month}/{months_with_data})")
                         
                         synced_count = await self._batch_insert_transactions(month_name, transactions_data)
                         total_synced += synced_count
@@ -338,9 +583,9 @@ class GoogleSheetsService:
     async def _batch_insert_transactions(self, month_name: str, transactions_data: list) -> int:
         """Inserir transações em lote para otimizar performance"""
         try:
-            worksheet = self.spreadsheet.worksheet(month_name)
+            worksheet = await self._api("worksheet", self.spreadsheet.worksheet, month_name)
             
-            existing_values = worksheet.get_all_values()
+            existing_values = await self._api("get_all_values", worksheet.get_all_values)
             if len(existing_values) > 1:
                 logger.info(f"⚠️ Aba {month_name} já contém dados - pulando sincronização")
                 return 0
@@ -350,7 +595,7 @@ class GoogleSheetsService:
                 end_row = start_row + len(transactions_data) - 1
                 range_name = f"A{start_row}:F{end_row}"
                 
-                worksheet.update(range_name, transactions_data)
+                await self._api("update", worksheet.update, range_name, transactions_data)
                 
                 logger.info(f"✅ {month_name}: {len(transactions_data)} transações sincronizadas em lote")
                 return len(transactions_data)
@@ -371,8 +616,8 @@ class GoogleSheetsService:
             
             for mes in meses:
                 try:
-                    worksheet = self.spreadsheet.worksheet(mes)
-                    values = worksheet.get_all_values()
+                    worksheet = await self._api("worksheet", self.spreadsheet.worksheet, mes)
+                    values = await self._api("get_all_values", worksheet.get_all_values)
                     
                     if len(values) <= 1:
                         return True
@@ -434,8 +679,8 @@ class GoogleSheetsService:
                     if i > 0:
                         await asyncio.sleep(0.3)
                     
-                    worksheet = self.spreadsheet.worksheet(mes)
-                    all_values = worksheet.get_all_values()
+                    worksheet = await self._api("worksheet", self.spreadsheet.worksheet, mes)
+                    all_values = await self._api("get_all_values", worksheet.get_all_values)
                     
                     if len(all_values) <= 1:
                         continue
@@ -455,7 +700,7 @@ class GoogleSheetsService:
                         logger.info(f"🗑️ {mes}: Removendo {len(rows_to_delete)} linhas inconsistentes")
                         
                         for row_index in reversed(rows_to_delete):
-                            worksheet.delete_rows(row_index)
+                            await self._api("delete_rows", worksheet.delete_rows, row_index)
                             total_removed += 1
                             
                             await asyncio.sleep(0.1)
@@ -501,8 +746,8 @@ class GoogleSheetsService:
             
             for mes in meses:
                 try:
-                    worksheet = self.spreadsheet.worksheet(mes)
-                    all_values = worksheet.get_all_values()
+                    worksheet = await self._api("worksheet", self.spreadsheet.worksheet, mes)
+                    all_values = await self._api("get_all_values", worksheet.get_all_values)
                     
                     for row in all_values[1:]:
                         if len(row) == 0 or not row[0]:
@@ -0,0 +1,265 @@
+"""
+Escrita agrupada de transações: uma tarefa grava inclusões e atualizações em lotes
+
+Sob concorrência, cada mensagem com seus próprios commits disputa o único
+escritor do SQLite. Aqui as intenções entram em uma fila e uma tarefa aplica o
+lote em uma única transação do banco, com um só flush. Se alguma falhar (ex.:
+mensagem já gravada), o lote é refeito com um savepoint por intenção, e a falha
+de uma não desfaz as demais.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from config.settings import get_settings
+from database.models import Transaction
+from database.sqlite_db import get_db_session
+from services.metrics_service import metrics_service
+
+
+@dataclass
+class WriteResult:
+    """Resultado de uma inclusão: id atribuído e se a mensagem já estava gravada"""
+    id: int
+    created_at: Optional[datetime]
+    duplicate: bool = False
+
+
+@dataclass
+class _Intent:
+    future: asyncio.Future
+    values: Dict[str, Any]
+    transaction_id: Optional[int] = None
+
+    @property
+    def kind(self) -> str:
+        return "insert" if self.transaction_id is None else "update"
+
+
+class TransactionWriter:
+    """Fila de escrita com commit em grupo, limitado por tamanho ou por tempo de espera"""
+
+    def __init__(self, max_batch_size: Optional[int] = None, max_delay_ms: Optional[int] = None):
+        self.settings = get_settings()
+        self.max_batch_size = max(1, max_batch_size or self.settings.db_write_batch_max_size)
+        self.max_delay_seconds = (max_delay_ms if max_delay_ms is not None else self.settings.db_write_batch_max_delay_ms) / 1000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.batches = 0
+        self.intents = 0
+
+    async def insert(self, **values) -> WriteResult:
+        """Incluir transação; se a mensagem já existir, devolve o id gravado com duplicate=True"""
+        return await self._submit(_Intent(asyncio.get_running_loop().create_future(), values))
+
+    async def update(self, transaction_id: int, **values) -> bool:
+        """Atualizar campos de uma transação; False se ela não existir"""
+        return await self._submit(_Intent(asyncio.get_running_loop().create_future(), values, transaction_id))
+
+    async def _submit(self, intent: _Intent):
+        self._ensure_running()
+        await self._queue.put(intent)
+        return await intent.future
+
+    def _ensure_running(self):
+        """Iniciar a tarefa de escrita no loop atual"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+
+    async def stop(self):
+        """Gravar intenções pendentes e encerrar a tarefa de escrita"""
+        if self._task is None or self._task.done() or self._loop is not asyncio.get_running_loop():
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, queue: asyncio.Queue):
+        intents: List[_Intent] = []
+        try:
+            while True:
+                intents = [await queue.get()]
+                deadline = time.monotonic() + self.max_delay_seconds
+                while len(intents) < self.max_batch_size:
+                    if not queue.empty():
+                        intents.append(queue.get_nowait())
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        intents.append(await asyncio.wait_for(queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+                try:
+                    await self._write(intents)
+                finally:
+                    for _ in intents:
+                        queue.task_done()
+                intents = []
+
+        except BaseException as e:
+            # ninguém mais resolveria essas intenções: falhar todas antes de a tarefa recomeçar
+            error = e if isinstance(e, Exception) else RuntimeError("Fila de escrita encerrada")
+            self._fail_pending(intents, queue, error)
+            if not isinstance(e, Exception):
+                raise
+            metrics_service.inc("errors_total", component="transaction_writer")
+            logger.error(f"❌ Tarefa de escrita interrompida, será reiniciada na próxima escrita: {e}")
+
+    @staticmethod
+    def _fail_pending(intents: List[_Intent], queue: asyncio.Queue, error: Exception):
+        """Entregar o erro às intenções em mãos e às que ainda estão na fila"""
+        while not queue.empty():
+            intents.append(queue.get_nowait())
+            queue.task_done()
+        for intent in intents:
+            if not intent.future.done():
+                intent.future.set_exception(error)
+
+    async def _write(self, intents: List[_Intent]):
+        """Aplicar o lote em uma transação e entregar o resultado de cada intenção"""
+        self.batches += 1
+        self.intents += len(intents)
+        metrics_service.inc("db_write_batches_total")
+        metrics_service.inc("db_write_intents_total", len(intents))
+
+        try:
+            with metrics_service.timer("db_write_batch_seconds"):
+                async for db in get_db_session():
+                    # sem BEGIN explícito o driver deixa o primeiro savepoint abrir a
+                    # transação, e liberá-lo faria commit só daquela intenção
+                    await db.execute(text("BEGIN"))
+                    try:
+                        async with db.begin_nested():
+                            outcomes = await self._apply_all(db, intents)
+                    except Exception as e:
+                        # alguma intenção falhou: refazer uma a uma, cada uma no seu savepoint
+                        logger.debug(f"Lote de escrita refeito por intenção: {e}")
+                        metrics_service.inc("db_write_batch_fallback_total")
+                        outcomes = [await self._apply(db, intent) for intent in intents]
+                    await db.commit()
+
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar lote de {len(intents)} escrita(s): {e}")
+            for intent in intents:
+                if not intent.future.done():
+                    intent.future.set_exception(e)
+            return
+
+        for intent, outcome in zip(intents, outcomes):
+            if intent.future.done():
+                continue
+            if isinstance(outcome, Exception):
+                intent.future.set_exception(outcome)
+            else:
+                intent.future.set_result(outcome)
+
+    async def _apply_all(self, db, intents: List[_Intent]) -> List[Any]:
+        """Aplicar o lote inteiro com um único flush"""
+        outcomes: List[Any] = []
+        inserted: List[Transaction] = []
+        for intent in intents:
+            if intent.kind == "insert":
+                transaction = Transaction(**intent.values)
+                db.add(transaction)
+                inserted.append(transaction)
+                outcomes.append(transaction)
+            else:
+                transaction = await db.get(Transaction, intent.transaction_id)
+                if transaction is not None:
+                    for name, value in intent.values.items():
+                        setattr(transaction, name, value)
+                outcomes.append(transaction is not None)
+        await db.flush()
+
+        created_at = {}
+        if inserted:
+            created_at = dict((await db.execute(
+                select(Transaction.id, Transaction.created_at).where(Transaction.id.in_([t.id for t in inserted]))
+            )).all())
+
+        results = []
+        for intent, outcome in zip(intents, outcomes):
+            if intent.kind == "insert":
+                results.append(WriteResult(id=outcome.id, created_at=created_at.get(outcome.id)))
+            else:
+                metrics_service.inc("db_writes_total", kind="update", result="ok" if outcome else "missing")
+                results.append(outcome)
+        if inserted:
+            metrics_service.inc("db_writes_total", len(inserted), kind="insert", result="ok")
+        return results
+
+    async def _apply(self, db, intent: _Intent):
+        """Executar uma intenção no seu savepoint; erros ficam restritos a ela"""
+        try:
+            if intent.kind == "insert":
+                return await self._apply_insert(db, intent.values)
+            return await self._apply_update(db, intent.transaction_id, intent.values)
+        except Exception as e:
+            metrics_service.inc("db_writes_total", kind=intent.kind, result="error")
+            return e
+
+    @staticmethod
+    async def _apply_insert(db, values: Dict[str, Any]) -> WriteResult:
+        transaction = Transaction(**values)
+        try:
+            async with db.begin_nested():
+                db.add(transaction)
+                await db.flush()
+                await db.refresh(transaction, ["created_at"])
+        except IntegrityError:
+            existing = (await db.execute(
+                select(Transaction.id, Transaction.created_at).where(
+                    Transaction.chat_id == values.get("chat_id"),
+                    Transaction.message_id == values.get("message_id")
+                )
+            )).first()
+            if existing is None:
+                raise
+            metrics_service.inc("db_writes_total", kind="insert", result="duplicate")
+            return WriteResult(id=existing.id, created_at=existing.created_at, duplicate=True)
+
+        metrics_service.inc("db_writes_total", kind="insert", result="ok")
+        return WriteResult(id=transaction.id, created_at=transaction.created_at)
+
+    @staticmethod
+    async def _apply_update(db, transaction_id: int, values: Dict[str, Any]) -> bool:
+        async with db.begin_nested():
+            transaction = await db.get(Transaction, transaction_id)
+            if transaction is None:
+                metrics_service.inc("db_writes_total", kind="update", result="missing")
+                return False
+            for name, value in values.items():
+                setattr(transaction, name, value)
+            await db.flush()
+
+        metrics_service.inc("db_writes_total", kind="update", result="ok")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Lotes gravados e tamanho médio"""
+        return {
+            "batches": self.batches,
+            "intents": self.intents,
+            "avg_batch_size": round(self.intents / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize() if self._queue else 0
+        }
+
+
+transaction_writer = TransactionWriter()
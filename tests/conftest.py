@@ -0,0 +1,14 @@
+"""
+Configuração compartilhada dos testes
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+# Banco temporário: os engines são criados na importação de database.sqlite_db,
+# e o perfil WAL regravaria o finance_bot.db versionado deixando -wal/-shm para trás
+_database_dir = tempfile.mkdtemp(prefix="finance_bot_tests_")
+atexit.register(shutil.rmtree, _database_dir, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'finance_bot.db')}"
@@ -4,11 +4,19 @@ Testes básicos da aplicação
 
 import pytest
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime, timedelta
+from unittest.mock import AsyncMock, patch
 
 from models.schemas import InterpretedTransaction, ExpenseCategory
 from services.openai_service import OpenAIService
+from services.metrics_service import MetricsService
+from services.local_parser import LocalTransactionParser
+from services.category_classifier import NaiveBayesCategoryClassifier
 from utils.helpers import extract_numbers, format_currency, get_month_name
+from utils.cache import LRUCache, BloomFilter
+from utils.normalization import canonicalize_message, extract_amount_template
+from utils.relative_dates import describe_relative_date, resolve_relative_date
+from utils.json_repair import repair_interpretation
 
 
 class TestSchemas:
@@ -65,6 +73,472 @@ class TestUtils:
         assert get_month_name(13) == "Janeiro"
 
 
+class TestMetricsService:
+    """Testes do registro de métricas"""
+
+    def test_counter_rendering(self):
+        """Testar exportação de contadores com labels"""
+        metrics = MetricsService()
+        metrics.inc("ai_cache_requests_total", result="hit")
+        metrics.inc("ai_cache_requests_total", result="hit")
+        metrics.inc("llm_tokens_total", 120, kind="prompt_tokens", model="gpt-3.5-turbo")
+
+        output = metrics.render()
+
+        assert "# TYPE finance_bot_ai_cache_requests_total counter" in output
+        assert 'finance_bot_ai_cache_requests_total{result="hit"} 2' in output
+        assert 'finance_bot_llm_tokens_total{kind="prompt_tokens",model="gpt-3.5-turbo"} 120' in output
+        assert metrics.get_counter("ai_cache_requests_total", result="hit") == 2
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Testar buckets cumulativos, soma e contagem do histograma"""
+        metrics = MetricsService(buckets=(0.1, 1.0))
+        metrics.observe("message_stage_seconds", 0.05, stage="interpret")
+        metrics.observe("message_stage_seconds", 0.5, stage="interpret")
+        metrics.observe("message_stage_seconds", 5.0, stage="interpret")
+
+        output = metrics.render()
+
+        assert 'finance_bot_message_stage_seconds_bucket{stage="interpret",le="0.1"} 1' in output
+        assert 'finance_bot_message_stage_seconds_bucket{stage="interpret",le="1.0"} 2' in output
+        assert 'finance_bot_message_stage_seconds_bucket{stage="interpret",le="+Inf"} 3' in output
+        assert 'finance_bot_message_stage_seconds_count{stage="interpret"} 3' in output
+        assert 'finance_bot_message_stage_seconds_sum{stage="interpret"} 5.55' in output
+
+    def test_stage_timer(self):
+        """Testar medição de etapa via context manager"""
+        metrics = MetricsService()
+
+        with metrics.time_stage("typing"):
+            pass
+
+        assert 'finance_bot_message_stage_seconds_count{stage="typing"} 1' in metrics.render()
+
+    def test_transaction_writer_metrics_are_registered(self):
+        """Testar que as métricas da fila de escrita saem com TYPE e HELP"""
+        metrics = MetricsService()
+        metrics.inc("db_writes_total", kind="insert", result="ok")
+        with metrics.timer("db_write_batch_seconds"):
+            pass
+
+        output = metrics.render()
+
+        assert "# TYPE finance_bot_db_writes_total counter" in output
+        assert "# TYPE finance_bot_db_write_batch_seconds histogram" in output
+        assert "# HELP finance_bot_db_write_batch_seconds Duração de cada lote gravado no banco" in output
+
+
+class TestMessageCanonicalization:
+    """Testes da canonicalização de mensagens para o cache"""
+
+    def test_equivalent_messages_share_canonical_form(self):
+        """Testar que variações triviais geram a mesma forma canônica"""
+        variants = ["Uber 15 reais", "uber  15 reais", "uber 15,00 reais", "UBER R$ 15.00!"]
+
+        assert {canonicalize_message(text) for text in variants} == {"uber 15"}
+
+    def test_accents_and_thousands(self):
+        """Testar remoção de acentos e separador de milhar brasileiro"""
+        assert canonicalize_message("Café 1.500,50 reais") == "cafe 1500.5"
+
+    def test_amount_template(self):
+        """Testar extração de template com um único valor"""
+        assert extract_amount_template("uber 22") == ("uber {valor}", Decimal("22"))
+        assert extract_amount_template("padaria 10 dia 1") is None
+        assert extract_amount_template("padaria dia 5") is None
+        assert extract_amount_template("uber 15 ontem") == ("uber {valor} ontem", Decimal("15"))
+
+    @pytest.mark.asyncio
+    async def test_template_reused_with_new_amount(self):
+        """Testar reaproveitamento da interpretação com outro valor"""
+        service = OpenAIService()
+
+        with patch("services.openai_service.get_db_session") as mock_session:
+            mock_session.side_effect = Exception("banco indisponível")
+            await service._save_to_cache(
+                "uber 15 reais",
+                '{"descricao": "Uber", "valor": 15.0, "categoria": "Transporte", "data": "2025-10-31", "confianca": 0.9}'
+            )
+
+            cached = await service._get_cached_result("Uber 22 reais")
+
+        transaction = service._parse_ai_response(cached)
+        assert transaction.valor == Decimal("22")
+        assert transaction.descricao == "Uber"
+        assert transaction.data == date.today()
+
+
+class TestRelativeDates:
+    """Testes das datas relativas do cache"""
+
+    def test_yesterday_moves_with_current_day(self):
+        """Testar que 'ontem' é recalculado para o dia da leitura"""
+        interpreted_on = date(2025, 10, 31)
+        spec = describe_relative_date("padaria 10 reais ontem", date(2025, 10, 30), interpreted_on)
+
+        assert spec == {"dias": -1}
+        assert resolve_relative_date(spec, date(2025, 11, 15), date(2025, 10, 30)) == date(2025, 11, 14)
+
+    def test_named_month_and_day_of_month(self):
+        """Testar mês nomeado e 'dia N' do mês corrente"""
+        today = date(2025, 10, 31)
+
+        month_spec = describe_relative_date("blusa em agosto 100 reais", date(2025, 8, 1), today)
+        assert month_spec == {"mes": 8, "dia": 1, "anos": 0}
+        assert resolve_relative_date(month_spec, date(2026, 3, 2), date(2025, 8, 1)) == date(2026, 8, 1)
+
+        day_spec = describe_relative_date("padaria 10 reais dia 31", date(2025, 10, 31), today)
+        assert day_spec == {"dia": 31, "meses": 0}
+        assert resolve_relative_date(day_spec, date(2025, 11, 5), date(2025, 10, 31)) == date(2025, 11, 30)
+
+    def test_full_date_is_fixed_and_mismatch_is_unresolved(self):
+        """Testar data completa fixa e data que não corresponde à mensagem"""
+        today = date(2025, 10, 31)
+
+        assert describe_relative_date("mercado 50 em 15/03/2024", date(2024, 3, 15), today) == {"fixa": True}
+        assert describe_relative_date("padaria 10 reais dia 5", date(2025, 10, 7), today) is None
+
+    def test_weekday_resolved_against_current_day(self):
+        """Testar que 'sábado passado' gravado numa segunda volta ao sábado certo numa quarta"""
+        monday, wednesday = date(2026, 10, 5), date(2026, 10, 14)
+        spec = describe_relative_date("pizza 80 reais sábado passado", date(2026, 10, 3), monday)
+
+        assert spec == {"dia_semana": 5, "semanas": 0}
+        assert resolve_relative_date(spec, wednesday, date(2026, 10, 3)) == date(2026, 10, 10)
+
+        friday_spec = describe_relative_date("mercado 50 na sexta", date(2026, 10, 2), monday)
+        assert resolve_relative_date(friday_spec, date(2026, 10, 11), date(2026, 10, 2)) == date(2026, 10, 9)
+
+    def test_ambiguous_weekday_and_movable_holidays_are_unresolved(self):
+        """Testar que dia da semana igual a hoje e feriados móveis não são descritos"""
+        saturday = date(2026, 10, 10)
+
+        assert describe_relative_date("pizza 80 reais sábado passado", date(2026, 10, 3), saturday) is None
+        assert describe_relative_date("bloco 50 reais no carnaval", date(2026, 2, 16), date(2026, 3, 2)) is None
+        assert describe_relative_date("chocolate 40 na páscoa", date(2026, 4, 5), date(2026, 4, 20)) is None
+
+    @pytest.mark.asyncio
+    async def test_cached_entry_rehydrated_on_read(self):
+        """Testar que a data do cache é recalculada na leitura"""
+        service = OpenAIService()
+        yesterday = date.today() - timedelta(days=1)
+
+        with patch("services.openai_service.get_db_session") as mock_session:
+            mock_session.side_effect = Exception("banco indisponível")
+            await service._save_to_cache(
+                "uber 15 reais ontem",
+                f'{{"descricao": "Uber", "valor": 15.0, "categoria": "Transporte", "data": "{yesterday}", "confianca": 0.9}}'
+            )
+
+        key = service._cache_key(canonicalize_message("uber 15 reais ontem"))
+        stored = service.memory_cache.get(key)
+        # simula entrada gravada três dias atrás
+        service.memory_cache.set(key, stored.replace(str(yesterday), str(yesterday - timedelta(days=3))))
+
+        with patch("services.openai_service.get_db_session") as mock_session:
+            mock_session.side_effect = Exception("banco indisponível")
+            cached = await service._get_cached_result("uber 22 reais ontem")
+            exact = await service._get_cached_result("uber 15 reais ontem")
+
+        assert service._parse_ai_response(cached).data == yesterday
+        assert service._parse_ai_response(exact).data == yesterday
+
+
+class TestJsonRepair:
+    """Testes do reparo local de respostas da IA"""
+
+    CATEGORIES = [cat.value for cat in ExpenseCategory]
+
+    def test_prose_single_quotes_and_comma_decimal(self):
+        """Testar extração do objeto no meio de texto com aspas simples e vírgula decimal"""
+        raw = "Claro! Aqui está: {'descricao': 'Padaria', 'valor': '15,50', 'categoria': 'alimentacao',} Espero ter ajudado."
+
+        repaired = repair_interpretation(raw, self.CATEGORIES, date(2025, 10, 20))
+
+        assert repaired["valor"] == 15.5
+        assert repaired["categoria"] == "Alimentação"
+        assert repaired["data"] == "2025-10-20"
+        assert repaired["confianca"] == 0.8
+
+    def test_missing_essential_field(self):
+        """Testar que resposta sem valor não é reparável"""
+        assert repair_interpretation('{"descricao": "Padaria"}', self.CATEGORIES, date.today()) is None
+        assert repair_interpretation("não entendi a mensagem", self.CATEGORIES, date.today()) is None
+
+    @pytest.mark.asyncio
+    async def test_remote_repair_only_when_local_fails(self):
+        """Testar um único pedido de correção à IA quando o reparo local falha"""
+        service = OpenAIService()
+        fixed = f'{{"descricao": "Uber", "valor": 15.0, "categoria": "Transporte", "data": "{date.today()}", "confianca": 0.9}}'
+        service._request_repair = AsyncMock(return_value=fixed)
+
+        assert await service._ensure_valid_response("uber 15", "valor: quinze") == fixed
+        service._request_repair.assert_awaited_once()
+
+        repaired = await service._ensure_valid_response("uber 15", "```json\n{'descricao': 'Uber', 'valor': 15}\n```")
+        assert service._request_repair.await_count == 1
+        assert service._parse_ai_response(repaired).valor == Decimal("15")
+
+
+class TestPeriodQueries:
+    """Testes dos filtros de período usados nos relatórios"""
+
+    def test_half_open_ranges(self):
+        """Testar intervalos semiabertos de mês, dezembro e ano"""
+        from services.database_service import DatabaseService
+
+        assert DatabaseService._date_range(2025, 2) == (date(2025, 2, 1), date(2025, 3, 1))
+        assert DatabaseService._date_range(2025, 12) == (date(2025, 12, 1), date(2026, 1, 1))
+        assert DatabaseService._date_range(2025) == (date(2025, 1, 1), date(2026, 1, 1))
+
+    def test_period_filter_uses_index(self, tmp_path):
+        """Testar que o filtro por período busca pelo índice composto em vez de varrer a tabela"""
+        from sqlalchemy import create_engine, select, func, and_
+        from database.models import Base, Transaction
+        from services.database_service import DatabaseService
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'plano.db'}")
+        Base.metadata.create_all(engine)
+        statement = (
+            select(Transaction.categoria, func.sum(Transaction.valor))
+            .where(and_(*DatabaseService._range_conditions(*DatabaseService._date_range(2025, 10))))
+            .group_by(Transaction.categoria)
+        )
+        compiled = statement.compile(dialect=engine.dialect)
+        params = tuple(str(compiled.params[name]) for name in compiled.positiontup)
+
+        with engine.connect() as connection:
+            plan = " ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params))
+        engine.dispose()
+
+        assert "SEARCH transactions USING COVERING INDEX ix_transactions_status_date" in plan
+
+
+class TestSqlitePragmas:
+    """Testes dos perfis de pragmas aplicados às conexões"""
+
+    def test_profile_overrides(self):
+        """Testar que substituições configuradas prevalecem sobre o perfil"""
+        from database.sqlite_db import resolve_pragmas
+
+        pragmas = resolve_pragmas("performance", {"cache_size": "-2000"})
+        assert pragmas["journal_mode"] == "WAL"
+        assert pragmas["cache_size"] == "-2000"
+        assert resolve_pragmas("inexistente") == {}
+
+    @pytest.mark.asyncio
+    async def test_pragmas_applied_on_connect(self, tmp_path):
+        """Testar que engines síncrono e assíncrono recebem os pragmas do perfil"""
+        from sqlalchemy import text
+        from database.sqlite_db import create_engines, resolve_pragmas
+
+        sync, async_ = create_engines(f"sqlite:///{tmp_path / 'pragmas.db'}", resolve_pragmas("performance"))
+        with sync.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        async with async_.connect() as connection:
+            assert (await connection.execute(text("PRAGMA cache_size"))).scalar() == -64000
+            assert (await connection.execute(text("PRAGMA temp_store"))).scalar() == 2
+            assert (await connection.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+        sync.dispose()
+        await async_.dispose()
+
+    @pytest.mark.asyncio
+    async def test_file_engines_use_bounded_pool(self, tmp_path):
+        """Testar que engines de arquivo usam pool com os limites configurados"""
+        from sqlalchemy import text
+        from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+        from config.settings import get_settings
+        from database.sqlite_db import create_engines
+
+        sync, async_ = create_engines(f"sqlite:///{tmp_path / 'pool.db'}", {})
+        assert isinstance(sync.pool, QueuePool)
+        assert isinstance(async_.pool, AsyncAdaptedQueuePool)
+        assert async_.pool.size() == get_settings().sqlite_pool_size
+        async with async_.connect() as connection:
+            assert (await connection.execute(text("SELECT 1"))).scalar() == 1
+        sync.dispose()
+        await async_.dispose()
+
+
+class TestLocalParser:
+    """Testes do parser local de mensagens"""
+
+    @pytest.fixture
+    def parser(self):
+        """Fixture para o parser local"""
+        return LocalTransactionParser()
+
+    def test_simple_messages(self, parser):
+        """Testar mensagens comuns com valor, categoria e data relativa"""
+        today = date(2025, 10, 31)
+
+        uber = parser.parse("uber 15 reais", today=today)
+        assert uber.descricao == "Uber"
+        assert uber.valor == Decimal("15")
+        assert uber.categoria == ExpenseCategory.TRANSPORTE
+        assert uber.data == today
+
+        padaria = parser.parse("padaria 10,50 reais ontem", today=today)
+        assert padaria.valor == Decimal("10.5")
+        assert padaria.data == date(2025, 10, 30)
+
+        caixinha = parser.parse("guardei 300 reais na caixinha", today=today)
+        assert caixinha.descricao == "Caixinha"
+        assert caixinha.categoria == ExpenseCategory.FINANCAS
+        assert caixinha.confianca >= 0.85
+
+    def test_month_and_day_of_month(self, parser):
+        """Testar mês nomeado e 'dia N'"""
+        today = date(2025, 10, 31)
+
+        assert parser.parse("farmácia 40 reais em agosto", today=today).data == date(2025, 8, 1)
+        assert parser.parse("padaria 10 reais dia 1", today=today).data == date(2025, 10, 1)
+
+    def test_unsupported_messages_left_to_ai(self, parser):
+        """Testar que mensagens ambíguas não são interpretadas localmente"""
+        assert parser.parse("uber 15 e 20 reais") is None
+        assert parser.parse("cinema 30 reais sexta") is None
+        assert parser.parse("investi 1000 reais") is None
+        assert parser.parse("comprei uma blusa 100 reais").confianca < 0.85
+
+    def test_negation_refund_and_income_left_to_ai(self, parser):
+        """Testar que negação, estorno e entrada de dinheiro não viram gasto local"""
+        for message in (
+            "não gastei 20 reais na padaria",
+            "nunca paguei 30 reais no uber",
+            "devolvi 50 reais do uber",
+            "estorno de 80 reais do mercado",
+            "reembolso 45 reais farmácia",
+            "recebi 100 reais do uber",
+            "ganhei 200 reais no bar",
+            "entrou 1500 de salário"
+        ):
+            assert parser.parse(message) is None, message
+
+    @pytest.mark.asyncio
+    async def test_confident_parse_skips_llm(self):
+        """Testar que a IA não é chamada quando o parser local é confiante"""
+        service = OpenAIService()
+        service._get_cached_result = AsyncMock(return_value=None)
+
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create:
+            result = await service.interpret_financial_message("uber 15 reais")
+
+        mock_create.assert_not_called()
+        assert result.categoria == ExpenseCategory.TRANSPORTE
+
+
+class TestCategoryClassifier:
+    """Testes do classificador de categorias"""
+
+    @pytest.fixture
+    def classifier(self, tmp_path):
+        """Fixture com classificador treinado em poucos exemplos"""
+        classifier = NaiveBayesCategoryClassifier(model_path=str(tmp_path / "modelo.json"))
+        for text in ["Vanessa pix 20 reais", "Vanessa pix para vanessa 50", "Pix mãe 100 reais"]:
+            classifier.learn(text, "Outros")
+        for text in ["Posto gasolina 50 reais", "Posto de gasolina 120", "Posto shell 80"]:
+            classifier.learn(text, "Transporte")
+        return classifier
+
+    def test_predicts_learned_category(self, classifier):
+        """Testar previsão a partir do histórico"""
+        categoria, probability = classifier.predict("posto ipiranga 90 reais")
+
+        assert categoria == ExpenseCategory.TRANSPORTE
+        assert probability > 0.5
+        assert classifier.predict("palavras nunca vistas") is None
+
+    @pytest.mark.asyncio
+    async def test_model_persisted_between_restarts(self, classifier):
+        """Testar que o modelo salvo é recarregado sem retreinar"""
+        await classifier.save()
+
+        reloaded = NaiveBayesCategoryClassifier(model_path=classifier.model_path)
+        with patch.object(reloaded, "train_from_database", new_callable=AsyncMock) as mock_train:
+            await reloaded.load_or_train()
+
+        mock_train.assert_not_called()
+        assert reloaded.total_documents == 6
+        assert reloaded.predict("pix vanessa")[0] == ExpenseCategory.OUTROS
+
+    def test_parser_uses_classifier_when_lexicon_misses(self, classifier):
+        """Testar que o parser local usa o classificador sem palavra-chave conhecida"""
+        without_classifier = LocalTransactionParser().parse("posto shell 50 reais")
+        with_classifier = LocalTransactionParser(classifier=classifier).parse("posto shell 50 reais")
+
+        assert without_classifier.categoria == ExpenseCategory.OUTROS
+        assert with_classifier.categoria == ExpenseCategory.TRANSPORTE
+        assert with_classifier.confianca > without_classifier.confianca
+
+    def test_parser_threshold_follows_settings(self, classifier, monkeypatch):
+        """Testar que o parser respeita a probabilidade mínima configurada"""
+        parser = LocalTransactionParser(classifier=classifier)
+        monkeypatch.setattr(parser.settings, "category_classifier_min_probability", 1.01)
+
+        assert parser.parse("posto shell 50 reais").categoria == ExpenseCategory.OUTROS
+
+
+class TestMemoryCache:
+    """Testes do cache em memória e do filtro de Bloom"""
+
+    def test_lru_evicts_least_recently_used(self):
+        """Testar descarte da entrada menos usada ao exceder o limite"""
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+        assert cache.evictions == 1
+
+    def test_lru_respects_expiration(self):
+        """Testar que entradas expiradas contam como miss"""
+        cache = LRUCache(max_size=10)
+        cache.set("a", 1, expires_at=datetime.now() - timedelta(seconds=1))
+
+        assert cache.get("a") is None
+        assert cache.stats()["misses"] == 1
+        assert len(cache) == 0
+
+    def test_bloom_filter_membership(self):
+        """Testar que chaves adicionadas sempre são encontradas"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [f"chave-{i}" for i in range(500)]
+        for key in keys:
+            bloom.add(key)
+
+        assert all(key in bloom for key in keys)
+        false_positives = sum(f"outra-{i}" in bloom for i in range(1000))
+        assert false_positives < 50
+
+    @pytest.mark.asyncio
+    async def test_known_miss_skips_database(self):
+        """Testar que chaves fora do filtro não consultam o banco"""
+        service = OpenAIService()
+        service._known_keys_ready = True
+
+        with patch("services.openai_service.get_db_session") as mock_session:
+            assert await service._get_cached_result("mensagem nunca vista") is None
+            mock_session.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_saved_result_served_from_memory(self):
+        """Testar que resultado salvo é servido pela memória"""
+        service = OpenAIService()
+
+        with patch("services.openai_service.get_db_session") as mock_session:
+            mock_session.side_effect = Exception("banco indisponível")
+            await service._save_to_cache("padaria 10", '{"valor": 10}')
+
+            assert await service._get_cached_result("padaria 10") == '{"valor": 10}'
+            assert service.cache_stats()["hits"] == 1
+
+
 @pytest.mark.asyncio
 class TestServices:
     """Testes dos serviços (necessita configuração)"""
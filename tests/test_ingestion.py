@@ -0,0 +1,521 @@
+"""
+Testes da camada de ingestão de updates do webhook
+"""
+
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from models.schemas import InterpretedTransaction, ExpenseCategory
+from bot.update_queue import UpdateQueue
+from bot.update_dispatcher import ChatOrderedDispatcher
+from bot.update_filter import UpdateFilter
+from bot.admission import AdmissionController
+from bot.telegram_bot import TelegramFinanceBot
+from services.idempotency_service import IdempotencyService
+
+
+def make_message_update(update_id: int, chat_id: int = 10, message_id: int = 100, text: str = "uber 15 reais"):
+    """Criar payload bruto de update de mensagem"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": 1760000000,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Teste"},
+            "text": text
+        }
+    }
+
+
+class TestUpdateQueue:
+    """Testes da fila de ingestão assíncrona"""
+
+    @pytest.mark.asyncio
+    async def test_updates_are_processed_by_workers(self):
+        """Testar que updates enfileirados são drenados pelos workers"""
+        processed = []
+
+        async def handler(update_data, queued_for):
+            await asyncio.sleep(0)
+            processed.append(update_data["update_id"])
+
+        queue = UpdateQueue(handler, max_size=10, workers=2)
+        await queue.start()
+
+        for update_id in range(5):
+            assert queue.enqueue({"update_id": update_id})
+
+        await queue.stop()
+
+        assert sorted(processed) == [0, 1, 2, 3, 4]
+        stats = queue.stats()
+        assert stats["processed"] == 5
+        assert stats["depth"] == 0
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_updates(self):
+        """Testar rejeição imediata quando a fila está cheia"""
+        release = asyncio.Event()
+
+        async def handler(update_data, queued_for):
+            await release.wait()
+
+        queue = UpdateQueue(handler, max_size=1, workers=1)
+        await queue.start()
+
+        assert queue.enqueue({"update_id": 1})
+        await asyncio.sleep(0)
+        assert queue.stats()["busy_workers"] == 1
+
+        assert queue.enqueue({"update_id": 2})
+        assert not queue.enqueue({"update_id": 3})
+        assert queue.stats()["rejected"] == 1
+
+        release.set()
+        await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_handler_errors_do_not_stop_workers(self):
+        """Testar que falhas em um update não derrubam o worker"""
+        processed = []
+
+        async def handler(update_data, queued_for):
+            if update_data["update_id"] == 1:
+                raise RuntimeError("falha simulada")
+            processed.append(update_data["update_id"])
+
+        queue = UpdateQueue(handler, max_size=10, workers=1)
+        await queue.start()
+
+        queue.enqueue({"update_id": 1})
+        queue.enqueue({"update_id": 2})
+        await queue.stop()
+
+        assert processed == [2]
+        assert queue.stats()["failed"] == 1
+
+
+class TestChatOrderedDispatcher:
+    """Testes do despachante ordenado por chat"""
+
+    @pytest.mark.asyncio
+    async def test_same_chat_keeps_arrival_order(self):
+        """Testar que updates do mesmo chat são processados em ordem"""
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=4)
+        processed = []
+
+        def make_handler(index, delay):
+            async def handler():
+                await asyncio.sleep(delay)
+                processed.append(index)
+            return handler
+
+        await asyncio.gather(
+            dispatcher.dispatch(1, make_handler(0, 0.03)),
+            dispatcher.dispatch(1, make_handler(1, 0.0)),
+            dispatcher.dispatch(1, make_handler(2, 0.01))
+        )
+
+        assert processed == [0, 1, 2]
+        assert dispatcher.stats()["chats_in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_chat_does_not_block_other_chats(self):
+        """Testar que um chat lento não atrasa os demais"""
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=4)
+        release = asyncio.Event()
+        finished = []
+
+        async def slow():
+            await release.wait()
+            finished.append("lento")
+
+        async def fast():
+            finished.append("rapido")
+
+        slow_task = asyncio.create_task(dispatcher.dispatch(1, slow))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(dispatcher.dispatch(2, fast), timeout=1)
+
+        assert finished == ["rapido"]
+
+        release.set()
+        await slow_task
+        assert finished == ["rapido", "lento"]
+
+    @pytest.mark.asyncio
+    async def test_global_concurrency_limit(self):
+        """Testar limite global de updates simultâneos"""
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=2)
+        running = 0
+        peak = 0
+
+        async def handler():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(dispatcher.dispatch(chat_id, handler) for chat_id in range(6)))
+
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_update_does_not_skip_queue(self):
+        """Testar que cancelar um update em espera não libera o próximo antes da hora"""
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=4)
+        release = asyncio.Event()
+        processed = []
+
+        async def first():
+            await release.wait()
+            processed.append("primeiro")
+
+        async def second():
+            processed.append("segundo")
+
+        async def third():
+            processed.append("terceiro")
+
+        first_task = asyncio.create_task(dispatcher.dispatch(1, first))
+        await asyncio.sleep(0)
+        second_task = asyncio.create_task(dispatcher.dispatch(1, second))
+        await asyncio.sleep(0)
+        third_task = asyncio.create_task(dispatcher.dispatch(1, third))
+        await asyncio.sleep(0)
+
+        second_task.cancel()
+        await asyncio.sleep(0.01)
+        assert processed == []
+
+        release.set()
+        await first_task
+        await third_task
+        assert processed == ["primeiro", "terceiro"]
+
+    @pytest.mark.asyncio
+    async def test_busy_chat_does_not_hold_queue_workers(self):
+        """Testar que o worker entrega o update ao chat e segue, sem esperar o anterior"""
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=4)
+        release = asyncio.Event()
+        processed = []
+
+        def make_handler(label, wait=False):
+            async def handler():
+                if wait:
+                    await release.wait()
+                processed.append(label)
+            return handler
+
+        async def worker_handler(update_data, queued_for):
+            dispatcher.submit(update_data["chat_id"], make_handler(update_data["update_id"], update_data["wait"]))
+
+        queue = UpdateQueue(worker_handler, max_size=10, workers=1)
+        await queue.start()
+        queue.enqueue({"update_id": 1, "chat_id": 1, "wait": True})
+        queue.enqueue({"update_id": 2, "chat_id": 1, "wait": False})
+        queue.enqueue({"update_id": 3, "chat_id": 2, "wait": False})
+        await asyncio.sleep(0.01)
+
+        assert processed == [3]
+        assert dispatcher.backlog == 2
+
+        release.set()
+        await dispatcher.drain(timeout=1)
+        await queue.stop()
+        assert processed == [3, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_includes_chat_backlog(self):
+        """Testar que a profundidade exportada soma a fila e os updates aguardando o chat"""
+        with patch("config.logging_config.setup_logging"):
+            import main
+        from services.metrics_service import metrics_service
+
+        dispatcher = ChatOrderedDispatcher(max_concurrent_updates=4)
+        release = asyncio.Event()
+        dispatcher.submit(1, release.wait)
+        dispatcher.submit(1, release.wait)
+
+        queue = UpdateQueue(AsyncMock(), max_size=10, workers=1)
+        await queue.start()
+        queue.enqueue({"update_id": 1})
+
+        with patch.object(main, "update_queue", queue), \
+             patch.object(main, "bot_instance", MagicMock(dispatcher=dispatcher)), \
+             patch.object(main, "admission", None):
+            await main.metrics()
+
+        assert "finance_bot_update_queue_depth 3" in metrics_service.render()
+        release.set()
+        await dispatcher.drain(timeout=1)
+        await queue.stop()
+
+
+class TestIdempotentProcessing:
+    """Testes de deduplicação de updates reentregues"""
+
+    @pytest.fixture
+    def telegram_bot(self):
+        bot = TelegramFinanceBot()
+        bot.application = MagicMock()
+        bot.application.process_update = AsyncMock()
+        return bot
+
+    def test_claim_rejects_in_flight_duplicate(self):
+        """Testar que a mesma entrega não é processada em paralelo"""
+        service = IdempotencyService()
+
+        assert service.claim(1)
+        assert not service.claim(1)
+
+        service.release(1)
+        assert service.claim(1)
+
+    @pytest.mark.asyncio
+    async def test_processed_update_is_skipped(self, telegram_bot):
+        """Testar que update já processado não chega aos handlers"""
+        with patch("bot.telegram_bot.idempotency_service") as mock_idempotency:
+            mock_idempotency.claim.return_value = True
+            mock_idempotency.is_processed = AsyncMock(return_value=True)
+            mock_idempotency.mark_processed = AsyncMock()
+
+            await telegram_bot.process_update(make_message_update(1))
+
+            telegram_bot.application.process_update.assert_not_called()
+            mock_idempotency.mark_processed.assert_not_called()
+            mock_idempotency.release.assert_called_once_with(1)
+
+    @pytest.mark.asyncio
+    async def test_new_update_is_processed_and_marked(self, telegram_bot):
+        """Testar que update novo é processado e registrado"""
+        with patch("bot.telegram_bot.idempotency_service") as mock_idempotency:
+            mock_idempotency.claim.return_value = True
+            mock_idempotency.is_processed = AsyncMock(return_value=False)
+            mock_idempotency.mark_processed = AsyncMock()
+
+            await telegram_bot.process_update(make_message_update(2, chat_id=10, message_id=55))
+
+            telegram_bot.application.process_update.assert_awaited_once()
+            mock_idempotency.mark_processed.assert_awaited_once_with(2, chat_id=10, message_id=55)
+
+    @pytest.mark.asyncio
+    async def test_redelivered_message_reuses_stored_transaction(self, telegram_bot):
+        """Testar que mensagem já salva é respondida sem nova chamada à IA"""
+        stored = MagicMock()
+        stored.id = 42
+        stored.descricao = "Uber"
+        stored.valor = Decimal("15.00")
+        stored.categoria = "Transporte"
+        stored.data_transacao = date.today()
+        stored.confianca = Decimal("0.90")
+
+        update = MagicMock()
+        update.message.text = "uber 15 reais"
+        update.message.message_id = 100
+        update.effective_user.id = 10
+        update.effective_chat.id = 10
+        update.message.reply_text = AsyncMock()
+        context = MagicMock()
+        context.bot.send_chat_action = AsyncMock()
+
+        with patch("bot.telegram_bot.database_service") as mock_db, \
+                patch("bot.telegram_bot.openai_service") as mock_openai, \
+                patch("bot.telegram_bot.sheets_service") as mock_sheets:
+            mock_db.get_transaction_by_message = AsyncMock(return_value=stored)
+            mock_openai.interpret_financial_message = AsyncMock()
+            mock_sheets.add_transaction = AsyncMock()
+
+            await telegram_bot.handle_expense_message(update, context)
+
+            mock_openai.interpret_financial_message.assert_not_called()
+            mock_sheets.add_transaction.assert_not_called()
+            confirmation = update.message.reply_text.call_args[0][0]
+            assert "#42" in confirmation
+            assert "Uber" in confirmation
+
+    @pytest.mark.asyncio
+    async def test_admission_slot_is_taken_only_on_chat_turn(self, telegram_bot):
+        """Testar que update esperando a vez no chat não ocupa vaga de admissão"""
+        from contextlib import asynccontextmanager
+
+        admission = AdmissionController(max_inflight=1, max_queue_wait=1.0)
+        release = asyncio.Event()
+
+        async def blocked(update):
+            await release.wait()
+
+        telegram_bot.application.process_update = AsyncMock(side_effect=blocked)
+
+        @asynccontextmanager
+        async def gate():
+            admitted = await admission.acquire()
+            try:
+                yield admitted
+            finally:
+                if admitted:
+                    admission.release()
+
+        with patch("bot.telegram_bot.idempotency_service") as mock_idempotency:
+            mock_idempotency.claim.return_value = True
+            mock_idempotency.is_processed = AsyncMock(return_value=False)
+            mock_idempotency.mark_processed = AsyncMock()
+
+            first = telegram_bot.submit_update(make_message_update(1, chat_id=10), gate=gate)
+            second = telegram_bot.submit_update(make_message_update(2, chat_id=10, message_id=101), gate=gate)
+            await asyncio.sleep(0.01)
+
+            assert admission.stats()["inflight"] == 1
+            assert admission.stats()["waiting"] == 0
+
+            release.set()
+            await asyncio.gather(first, second)
+
+        assert admission.stats()["admitted"] == 2
+        assert admission.stats()["shed"] == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicate_skips_sheets_and_reply(self, telegram_bot):
+        """Testar que a entrega que perde a corrida não lança outra linha na planilha"""
+        from services.transaction_writer import WriteResult
+
+        update = MagicMock()
+        update.message.text = "uber 15 reais"
+        update.message.message_id = 100
+        update.effective_user.id = 10
+        update.effective_chat.id = 10
+        update.message.reply_text = AsyncMock()
+        context = MagicMock()
+        context.bot.send_chat_action = AsyncMock()
+
+        with patch("bot.telegram_bot.database_service") as mock_db, \
+                patch("bot.telegram_bot.openai_service") as mock_openai, \
+                patch("bot.telegram_bot.sheets_service") as mock_sheets, \
+                patch("bot.telegram_bot.transaction_writer") as mock_writer:
+            mock_db.get_transaction_by_message = AsyncMock(return_value=None)
+            mock_openai.interpret_financial_message = AsyncMock(return_value=InterpretedTransaction(
+                descricao="Uber", valor=Decimal("15.00"), categoria=ExpenseCategory.TRANSPORTE,
+                data=date.today(), confianca=0.9
+            ))
+            mock_writer.insert = AsyncMock(return_value=WriteResult(id=42, created_at=datetime.now(), duplicate=True))
+            mock_sheets.add_transaction = AsyncMock()
+
+            await telegram_bot.handle_expense_message(update, context)
+
+            mock_sheets.add_transaction.assert_not_called()
+            update.message.reply_text.assert_not_called()
+
+
+class TestUpdateFilter:
+    """Testes do filtro de updates sobre o JSON bruto"""
+
+    def test_text_message_is_accepted(self):
+        """Testar que mensagens de texto e comandos passam pelo filtro"""
+        update_filter = UpdateFilter()
+
+        assert update_filter.accepts(make_message_update(1))
+        assert update_filter.accepts(make_message_update(2, text="/resumo ano"))
+        assert update_filter.stats()["accepted"] == 2
+
+    def test_unhandled_update_types_are_dropped(self):
+        """Testar descarte de tipos de update sem handler"""
+        update_filter = UpdateFilter()
+        edited = make_message_update(1)
+        edited["edited_message"] = edited.pop("message")
+        channel_post = make_message_update(2)
+        channel_post["channel_post"] = channel_post.pop("message")
+
+        assert not update_filter.accepts(edited)
+        assert not update_filter.accepts(channel_post)
+        assert not update_filter.accepts({"update_id": 3})
+
+        dropped = update_filter.stats()["dropped"]
+        assert dropped == {"edited_message": 1, "channel_post": 1, "empty": 1}
+
+    def test_non_text_messages_are_dropped(self):
+        """Testar descarte de stickers, fotos e mensagens de bots"""
+        update_filter = UpdateFilter()
+        sticker = make_message_update(1)
+        del sticker["message"]["text"]
+        sticker["message"]["sticker"] = {"file_id": "abc"}
+        from_bot = make_message_update(2)
+        from_bot["message"]["from"]["is_bot"] = True
+
+        assert not update_filter.accepts(sticker)
+        assert not update_filter.accepts(from_bot)
+        assert update_filter.stats()["dropped"] == {"non_text": 1, "from_bot": 1}
+
+
+class TestAdmissionController:
+    """Testes do controle de admissão e descarte de carga"""
+
+    def test_invalid_policy_is_rejected(self):
+        """Testar validação da política de descarte"""
+        with pytest.raises(ValueError):
+            AdmissionController(policy="ignorar")
+
+    @pytest.mark.asyncio
+    async def test_sheds_when_inflight_limit_is_reached(self):
+        """Testar descarte após o tempo máximo de espera"""
+        from services.metrics_service import metrics_service
+
+        admission = AdmissionController(max_inflight=1, max_queue_wait=0.01, policy="retry")
+        shed_before = metrics_service.get_counter("admission_shed_total", policy="retry")
+
+        assert await admission.acquire()
+        assert not await admission.acquire()
+
+        stats = admission.stats()
+        assert stats["inflight"] == 1
+        assert stats["shed"] == 1
+        assert stats["policy"] == "retry"
+        assert metrics_service.get_counter("admission_shed_total", policy="retry") == shed_before + 1
+
+        admission.release()
+        assert await admission.acquire()
+        admission.release()
+
+    @pytest.mark.asyncio
+    async def test_waiting_update_is_admitted_when_slot_frees(self):
+        """Testar admissão de update que espera dentro do prazo"""
+        admission = AdmissionController(max_inflight=1, max_queue_wait=1.0)
+        assert await admission.acquire()
+
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0.01)
+        assert admission.stats()["waiting"] == 1
+
+        admission.release()
+        assert await waiter
+        admission.release()
+
+    @pytest.mark.asyncio
+    async def test_deferred_waiters_are_capped(self):
+        """Testar limite de updates adiados aguardando vaga"""
+        admission = AdmissionController(max_inflight=1, max_deferred=1, policy="defer")
+        assert await admission.acquire()
+
+        assert admission.can_defer()
+        waiter = asyncio.create_task(admission.acquire_deferred())
+        await asyncio.sleep(0)
+        assert not admission.can_defer()
+
+        admission.release()
+        await waiter
+        assert admission.can_defer()
+        admission.release()
+
+    @pytest.mark.asyncio
+    async def test_exhausted_wait_budget_sheds_immediately(self):
+        """Testar que updates que já esperaram demais na fila não aguardam de novo"""
+        admission = AdmissionController(max_inflight=1, max_queue_wait=5.0)
+        assert await admission.acquire()
+
+        assert not await asyncio.wait_for(admission.acquire(timeout=-1.0), timeout=0.1)
+        admission.release()
@@ -2,15 +2,21 @@
 Testes de integração para funcionalidades financeiras
 """
 
+import asyncio
 import pytest
+import pytest_asyncio
 from datetime import date
 from decimal import Decimal
 from unittest.mock import AsyncMock, MagicMock, patch
 
+from sqlalchemy import select
+
 from models.schemas import InterpretedTransaction, ExpenseCategory, InsightsPeriod, FinancialInsights
 from services.openai_service import OpenAIService
 from services.sheets_service import GoogleSheetsService
 from bot.telegram_bot import TelegramFinanceBot
+from services.interpretation_batcher import InterpretationBatcher, BatchItemError
+from database.models import Base, AIPromptCache
 
 
 class TestInvestmentMessageProcessing:
@@ -409,6 +415,923 @@ class TestEnhancedSummaryCommand:
         assert period_value is None
 
 
+class TestBackgroundSheetsSetup:
+    """Testes do setup da planilha em segundo plano"""
+
+    @pytest.fixture
+    def sheets_service(self):
+        """Fixture para Google Sheets Service"""
+        return GoogleSheetsService()
+
+    @pytest.mark.asyncio
+    async def test_transactions_deferred_while_setup_runs(self, sheets_service):
+        """Testar que transações ficam pendentes durante o setup e são enviadas ao final"""
+        release_setup = asyncio.Event()
+
+        async def slow_structure():
+            await release_setup.wait()
+
+        sheets_service.connect = AsyncMock()
+        sheets_service.ensure_sheet_structure = AsyncMock(side_effect=slow_structure)
+        sheets_service._load_pending_transactions = AsyncMock()
+        sheets_service._append_pending_batch = AsyncMock()
+
+        sheets_service.start_background_setup()
+        await asyncio.sleep(0)
+
+        transaction = InterpretedTransaction(
+            descricao="Padaria",
+            valor=Decimal("12.00"),
+            categoria=ExpenseCategory.ALIMENTACAO,
+            data=date.today()
+        )
+        row_number = await sheets_service.add_transaction(transaction, transaction_id=42)
+
+        assert row_number is None
+        assert sheets_service.setup_in_progress
+        assert sheets_service.startup_status()["pending_transactions"] == 1
+
+        release_setup.set()
+        await sheets_service._setup_task
+
+        sheets_service._append_pending_batch.assert_awaited_once_with({42})
+        status = sheets_service.startup_status()
+        assert status["state"] == "ready"
+        assert status["pending_transactions"] == 0
+
+    @pytest.mark.asyncio
+    async def test_setup_retries_after_failure(self, sheets_service, monkeypatch):
+        """Testar nova tentativa com backoff quando o setup falha"""
+        monkeypatch.setattr(sheets_service.settings, "sheets_setup_retry_seconds", 0)
+        sheets_service.connect = AsyncMock(side_effect=[Exception("quota"), None])
+        sheets_service.ensure_sheet_structure = AsyncMock()
+        sheets_service._load_pending_transactions = AsyncMock()
+
+        sheets_service.start_background_setup()
+        await sheets_service._setup_task
+
+        status = sheets_service.startup_status()
+        assert status["attempts"] == 2
+        assert status["state"] == "ready"
+        assert status["last_error"] is None
+
+    @pytest.mark.asyncio
+    async def test_unsent_transactions_recovered_and_row_written_by_writer(self, sheets_service, temp_db_session):
+        """Testar que transações sem linha voltam do banco e a linha é gravada pela fila de escrita"""
+        from database.models import Transaction
+        from services.transaction_writer import TransactionWriter
+
+        async for db in temp_db_session():
+            for message_id, row_number in ((1, None), (2, 5), (3, None)):
+                db.add(Transaction(
+                    original_message="teste", descricao=f"Teste {message_id}", valor=Decimal("10.00"), categoria="Casa",
+                    data_transacao=date(2025, 6, 1), user_id=1, message_id=message_id, chat_id=1,
+                    status="processed", sheets_row_number=row_number
+                ))
+            await db.commit()
+
+        worksheet = MagicMock()
+        # a transação 3 já estava na planilha, na linha 2
+        worksheet.get_all_values.return_value = [["ID", "Data"], ["3", "01/06/2025"]]
+        worksheet.append_rows.return_value = {"updates": {"updatedRange": "Junho!A3:F3"}}
+        sheets_service.spreadsheet = MagicMock()
+        sheets_service.spreadsheet.worksheet.return_value = worksheet
+        sheets_service._update_summary = AsyncMock()
+        writer = TransactionWriter(max_batch_size=32, max_delay_ms=10)
+
+        with patch("database.sqlite_db.get_db_session", temp_db_session), \
+             patch("services.transaction_writer.get_db_session", temp_db_session), \
+             patch("services.transaction_writer.transaction_writer", writer):
+            await sheets_service._load_pending_transactions()
+            assert sheets_service._pending_transaction_ids == {1, 3}
+
+            await sheets_service._flush_pending_transactions()
+            await writer.stop()
+
+        assert [row[0] for row in worksheet.append_rows.call_args.args[0]] == [1]
+        assert writer.intents == 2
+        async for db in temp_db_session():
+            rows = (await db.execute(select(Transaction.message_id, Transaction.sheets_row_number))).all()
+        assert sorted(rows) == [(1, 3), (2, 5), (3, 2)]
+
+    @pytest.mark.asyncio
+    async def test_pending_retries_are_capped(self, sheets_service, monkeypatch):
+        """Testar backoff entre falhas e desistência ao atingir o limite de tentativas"""
+        monkeypatch.setattr(sheets_service.settings, "sheets_pending_max_attempts", 3)
+        sleeps = []
+
+        async def fake_sleep(seconds):
+            sleeps.append(seconds)
+
+        sheets_service._pending_transaction_ids = {42}
+        sheets_service._append_pending_batch = AsyncMock(side_effect=Exception("quota"))
+
+        with patch("services.sheets_service.asyncio.sleep", fake_sleep):
+            await sheets_service._flush_pending_transactions()
+
+        assert sheets_service._append_pending_batch.await_count == 3
+        assert sheets_service.startup_status()["pending_transactions"] == 0
+        base = sheets_service.settings.sheets_setup_retry_seconds
+        assert sleeps == [base, base * 2]
+
+    @pytest.mark.asyncio
+    async def test_blocking_sheet_calls_do_not_block_event_loop(self, sheets_service):
+        """Testar que chamadas síncronas do gspread rodam fora do event loop"""
+        import time
+
+        titles = ["Resumo", "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+                  "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+
+        def slow_worksheets():
+            time.sleep(0.2)
+            return [MagicMock(title=title) for title in titles]
+
+        sheets_service.spreadsheet = MagicMock()
+        sheets_service.spreadsheet.worksheets = MagicMock(side_effect=slow_worksheets)
+        sheets_service._check_if_sync_needed = AsyncMock(return_value=False)
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        result = await sheets_service.ensure_sheet_structure()
+        ticking.cancel()
+
+        assert result["missing_sheets"] == []
+        assert ticks >= 5
+
+    def test_first_updated_row(self):
+        """Testar extração da linha inicial da resposta de append_rows"""
+        response = {"updates": {"updatedRange": "'Março'!A15:F17"}}
+
+        assert GoogleSheetsService._first_updated_row(response) == 15
+        assert GoogleSheetsService._first_updated_row({}) is None
+
+
+class TestInterpretationBatching:
+    """Testes do agrupamento de interpretações em lote"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_messages_share_one_call(self):
+        """Testar que mensagens simultâneas viram um único lote"""
+        calls = []
+
+        async def execute(messages):
+            calls.append(list(messages))
+            return [f"resposta {message}" if message != "ruim" else None for message in messages]
+
+        batcher = InterpretationBatcher(execute, window_seconds=0.01, max_batch_size=8)
+        results = await asyncio.gather(
+            batcher.submit("a"), batcher.submit("b"), batcher.submit("ruim"),
+            return_exceptions=True
+        )
+
+        assert calls == [["a", "b", "ruim"]]
+        assert results[:2] == ["resposta a", "resposta b"]
+        assert isinstance(results[2], BatchItemError)
+
+    @pytest.mark.asyncio
+    async def test_batch_flushed_when_full(self):
+        """Testar envio imediato ao atingir o tamanho máximo"""
+        calls = []
+
+        async def execute(messages):
+            calls.append(len(messages))
+            return list(messages)
+
+        batcher = InterpretationBatcher(execute, window_seconds=10, max_batch_size=2)
+        results = await asyncio.wait_for(asyncio.gather(batcher.submit("a"), batcher.submit("b")), timeout=1)
+
+        assert results == ["a", "b"]
+        assert calls == [2]
+
+    @pytest.mark.asyncio
+    async def test_invalid_item_retried_alone(self):
+        """Testar que item inválido no lote é reprocessado individualmente"""
+        service = OpenAIService()
+        service.batcher = InterpretationBatcher(service._interpret_batch, window_seconds=0.01, max_batch_size=8)
+        service._get_cached_result = AsyncMock(return_value=None)
+        service._save_to_cache = AsyncMock()
+        service._try_local_parser = MagicMock(return_value=None)
+
+        batch_response = MagicMock()
+        batch_response.choices[0].message.content = (
+            '[{"indice": 1, "descricao": "Blusa", "valor": 100.0, "categoria": "Outros", "data": "2025-08-01", "confianca": 0.8},'
+            ' {"indice": 2, "descricao": "Investimento", "categoria": "Finanças"}]'
+        )
+        single_response = MagicMock()
+        single_response.choices[0].message.content = (
+            '{"descricao": "Investimento", "valor": 1000.0, "categoria": "Finanças", "data": "2025-10-31", "confianca": 0.9}'
+        )
+
+        with patch.object(service.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = [batch_response, single_response]
+
+            blusa, investimento = await asyncio.gather(
+                service.interpret_financial_message("comprei uma blusa em agosto de 100 reais"),
+                service.interpret_financial_message("investi 1000 reais")
+            )
+
+        assert mock_create.await_count == 2
+        assert blusa.descricao == "Blusa"
+        assert investimento.valor == Decimal("1000.0")
+        assert investimento.categoria == ExpenseCategory.FINANCAS
+
+
+class TestSingleFlight:
+    """Testes do compartilhamento de requisições idênticas em andamento"""
+
+    @pytest.mark.asyncio
+    async def test_identical_messages_share_one_call(self):
+        """Testar que mensagens idênticas simultâneas fazem uma única chamada"""
+        service = OpenAIService()
+        service._get_cached_result = AsyncMock(return_value=None)
+        service._save_to_cache = AsyncMock()
+        service._try_local_parser = MagicMock(return_value=None)
+
+        release = asyncio.Event()
+        response = MagicMock()
+        response.choices[0].message.content = (
+            '{"descricao": "Blusa", "valor": 100.0, "categoria": "Outros", "data": "2025-08-01", "confianca": 0.8}'
+        )
+
+        async def slow_create(**kwargs):
+            await release.wait()
+            return response
+
+        with patch.object(service.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = slow_create
+
+            pending = [
+                asyncio.create_task(service.interpret_financial_message("comprei uma blusa 100 reais")),
+                asyncio.create_task(service.interpret_financial_message("Comprei uma blusa  100 reais"))
+            ]
+            await asyncio.sleep(0.01)
+            release.set()
+            first, second = await asyncio.gather(*pending)
+
+        assert mock_create.await_count == 1
+        service._save_to_cache.assert_awaited_once()
+        assert first == second
+        assert service._inflight == {}
+
+    @pytest.mark.asyncio
+    async def test_identical_insights_share_one_call(self):
+        """Testar que pedidos de insights idênticos compartilham a chamada"""
+        service = OpenAIService()
+        transactions = [{'descricao': 'Mercado', 'valor': 100.0, 'categoria': 'Alimentação', 'data': '2025-10-01'}]
+        response = MagicMock()
+        response.choices[0].message.content = "📊 Gastos concentrados em alimentação."
+
+        with patch.object(service.client.chat.completions, 'create', new_callable=AsyncMock) as mock_create:
+            mock_create.return_value = response
+
+            results = await asyncio.gather(*[
+                service.generate_financial_insights(transactions, InsightsPeriod.MONTHLY, "Outubro 2025")
+                for _ in range(3)
+            ])
+
+        assert mock_create.await_count == 1
+        assert all(result.insights_text == results[0].insights_text for result in results)
+
+    @pytest.mark.asyncio
+    async def test_failure_propagates_to_all_waiters(self):
+        """Testar que o erro da requisição compartilhada chega a todos"""
+        service = OpenAIService()
+        release = asyncio.Event()
+
+        async def failing():
+            await release.wait()
+            raise RuntimeError("API indisponível")
+
+        waiters = [asyncio.create_task(service._single_flight("chave", "interpret", failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert service._inflight == {}
+
+
+@pytest_asyncio.fixture
+async def temp_db_session(tmp_path):
+    """Fábrica de sessões em um banco SQLite temporário"""
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'teste.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_session():
+        async with session_factory() as session:
+            yield session
+
+    yield get_session
+    await engine.dispose()
+
+
+class TestAICacheMaintenance:
+    """Testes da manutenção do cache de interpretações"""
+
+    @pytest.mark.asyncio
+    async def test_expired_entry_is_replaced(self, temp_db_session):
+        """Testar que salvar de novo uma chave expirada atualiza a entrada"""
+        service = OpenAIService()
+
+        with patch("services.openai_service.get_db_session", temp_db_session):
+            await service._store_cache("chave", "uber 15", '{"valor": 15}', ttl_days=-1)
+            await service._store_cache("chave", "uber 15", '{"valor": 16}', ttl_days=7)
+            service.memory_cache.clear()
+
+            assert await service._lookup_cache("chave") == '{"valor": 16}'
+
+    @pytest.mark.asyncio
+    async def test_eviction_removes_expired_and_least_recent(self, temp_db_session, monkeypatch):
+        """Testar remoção de expiradas e das menos usadas acima do limite"""
+        service = OpenAIService()
+        monkeypatch.setattr(service.settings, "ai_cache_max_rows", 2)
+
+        with patch("services.openai_service.get_db_session", temp_db_session):
+            await service._store_cache("expirada", "a", "{}", ttl_days=-1)
+            for key in ("antiga", "popular", "nova"):
+                await service._store_cache(key, key, "{}", ttl_days=7)
+
+            service._record_hit("popular")
+            service._record_hit("nova")
+            service._record_hit("nova")
+
+            removed = await service.run_cache_maintenance()
+
+            async for db in temp_db_session():
+                rows = (await db.execute(select(AIPromptCache.input_hash, AIPromptCache.hit_count))).all()
+
+        assert removed == {"expired": 1, "size": 1}
+        assert dict(rows) == {"popular": 1, "nova": 2}
+
+    @pytest.mark.asyncio
+    async def test_filter_rebuild_keeps_serving_known_keys(self, temp_db_session):
+        """Testar que a reconstrução do filtro não esconde chaves existentes nem perde as novas"""
+        service = OpenAIService()
+        scanning = asyncio.Event()
+        release = asyncio.Event()
+
+        async def paused_session():
+            async for db in temp_db_session():
+                scanning.set()
+                await release.wait()
+                yield db
+
+        with patch("services.openai_service.get_db_session", temp_db_session):
+            await service._store_cache("antiga", "antiga", "{}", ttl_days=7)
+            await service.warm_cache_filter()
+
+        with patch("services.openai_service.get_db_session", paused_session):
+            rebuild = asyncio.create_task(service.warm_cache_filter())
+            await scanning.wait()
+            assert "antiga" in service.known_keys
+
+            # gravação que não chega ao banco: só os filtros conhecem a chave
+            with patch("services.openai_service.get_db_session", side_effect=Exception("banco ocupado")):
+                await service._store_cache("durante", "durante", "{}", ttl_days=7)
+
+            release.set()
+            await rebuild
+
+        assert service._known_keys_ready
+        assert "antiga" in service.known_keys
+        assert "durante" in service.known_keys
+
+
+class TestInsightsCache:
+    """Testes do cache de insights por impressão digital do período"""
+
+    @staticmethod
+    def _transaction(valor, message_id):
+        from database.models import Transaction
+        return Transaction(
+            original_message="teste", descricao="Teste", valor=Decimal(valor), categoria="Alimentação",
+            data_transacao=date.today(), user_id=1, message_id=message_id, chat_id=1, status="processed"
+        )
+
+    @staticmethod
+    def _insights():
+        return FinancialInsights(
+            period_type=InsightsPeriod.MONTHLY, period_description="Outubro 2025",
+            total_expenses=Decimal("50.00"), total_investments=Decimal("0"),
+            category_breakdown={"Alimentação": Decimal("50.00")}, top_category="Alimentação",
+            insights_text="Gastos concentrados em alimentação", recommendations=["Planeje as compras"]
+        )
+
+    @pytest.mark.asyncio
+    async def test_cached_insights_follow_data_changes(self, temp_db_session):
+        """Testar que o cache só responde enquanto os dados do período não mudam"""
+        from services.database_service import database_service
+        from services.insights_cache_service import InsightsCacheService
+
+        cache = InsightsCacheService()
+
+        with patch("services.database_service.get_db_session", temp_db_session), \
+             patch("services.insights_cache_service.get_db_session", temp_db_session):
+            async for db in temp_db_session():
+                db.add(self._transaction("50.00", 1))
+                await db.commit()
+
+            period_key, fingerprint = await database_service.get_period_fingerprint("monthly")
+            await cache.save("monthly", period_key, fingerprint, self._insights(), "gpt-4o-mini")
+
+            cached = await cache.get("monthly", period_key, fingerprint)
+            assert cached == self._insights()
+
+            async for db in temp_db_session():
+                db.add(self._transaction("10.00", 2))
+                await db.commit()
+
+            _, new_fingerprint = await database_service.get_period_fingerprint("monthly")
+            assert new_fingerprint != fingerprint
+            assert await cache.get("monthly", period_key, new_fingerprint) is None
+
+    @pytest.mark.asyncio
+    async def test_insights_command_skips_ai_on_cache_hit(self):
+        """Testar que /insights reaproveita o resultado sem consultar a IA"""
+        bot = TelegramFinanceBot()
+        update = MagicMock()
+        update.message.reply_text = AsyncMock(return_value=MagicMock(edit_text=AsyncMock()))
+        context = MagicMock(args=[])
+        context.bot.send_chat_action = AsyncMock()
+
+        with patch("bot.telegram_bot.database_service.get_period_fingerprint",
+                   AsyncMock(return_value=("2025-10", "abc"))), \
+             patch("bot.telegram_bot.insights_cache_service.get", AsyncMock(return_value=self._insights())), \
+             patch("bot.telegram_bot.openai_service.generate_financial_insights", AsyncMock()) as generate:
+            await bot.cmd_insights(update, context)
+
+        generate.assert_not_called()
+
+
+class TestStreamingInsights:
+    """Testes da entrega progressiva de insights"""
+
+    @staticmethod
+    def _chunk(content=None, usage=None):
+        chunk = MagicMock(usage=usage)
+        chunk.choices = [MagicMock()] if content is not None else []
+        if content is not None:
+            chunk.choices[0].delta.content = content
+        return chunk
+
+    @pytest.mark.asyncio
+    async def test_streamed_insights_report_progress(self):
+        """Testar que o texto parcial é repassado e o final é limpo"""
+        service = OpenAIService()
+        chunks = [self._chunk("**Resumo**: gastos "), self._chunk("de R$ 50,00"), self._chunk(usage=MagicMock())]
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+
+        progress = []
+
+        async def on_progress(text):
+            progress.append(text)
+
+        transactions = [{"descricao": "Mercado", "valor": 50.0, "categoria": "Alimentação", "data": "2025-10-15"}]
+        with patch.object(service.client.chat.completions, "create", new=AsyncMock(return_value=stream())) as mock_create:
+            insights = await service.generate_financial_insights(
+                transactions, InsightsPeriod.MONTHLY, "Outubro 2025", on_progress=on_progress
+            )
+
+        assert mock_create.call_args.kwargs["stream"] is True
+        assert progress == ["**Resumo**: gastos ", "**Resumo**: gastos de R$ 50,00"]
+        assert insights.insights_text == "Resumo: gastos de R$ 50,00"
+
+    @pytest.mark.asyncio
+    async def test_stream_failure_is_retried_by_guard(self):
+        """Testar que falha no meio do stream é repetida e contada pelo circuit breaker"""
+        import httpx
+        import openai
+
+        service = OpenAIService()
+        service.llm_guard.retry_base_seconds = 0.001
+        service.llm_guard.breaker.failure_threshold = 2
+
+        async def broken_stream():
+            yield self._chunk("parcial")
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+
+        async def complete_stream():
+            yield self._chunk("completo")
+
+        progress = []
+
+        async def on_progress(text):
+            progress.append(text)
+
+        create = AsyncMock(side_effect=[broken_stream(), complete_stream()])
+        with patch.object(service.client.chat.completions, "create", new=create):
+            text = await service._stream_insights("prompt", "Outubro 2025", on_progress)
+
+        assert text == "completo"
+        assert progress == ["parcial", "completo"]
+        assert create.await_count == 2
+
+        service.llm_guard.max_retries = 0
+        create = AsyncMock(side_effect=lambda **kwargs: broken_stream())
+        with patch.object(service.client.chat.completions, "create", new=create):
+            with pytest.raises(Exception):
+                await service._stream_insights("prompt", "Outubro 2025", on_progress)
+
+        assert service.llm_guard.breaker.consecutive_failures == 1
+
+    @pytest.mark.asyncio
+    async def test_progressive_edits_are_rate_limited(self):
+        """Testar que edições parciais respeitam o intervalo e o texto final sempre é aplicado"""
+        from bot.progressive_message import ProgressiveMessage
+
+        message = MagicMock(edit_text=AsyncMock())
+        progressive = ProgressiveMessage(message, lambda text: f"Insights: {text}", min_interval_seconds=60)
+
+        await progressive.update("a")
+        await progressive.update("ab")
+        assert await progressive.finish("abc")
+
+        assert [call.args[0] for call in message.edit_text.call_args_list] == ["Insights: a ▌", "Insights: abc"]
+
+
+class TestLLMGuard:
+    """Testes dos limites, retentativas e circuit breaker das chamadas à IA"""
+
+    @staticmethod
+    def _rate_limit_error(retry_after="0"):
+        import httpx
+        import openai
+
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        response = httpx.Response(429, headers={"retry-after": retry_after}, request=request)
+        return openai.RateLimitError("limite", response=response, body=None)
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors(self):
+        """Testar nova tentativa após 429 respeitando Retry-After"""
+        from services.llm_guard import LLMGuard
+
+        guard = LLMGuard(retry_base_seconds=0.001)
+        request = AsyncMock(side_effect=[self._rate_limit_error(), "ok"])
+
+        assert await guard.call("interpret", request) == "ok"
+        assert request.await_count == 2
+        assert guard.breaker.state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_circuit_opens_and_fails_fast(self):
+        """Testar que o circuito abre após falhas seguidas e rejeita sem chamar a API"""
+        from services.llm_guard import LLMGuard, CircuitBreaker, LLMUnavailableError
+
+        guard = LLMGuard(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout_seconds=60))
+        request = AsyncMock(side_effect=self._rate_limit_error())
+
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await guard.call("interpret", request)
+
+        with pytest.raises(LLMUnavailableError):
+            await guard.call("interpret", request)
+
+        assert guard.breaker.state == "open"
+        assert request.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_deadline_bounds_slow_calls(self):
+        """Testar que chamadas lentas respeitam o prazo total"""
+        from services.llm_guard import LLMGuard, LLMUnavailableError
+
+        async def slow_request():
+            await asyncio.sleep(1)
+
+        guard = LLMGuard(deadline_seconds=0.05, retry_base_seconds=0.001)
+
+        with pytest.raises(LLMUnavailableError):
+            await guard.call("interpret", slow_request)
+
+    @pytest.mark.asyncio
+    async def test_local_wait_timeout_does_not_count_as_failure(self):
+        """Testar que esgotar o prazo na fila local não conta como falha da API"""
+        from services.llm_guard import LLMGuard, CircuitBreaker, LLMUnavailableError
+
+        release = asyncio.Event()
+
+        async def busy_request():
+            await release.wait()
+            return "ok"
+
+        guard = LLMGuard(max_concurrent=1, deadline_seconds=5, breaker=CircuitBreaker(failure_threshold=1))
+        busy = asyncio.create_task(guard.call("interpret", busy_request))
+        await asyncio.sleep(0)
+        # a próxima chamada espera a vaga ocupada além do seu prazo
+        guard.deadline_seconds = 0.05
+
+        request = AsyncMock(return_value="ok")
+        with pytest.raises(LLMUnavailableError):
+            await guard.call("interpret", request)
+
+        assert request.await_count == 0
+        assert guard.breaker.state == "closed"
+        assert guard.breaker.consecutive_failures == 0
+
+        release.set()
+        assert await busy == "ok"
+        assert guard.stats()["inflight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_interpretation_falls_back_to_local_parser(self):
+        """Testar interpretação local de baixa confiança com o circuito aberto"""
+        service = OpenAIService()
+        service.llm_guard.breaker.failure_threshold = 1
+        service.llm_guard.breaker.record_failure()
+        service._get_cached_result = AsyncMock(return_value=None)
+
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create:
+            result = await service.interpret_financial_message("coisa aleatoria 15")
+
+        mock_create.assert_not_called()
+        assert result.valor == Decimal("15")
+
+
+class TestModelCascade:
+    """Testes da cascata de modelos nas interpretações"""
+
+    @staticmethod
+    def _response(confianca, categoria="Alimentação"):
+        response = MagicMock()
+        response.choices[0].message.content = (
+            f'{{"descricao": "Padaria", "valor": 20.0, "categoria": "{categoria}", '
+            f'"data": "{date.today()}", "confianca": {confianca}}}'
+        )
+        return response
+
+    @pytest.fixture
+    def service(self, monkeypatch):
+        from config.settings import get_settings
+        monkeypatch.setattr(get_settings(), "openai_cascade_model", "gpt-4o-mini")
+        return OpenAIService()
+
+    @pytest.mark.asyncio
+    async def test_confident_cheap_answer_is_kept(self, service, temp_db_session):
+        """Testar que resposta confiante do modelo barato dispensa o modelo principal e é atribuída a ele"""
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create, \
+             patch("services.openai_service.get_db_session", temp_db_session):
+            mock_create.return_value = self._response(0.9)
+            await service._interpret_and_cache("padaria 20")
+
+        assert [call.kwargs["model"] for call in mock_create.call_args_list] == ["gpt-4o-mini"]
+        async for db in temp_db_session():
+            models = (await db.execute(select(AIPromptCache.model_used))).scalars().all()
+        assert models and set(models) == {"gpt-4o-mini"}
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_escalates(self, service):
+        """Testar escalonamento para o modelo principal com confiança baixa"""
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = [self._response(0.4), self._response(0.9)]
+            ai_response, model = await service._request_interpretation("padaria 20")
+
+        assert [call.kwargs["model"] for call in mock_create.call_args_list] == ["gpt-4o-mini", service.model]
+        assert '"confianca": 0.9' in ai_response
+        assert model == service.model
+
+    @pytest.mark.asyncio
+    async def test_unknown_category_escalates(self, service):
+        """Testar escalonamento quando o modelo barato inventa uma categoria"""
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = [self._response(0.95, "Padarias e Afins"), self._response(0.9)]
+            ai_response, _ = await service._request_interpretation("padaria 20")
+
+        assert [call.kwargs["model"] for call in mock_create.call_args_list] == ["gpt-4o-mini", service.model]
+        assert "Alimentação" in ai_response
+
+    @pytest.mark.asyncio
+    async def test_missing_confidence_escalates(self, service):
+        """Testar que resposta do modelo barato sem confiança vai para o modelo principal"""
+        without_confidence = MagicMock()
+        without_confidence.choices[0].message.content = '{"descricao": "Padaria", "valor": "20,00", "categoria": "Alimentação"}'
+        with patch.object(service.client.chat.completions, "create", new_callable=AsyncMock) as mock_create:
+            mock_create.side_effect = [without_confidence, self._response(0.9)]
+            await service._request_interpretation("padaria 20")
+
+        assert [call.kwargs["model"] for call in mock_create.call_args_list] == ["gpt-4o-mini", service.model]
+
+
+class TestYearlySummary:
+    """Testes do resumo anual em consulta única"""
+
+    @pytest.mark.asyncio
+    async def test_single_query_matches_monthly_summaries(self, temp_db_session):
+        """Testar que o resumo anual usa uma sessão e coincide com os resumos mensais"""
+        from database.models import Transaction
+        from services.database_service import database_service
+
+        rows = [
+            ("Padaria", "10.50", "Alimentação", date(2025, 1, 5)),
+            ("Uber", "20.00", "Transporte", date(2025, 1, 31)),
+            ("Caixinha", "100.00", "Finanças", date(2025, 2, 1)),
+            ("Mercado", "89.90", "Alimentação", date(2025, 12, 31)),
+            ("Fora do ano", "999.00", "Outros", date(2026, 1, 1))
+        ]
+        async for db in temp_db_session():
+            for message_id, (descricao, valor, categoria, data_transacao) in enumerate(rows):
+                db.add(Transaction(
+                    original_message=descricao, descricao=descricao, valor=Decimal(valor), categoria=categoria,
+                    data_transacao=data_transacao, user_id=1, message_id=message_id, chat_id=1, status="processed"
+                ))
+            await db.commit()
+
+        sessions = []
+
+        def counting_session():
+            sessions.append(1)
+            return temp_db_session()
+
+        with patch("services.database_service.get_db_session", counting_session):
+            summary = await database_service.get_yearly_summary(2025)
+            yearly_sessions = len(sessions)
+            monthly = [await database_service.get_monthly_summary(month, 2025) for month in range(1, 13)]
+
+        assert yearly_sessions == 1
+        assert summary["dados_mensais"] == [resumo for resumo in monthly if resumo["transacoes"] > 0]
+        assert summary["total_gastos"] == pytest.approx(120.40)
+        assert summary["total_financas"] == 100.0
+        assert summary["total_transacoes"] == 4
+        assert summary["categorias_totais"] == {"Alimentação": 100.4, "Transporte": 20.0}
+
+
+class TestMonthlyRollups:
+    """Testes da tabela de totais mensais mantida a cada gravação"""
+
+    @staticmethod
+    def _transaction(message_id, valor, categoria, data_transacao):
+        from database.models import Transaction
+        return Transaction(
+            original_message="teste", descricao="Teste", valor=Decimal(valor), categoria=categoria,
+            data_transacao=data_transacao, user_id=1, message_id=message_id, chat_id=1, status="processed"
+        )
+
+    @pytest.mark.asyncio
+    async def test_rollups_follow_inserts_updates_and_deletes(self, temp_db_session, monkeypatch):
+        """Testar consistência dos totais e relatórios após inclusões, edições e remoções"""
+        from database.models import Transaction
+        from database.rollups import monthly_rollups
+        from services.database_service import database_service
+
+        monkeypatch.setattr(monthly_rollups, "enabled", True)
+
+        async for db in temp_db_session():
+            db.add_all([
+                self._transaction(1, "10.00", "Alimentação", date(2025, 3, 2)),
+                self._transaction(2, "50.00", "Alimentação", date(2025, 3, 20)),
+                self._transaction(3, "30.00", "Transporte", date(2025, 4, 1)),
+                self._transaction(4, "5.00", "Lazer", date(2025, 4, 9))
+            ])
+            await db.commit()
+
+            largest = await db.get(Transaction, 2)
+            largest.valor = Decimal("20.00")
+            largest.categoria = "Saúde"
+            await db.delete(await db.get(Transaction, 4))
+            await db.commit()
+
+            db.add(self._transaction(5, "3.00", "Alimentação", date(2025, 3, 9)))
+            await db.commit()
+
+            connection = await db.connection()
+            assert await connection.run_sync(monthly_rollups.verify) == []
+
+        with patch("services.database_service.get_db_session", temp_db_session):
+            from_rollups = await database_service.get_yearly_summary(2025)
+            analysis = await database_service.get_category_analysis(2025)
+            monkeypatch.setattr(monthly_rollups, "enabled", False)
+            from_transactions = await database_service.get_yearly_summary(2025)
+
+        assert from_rollups == from_transactions
+        assert from_rollups["categorias_totais"] == {"Alimentação": 13.0, "Saúde": 20.0, "Transporte": 30.0}
+        assert analysis["Alimentação"]["maior_gasto"] == 10.0
+        assert analysis["Alimentação"]["menor_gasto"] == 3.0
+
+    @pytest.mark.asyncio
+    async def test_prepare_rebuilds_empty_table(self, temp_db_session, monkeypatch):
+        """Testar que a tabela vazia é reconstruída a partir do histórico"""
+        from database.models import MonthlyRollup
+        from database.rollups import monthly_rollups
+
+        monkeypatch.setattr(monthly_rollups, "enabled", False)
+
+        async for db in temp_db_session():
+            db.add(self._transaction(1, "12.00", "Casa", date(2025, 5, 5)))
+            await db.commit()
+
+            connection = await db.connection()
+            await connection.run_sync(monthly_rollups.prepare)
+            rows = (await db.execute(select(MonthlyRollup.total, MonthlyRollup.count))).all()
+
+        assert monthly_rollups.enabled
+        assert [(float(total), count) for total, count in rows] == [(12.0, 1)]
+
+
+class TestTransactionWriter:
+    """Testes da escrita agrupada de transações"""
+
+    @staticmethod
+    def _values(message_id, **overrides):
+        values = dict(
+            original_message="teste", descricao="Teste", valor=Decimal("10.00"), categoria="Casa",
+            data_transacao=date(2025, 6, 1), user_id=1, message_id=message_id, chat_id=1, status="processed"
+        )
+        values.update(overrides)
+        return values
+
+    @pytest.mark.asyncio
+    async def test_burst_commits_in_one_batch(self, temp_db_session, monkeypatch):
+        """Testar que escritas simultâneas saem em um commit, com ids próprios e duplicatas resolvidas"""
+        from database.models import Transaction
+        from database.rollups import monthly_rollups
+        from services.transaction_writer import TransactionWriter
+
+        monkeypatch.setattr(monthly_rollups, "enabled", True)
+        writer = TransactionWriter(max_batch_size=32, max_delay_ms=50)
+
+        with patch("services.transaction_writer.get_db_session", temp_db_session):
+            results = await asyncio.gather(
+                *(writer.insert(**self._values(message_id)) for message_id in range(10)),
+                writer.insert(**self._values(3))
+            )
+            await writer.stop()
+
+        assert writer.batches == 1
+        assert len({result.id for result in results[:10]}) == 10
+        assert results[10].duplicate and results[10].id == results[3].id
+        assert all(result.created_at is not None for result in results)
+
+        async for db in temp_db_session():
+            assert len((await db.execute(select(Transaction.id))).all()) == 10
+            connection = await db.connection()
+            assert await connection.run_sync(monthly_rollups.verify) == []
+
+    @pytest.mark.asyncio
+    async def test_failed_intent_does_not_undo_batch(self, temp_db_session):
+        """Testar que a falha de uma escrita fica restrita ao seu savepoint"""
+        from database.models import Transaction
+        from services.transaction_writer import TransactionWriter
+
+        writer = TransactionWriter(max_batch_size=32, max_delay_ms=50)
+
+        with patch("services.transaction_writer.get_db_session", temp_db_session):
+            saved = await writer.insert(**self._values(1))
+            results = await asyncio.gather(
+                writer.insert(**self._values(2)),
+                writer.insert(**self._values(3, descricao=None)),
+                writer.update(saved.id, sheets_row_number=7),
+                writer.update(999, sheets_row_number=8),
+                return_exceptions=True
+            )
+            await writer.stop()
+
+        assert writer.batches == 2
+        assert saved.created_at is not None
+        assert isinstance(results[1], Exception)
+        assert results[2] is True and results[3] is False
+
+        async for db in temp_db_session():
+            rows = (await db.execute(select(Transaction.message_id, Transaction.sheets_row_number))).all()
+        assert sorted(rows) == [(1, 7), (2, None)]
+
+    @pytest.mark.asyncio
+    async def test_crashed_task_fails_pending_writes_and_restarts(self, temp_db_session):
+        """Testar que a queda da tarefa de escrita falha as intenções pendentes e a próxima escrita a reinicia"""
+        from services.transaction_writer import TransactionWriter
+
+        writer = TransactionWriter(max_batch_size=1, max_delay_ms=0)
+        write = writer._write
+        writer._write = AsyncMock(side_effect=RuntimeError("falha inesperada"))
+
+        with patch("services.transaction_writer.get_db_session", temp_db_session):
+            results = await asyncio.wait_for(asyncio.gather(
+                writer.insert(**self._values(1)),
+                writer.insert(**self._values(2)),
+                return_exceptions=True
+            ), timeout=1)
+
+            writer._write = write
+            saved = await asyncio.wait_for(writer.insert(**self._values(3)), timeout=1)
+            await writer.stop()
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert saved.id and not saved.duplicate
+
+
 if __name__ == "__main__":
     print("🧪 Executando testes de integração...")
     
@@ -3,5 +3,8 @@ Utils package - Utility functions and helpers
 """
 
 from .helpers import extract_numbers, format_currency, get_month_name
+from .cache import LRUCache, BloomFilter
+from .normalization import canonicalize_message, extract_amount_template
 
-__all__ = ['extract_numbers', 'format_currency', 'get_month_name']
+__all__ = ['extract_numbers', 'format_currency', 'get_month_name', 'LRUCache', 'BloomFilter',
+           'canonicalize_message', 'extract_amount_template']
@@ -0,0 +1,107 @@
+"""
+Estruturas de cache em memória: LRU com expiração e filtro de Bloom
+"""
+
+import hashlib
+import math
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+
+class LRUCache:
+    """Cache LRU limitado com TTL por entrada"""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 3600):
+        self.max_size = max_size
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._entries: "OrderedDict[str, Tuple[Any, datetime]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Obter valor e marcá-lo como usado recentemente"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at <= datetime.now():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[datetime] = None):
+        """Guardar valor; a expiração nunca passa do TTL do cache"""
+        local_expiry = datetime.now() + self.ttl
+        if expires_at is None or expires_at > local_expiry:
+            expires_at = local_expiry
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: str):
+        """Remover entrada se existir"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Esvaziar cache"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamanho e taxa de acerto"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+class BloomFilter:
+    """Filtro de Bloom: responde 'talvez presente' ou 'certamente ausente'"""
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str):
+        """Adicionar chave"""
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def clear(self):
+        """Esvaziar filtro"""
+        self._bits = bytearray(len(self._bits))
+        self.count = 0
@@ -0,0 +1,139 @@
+"""
+Reparo local de respostas JSON malformadas da IA
+"""
+
+import difflib
+import json
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from utils.normalization import normalize_number, strip_accents
+
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%y")
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """Primeiro objeto JSON balanceado do texto, ignorando prosa e cercas markdown"""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        quote = None
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if quote:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == quote:
+                    quote = None
+            elif char in "\"'":
+                quote = char
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        start = text.find("{", start + 1)
+    return None
+
+
+def load_lenient_json(text: str) -> Optional[Dict[str, Any]]:
+    """Carregar objeto JSON tolerando aspas simples, vírgulas finais e literais Python"""
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None
+
+    attempts = [candidate]
+    fixed = re.sub(r",\s*([}\]])", r"\1", candidate)
+    fixed = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", fixed)))
+    attempts.append(fixed)
+    if '"' not in fixed:
+        attempts.append(fixed.replace("'", '"'))
+    # chaves sem aspas: {descricao: "x"}
+    attempts.append(re.sub(r"([{,]\s*)([A-Za-z_]\w*)\s*:", r'\1"\2":', attempts[-1]))
+
+    for attempt in attempts:
+        try:
+            data = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Valor numérico de números ou textos como 'R$ 1.234,56'"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+
+    match = re.search(r"\d[\d.,]*", value)
+    if not match:
+        return None
+    try:
+        return float(normalize_number(match.group().rstrip(".,")))
+    except ValueError:
+        return None
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Data em formato ISO ou brasileiro"""
+    if not isinstance(value, str):
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def match_category(value: Any, categories: List[str]) -> Optional[str]:
+    """Categoria válida mais parecida, comparando sem acentos nem caixa"""
+    if not isinstance(value, str):
+        return None
+
+    plain = {strip_accents(category).lower(): category for category in categories}
+    wanted = strip_accents(value).strip().lower()
+    if wanted in plain:
+        return plain[wanted]
+
+    close = difflib.get_close_matches(wanted, plain, n=1, cutoff=0.75)
+    return plain[close[0]] if close else None
+
+
+def repair_interpretation(text: str, categories: List[str], today: date) -> Optional[Dict[str, Any]]:
+    """Interpretação normalizada a partir de uma resposta imperfeita; None se faltar o essencial
+
+    Sem data usa hoje; categoria desconhecida fica para o chamador decidir.
+    """
+    data = load_lenient_json(text)
+    if data is None:
+        return None
+
+    descricao = data.get("descricao")
+    valor = parse_amount(data.get("valor"))
+    if not isinstance(descricao, str) or not descricao.strip() or valor is None:
+        return None
+
+    transaction_date = parse_date(data.get("data")) or today
+    confianca = parse_amount(data.get("confianca"))
+
+    repaired = dict(data)
+    repaired.update({
+        "descricao": descricao.strip(),
+        "valor": valor,
+        "categoria": match_category(data.get("categoria"), categories) or data.get("categoria"),
+        "data": transaction_date.strftime("%Y-%m-%d"),
+        "confianca": min(confianca, 1.0) if confianca is not None else 0.8
+    })
+    return repaired
@@ -0,0 +1,81 @@
+"""
+Canonicalização de mensagens para chaves de cache
+"""
+
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Tuple
+
+
+CURRENCY_WORDS = r"\b(?:reais|real|rs|brl|conto|contos|pila|pilas|pilla|pillas)\b"
+
+# 1.500,00 / 1.500 (milhar brasileiro) ou 15,50 / 15.50 / 15
+NUMBER_PATTERN = re.compile(r"\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?|\d+(?:[.,]\d{1,2})?(?!\d)")
+
+AMOUNT_PLACEHOLDER = "{valor}"
+
+DATE_WORDS = re.compile(
+    r"\b(?:hoje|ontem|anteontem|amanha|dia|dias|semana|mes|ano|passad[oa]|retrasad[oa]|"
+    r"segunda|terca|quarta|quinta|sexta|sabado|domingo|"
+    r"janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro|"
+    r"natal|pascoa|carnaval|reveillon)\b"
+)
+
+
+def strip_accents(text: str) -> str:
+    """Remover acentos mantendo as letras base"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def normalize_number(raw: str) -> str:
+    """Converter número em formato brasileiro ou americano para forma canônica"""
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+(?:,\d{1,2})?", raw):
+        raw = raw.replace(".", "")
+    raw = raw.replace(",", ".")
+
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        return raw
+
+    if value == value.to_integral_value():
+        return str(int(value))
+    return f"{value:.2f}".rstrip("0")
+
+
+def canonicalize_message(text: str) -> str:
+    """Normalizar caixa, acentos, espaços, números e moeda de uma mensagem"""
+    text = strip_accents(text.lower())
+    text = text.replace("r$", " ")
+    text = re.sub(r"[^\w\s.,]", " ", text)
+    text = NUMBER_PATTERN.sub(lambda match: f" {normalize_number(match.group())} ", text)
+    text = re.sub(CURRENCY_WORDS, " ", text)
+    # pontuação que sobrou fora de números
+    text = re.sub(r"(?<!\d)[.,]|[.,](?!\d)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def has_date_reference(canonical: str) -> bool:
+    """Mensagem canônica menciona alguma data (hoje, ontem, mês, feriado...)"""
+    return bool(DATE_WORDS.search(canonical))
+
+
+def extract_amount_template(canonical: str) -> Optional[Tuple[str, Decimal]]:
+    """Separar o valor de uma mensagem canônica com um único número
+
+    Retorna o texto com o valor trocado por um marcador e o valor, ou None
+    quando há zero ou vários números, ou quando o número é um dia do mês.
+    """
+    matches = list(re.finditer(r"\d+(?:\.\d+)?", canonical))
+    if len(matches) != 1:
+        return None
+
+    match = matches[0]
+    # "dia 5" é data, não valor
+    if re.search(r"\bdia\s*$", canonical[:match.start()]):
+        return None
+
+    template = canonical[:match.start()] + AMOUNT_PLACEHOLDER + canonical[match.end():]
+    return template, Decimal(match.group())
@@ -0,0 +1,105 @@
+"""
+Datas relativas para entradas do cache de interpretações
+"""
+
+import calendar
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+from utils.normalization import canonicalize_message, has_date_reference, strip_accents
+
+
+MONTH_OR_HOLIDAY = re.compile(
+    r"\b(?:janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro|"
+    r"natal|reveillon)\b"
+)
+
+# feriados com data diferente a cada ano
+MOVABLE_HOLIDAY = re.compile(r"\b(?:pascoa|carnaval)\b")
+
+WEEKDAYS = ("segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo")
+
+WEEKDAY = re.compile(r"\b(" + "|".join(WEEKDAYS) + r")\b")
+
+DAY_OF_MONTH = re.compile(r"\bdia (\d{1,2})\b")
+
+NUMERIC_DATE = re.compile(r"\b\d{1,2}/\d{1,2}(/\d{2,4})?\b")
+
+
+def _shift_month(reference: date, months: int) -> date:
+    """Primeiro dia do mês deslocado"""
+    index = reference.year * 12 + reference.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _clamp_day(year: int, month: int, day: int) -> date:
+    """Data com o dia limitado ao último dia do mês"""
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def _last_weekday(today: date, weekday: int) -> date:
+    """Último dia da semana pedido, contando hoje"""
+    return today - timedelta(days=(today.weekday() - weekday) % 7)
+
+
+def describe_relative_date(message: str, interpreted: date, today: date) -> Optional[Dict[str, Any]]:
+    """Descrever a data interpretada em relação ao dia da interpretação
+
+    Retorna um dos formatos abaixo, ou None quando não é possível classificar:
+    - {"dias": n}: deslocamento em dias (hoje, ontem, semana passada, sem data)
+    - {"mes": m, "dia": d, "anos": n}: mês nomeado ou feriado de data fixa
+    - {"dia": d, "meses": n}: "dia N" do mês corrente
+    - {"dia_semana": d, "semanas": n}: dia da semana nomeado ("sábado passado")
+    - {"fixa": True}: data completa com ano, válida em qualquer dia
+
+    Feriados móveis (carnaval, páscoa) não têm descrição e retornam None.
+    """
+    raw = strip_accents(message.lower())
+    canonical = canonicalize_message(message)
+
+    numeric = NUMERIC_DATE.search(raw)
+    day_of_month = DAY_OF_MONTH.search(canonical)
+    weekday = WEEKDAY.search(canonical)
+    if numeric:
+        if numeric.group(1):
+            return {"fixa": True}
+        spec = {"mes": interpreted.month, "dia": interpreted.day, "anos": interpreted.year - today.year}
+    elif not has_date_reference(canonical):
+        # Sem data na mensagem o prompt manda usar hoje
+        return {"dias": 0}
+    elif MOVABLE_HOLIDAY.search(canonical):
+        return None
+    elif MONTH_OR_HOLIDAY.search(canonical):
+        spec = {"mes": interpreted.month, "dia": interpreted.day, "anos": interpreted.year - today.year}
+    elif day_of_month:
+        months = (interpreted.year - today.year) * 12 + interpreted.month - today.month
+        spec = {"dia": int(day_of_month.group(1)), "meses": months}
+    elif weekday:
+        weekday_index = WEEKDAYS.index(weekday.group(1))
+        # no próprio dia da semana "sábado" pode ser hoje ou a semana anterior
+        if interpreted.weekday() != weekday_index or today.weekday() == weekday_index:
+            return None
+        spec = {"dia_semana": weekday_index, "semanas": (interpreted - _last_weekday(today, weekday_index)).days // 7}
+    else:
+        spec = {"dias": (interpreted - today).days}
+
+    # descrição precisa reproduzir a data original no dia em que foi gerada
+    if resolve_relative_date(spec, today, interpreted) != interpreted:
+        return None
+    return spec
+
+
+def resolve_relative_date(spec: Dict[str, Any], today: date, original: date) -> date:
+    """Reconstruir a data de uma entrada do cache para o dia atual"""
+    if spec.get("fixa"):
+        return original
+    if "dias" in spec:
+        return today + timedelta(days=spec["dias"])
+    if "mes" in spec:
+        return _clamp_day(today.year + spec["anos"], spec["mes"], spec["dia"])
+    if "dia_semana" in spec:
+        return _last_weekday(today, spec["dia_semana"]) + timedelta(weeks=spec["semanas"])
+
+    month = _shift_month(today, spec["meses"])
+    return _clamp_day(month.year, month.month, spec["dia"])